@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 """Script to create point and figure charts at the command line."""
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+import os
+import sys
+
+from pypf.bundle import ChartBundle
 from pypf.chart import PFChart
+from pypf.instrument import CsvSecurity
+from pypf.instrument import DerivedInstrument
 from pypf.instrument import GoogleSecurity
 from pypf.instrument import YahooSecurity
+from pypf.instrument import get_instrument_class
 
 
 def main():
@@ -13,14 +21,39 @@ def main():
     __process_options(options)
 
 
+def __get_box_size(value):
+    """Return a box size: a number, or atr:N to size from the N bar ATR."""
+    if value.startswith('atr:'):
+        if not value[4:].isdigit() or int(value[4:]) == 0:
+            raise ArgumentTypeError('atr period must be a positive integer')
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        raise ArgumentTypeError('invalid box size: ' + value)
+
+
 def __get_option_parser():
     parser = ArgumentParser()
     parser.add_argument("-d", "--debug",
                         action="store_true", dest="debug",
                         help="print debug messages to stderr")
+    parser.add_argument("--profile",
+                        action="store_true", dest="profile",
+                        help="print phase timings and counts to stderr \
+                             [default: False]")
+    parser.add_argument("--log-json",
+                        action="store_true", dest="log_json",
+                        help="log to stderr as JSON lines, including phase \
+                             timings [default: False]")
     parser.add_argument("--force-cache",
                         action="store_true", dest="force_cache",
                         help="force use of cached data [default: False]")
+    parser.add_argument("--archive",
+                        action="store_true", dest="archive",
+                        help="read daily bars from a compressed archive \
+                             of the data, reading only the years a chart \
+                             needs [default: False]")
     parser.add_argument("--force-download",
                         action="store_true", dest="force_download",
                         help="force download of data [default: False]")
@@ -45,11 +78,19 @@ def __get_option_parser():
     subparsers.required = True
     pf_parser = subparsers.add_parser('pf',
                                       help='create point and figure charts')
+    pf_parser.add_argument("--benchmark",
+                           action="store", dest="benchmark",
+                           default=None,
+                           metavar="SYMBOL",
+                           help="chart the relative strength of the symbol \
+                                 to the SYMBOL benchmark [default: None]")
     pf_parser.add_argument("--box-size",
                            action="store", dest="box_size",
-                           type=float, default=.01,
+                           type=__get_box_size, default=.01,
                            metavar="BOX_SIZE",
-                           help="set the %% box size [default: %(default)s]")
+                           help="set the %% box size, or atr:N to size \
+                                 boxes from the N bar average true range \
+                                 [default: %(default)s]")
     pf_parser.add_argument("--dump-meta-data",
                            action="store_true", dest="dump_meta_data",
                            help="print chart meta data to stdout \
@@ -60,13 +101,53 @@ def __get_option_parser():
                            metavar="DURATION",
                            help="set the duration in years for the chart \
                                  [default: %(default)s]")
+    pf_parser.add_argument("--format",
+                           action="store",
+                           dest="format",
+                           choices=['text', 'json', 'svg', 'html'],
+                           default='text',
+                           metavar="FORMAT",
+                           help="specify the output format (text, json, svg \
+                                 or html) [default: %(default)s]")
+    pf_parser.add_argument("--output",
+                           action="store", dest="output",
+                           default=None,
+                           metavar="FILE",
+                           help="write json, svg or html output to FILE \
+                                 [default: stdout]")
+    pf_parser.add_argument("--bundle",
+                           action="store_true", dest="bundle",
+                           help="chart the daily, weekly and monthly \
+                                 intervals together from one load of the \
+                                 data, ignoring --interval [default: False]")
+    pf_parser.add_argument("--replay",
+                           action="store_true", dest="replay",
+                           help="write the chart's signal and status as of \
+                                 every bar as csv instead of the chart \
+                                 [default: False]")
+    pf_parser.add_argument("--data-file",
+                           action="store", dest="data_file",
+                           default=None,
+                           metavar="FILE",
+                           help="read prices from a csv FILE instead of \
+                                 the provider [default: None]")
+    pf_parser.add_argument("--end-date",
+                           action="store", dest="end_date",
+                           default=None,
+                           metavar="DATE",
+                           help="chart the data as of DATE (YYYY-MM-DD) \
+                                 [default: the last bar]")
     pf_parser.add_argument("--interval",
                            action="store",
                            dest="interval",
-                           choices=['d', 'w', 'm'], default='d',
+                           choices=['d', 'w', 'm', '1min', '5min', '15min',
+                                    '30min', '60min'],
+                           default='d',
                            metavar="INTERVAL",
-                           help="specify day (d), week (w), or month (m) \
-                                 interval [default: %(default)s]")
+                           help="specify day (d), week (w), month (m), or \
+                                 for a --data-file with timestamps, minute \
+                                 (1min, 5min, 15min, 30min, 60min) interval \
+                                 [default: %(default)s]")
     pf_parser.add_argument("--method",
                            action="store",
                            dest="method",
@@ -74,6 +155,14 @@ def __get_option_parser():
                            metavar="METHOD",
                            help="specify High/Low (hl) or Close (c) \
                                  [default: %(default)s]")
+    pf_parser.add_argument("--scale-mode",
+                           action="store",
+                           dest="scale_mode",
+                           choices=['percent', 'point'], default='percent',
+                           metavar="SCALE_MODE",
+                           help="use percent boxes or fixed point boxes, \
+                                 where the box size is a number of points \
+                                 [default: %(default)s]")
     pf_parser.add_argument("--reversal",
                            action="store", dest="reversal",
                            type=int, default=3,
@@ -89,6 +178,10 @@ def __get_option_parser():
                            type=int, default=50,
                            metavar="TRUNCATE",
                            help="truncate the chart to fixed number of columns [default: %(default)s]")
+    pf_parser.add_argument("--snapshot",
+                           action="store_true", dest="snapshot",
+                           help="resume the chart from a saved snapshot \
+                                 and save a new one [default: False]")
     pf_parser.add_argument("--style",
                            action="store_true", dest="style",
                            help="use color and style in terminal output \
@@ -104,10 +197,369 @@ def __get_option_parser():
     pf_parser.add_argument("symbol", metavar='SYMBOL',
                            help='the symbol of the security to chart')
 
+    screen_parser = subparsers.add_parser('screen',
+                                          help='screen symbols using point \
+                                                and figure chart state')
+    screen_parser.add_argument("--benchmark",
+                               action="store", dest="benchmark",
+                               default=None,
+                               metavar="SYMBOL",
+                               help="screen the relative strength of each \
+                                     symbol to the SYMBOL benchmark \
+                                     [default: None]")
+    screen_parser.add_argument("--box-size",
+                               action="store", dest="box_size",
+                               type=__get_box_size, default=.01,
+                               metavar="BOX_SIZE",
+                               help="set the %% box size, or atr:N to size \
+                                     boxes from the N bar average true \
+                                     range [default: %(default)s]")
+    screen_parser.add_argument("--duration",
+                               action="store", dest="duration",
+                               type=float, default=1,
+                               metavar="DURATION",
+                               help="set the duration in years for the chart \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--interval",
+                               action="store",
+                               dest="interval",
+                               choices=['d', 'w', 'm'], default='d',
+                               metavar="INTERVAL",
+                               help="specify day (d), week (w), or month (m) \
+                                     interval [default: %(default)s]")
+    screen_parser.add_argument("--method",
+                               action="store",
+                               dest="method",
+                               choices=['hl', 'c'], default='hl',
+                               metavar="METHOD",
+                               help="specify High/Low (hl) or Close (c) \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--scale-mode",
+                               action="store",
+                               dest="scale_mode",
+                               choices=['percent', 'point'], default='percent',
+                               metavar="SCALE_MODE",
+                               help="use percent boxes or fixed point boxes, \
+                                     where the box size is a number of points \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--reversal",
+                               action="store", dest="reversal",
+                               type=int, default=3,
+                               metavar="REVERSAL",
+                               help="set the box reversal \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--signal",
+                               action="store", dest="signal",
+                               choices=['buy', 'sell'], default=None,
+                               metavar="SIGNAL",
+                               help="only show symbols with a buy or sell \
+                                     signal [default: any]")
+    screen_parser.add_argument("--new-signal",
+                               action="store_true", dest="new_signal",
+                               help="only show symbols whose signal changed \
+                                     on the last bar [default: False]")
+    screen_parser.add_argument("--status",
+                               action="store", dest="status",
+                               default=None,
+                               metavar="STATUS",
+                               help="only show symbols with a status such as \
+                                     'bull confirmed' [default: any]")
+    screen_parser.add_argument("--min-move",
+                               action="store", dest="min_move",
+                               type=int, default=0,
+                               metavar="BOXES",
+                               help="only show symbols that moved at least \
+                                     BOXES on the last bar \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--sort",
+                               action="store", dest="sort",
+                               default='symbol',
+                               metavar="FIELD",
+                               help="sort the results by FIELD \
+                                     [default: %(default)s]")
+    screen_parser.add_argument("--reverse",
+                               action="store_true", dest="reverse",
+                               help="sort in descending order \
+                                     [default: False]")
+    screen_parser.add_argument("--workers",
+                               action="store", dest="workers",
+                               type=int, default=None,
+                               metavar="WORKERS",
+                               help="set the number of worker processes \
+                                     [default: number of CPUs]")
+    screen_parser.add_argument("--symbol-file",
+                               action="store", dest="symbol_file",
+                               default=None,
+                               metavar="FILE",
+                               help="read symbols from FILE, one per line")
+    screen_parser.add_argument("symbols", metavar='SYMBOL', nargs='*',
+                               help='the symbols of the securities to screen')
+
+    backtest_parser = subparsers.add_parser('backtest',
+                                            help='backtest point and figure \
+                                                  signals')
+    backtest_parser.add_argument("--box-sizes",
+                                 action="store", dest="box_sizes",
+                                 type=__get_box_size, nargs='+',
+                                 default=[.01],
+                                 metavar="BOX_SIZE",
+                                 help="set the %% box sizes (or atr:N) to \
+                                       test [default: %(default)s]")
+    backtest_parser.add_argument("--reversals",
+                                 action="store", dest="reversals",
+                                 type=int, nargs='+', default=[3],
+                                 metavar="REVERSAL",
+                                 help="set the box reversals to test \
+                                       [default: %(default)s]")
+    backtest_parser.add_argument("--duration",
+                                 action="store", dest="duration",
+                                 type=float, default=1,
+                                 metavar="DURATION",
+                                 help="set the duration in years to test \
+                                       [default: %(default)s]")
+    backtest_parser.add_argument("--interval",
+                                 action="store",
+                                 dest="interval",
+                                 choices=['d', 'w', 'm'], default='d',
+                                 metavar="INTERVAL",
+                                 help="specify day (d), week (w), or month \
+                                       (m) interval [default: %(default)s]")
+    backtest_parser.add_argument("--method",
+                                 action="store",
+                                 dest="method",
+                                 choices=['hl', 'c'], default='hl',
+                                 metavar="METHOD",
+                                 help="specify High/Low (hl) or Close (c) \
+                                       [default: %(default)s]")
+    backtest_parser.add_argument("--scale-mode",
+                                 action="store",
+                                 dest="scale_mode",
+                                 choices=['percent', 'point'],
+                                 default='percent',
+                                 metavar="SCALE_MODE",
+                                 help="use percent boxes or fixed point \
+                                       boxes, where the box size is a number \
+                                       of points [default: %(default)s]")
+    backtest_parser.add_argument("--slippage",
+                                 action="store", dest="slippage",
+                                 type=float, default=0,
+                                 metavar="FRACTION",
+                                 help="set the slippage on each fill \
+                                       [default: %(default)s]")
+    backtest_parser.add_argument("--commission",
+                                 action="store", dest="commission",
+                                 type=float, default=0,
+                                 metavar="FRACTION",
+                                 help="set the commission on each side \
+                                       [default: %(default)s]")
+    backtest_parser.add_argument("--workers",
+                                 action="store", dest="workers",
+                                 type=int, default=None,
+                                 metavar="WORKERS",
+                                 help="set the number of worker processes \
+                                       [default: number of CPUs]")
+    backtest_parser.add_argument("--symbol-file",
+                                 action="store", dest="symbol_file",
+                                 default=None,
+                                 metavar="FILE",
+                                 help="read symbols from FILE, one per line")
+    backtest_parser.add_argument("symbols", metavar='SYMBOL', nargs='*',
+                                 help='the symbols of the securities to \
+                                       test')
+
+    serve_parser = subparsers.add_parser('serve',
+                                         help='serve charts over http from \
+                                               warm in-memory caches')
+    serve_parser.add_argument("--host",
+                              action="store", dest="host",
+                              default='127.0.0.1',
+                              metavar="HOST",
+                              help="set the address to listen on \
+                                    [default: %(default)s]")
+    serve_parser.add_argument("--port",
+                              action="store", dest="port",
+                              type=int, default=8080,
+                              metavar="PORT",
+                              help="set the port to listen on \
+                                    [default: %(default)s]")
+    serve_parser.add_argument("--refresh-interval",
+                              action="store", dest="refresh_interval",
+                              type=int, default=60,
+                              metavar="SECONDS",
+                              help="set how often to check for new data \
+                                    [default: %(default)s]")
+    serve_parser.add_argument("--max-charts",
+                              action="store", dest="max_charts",
+                              type=int, default=256,
+                              metavar="CHARTS",
+                              help="set the number of built charts to keep \
+                                    [default: %(default)s]")
+
+    check_parser = subparsers.add_parser('check',
+                                         help='report problems in the \
+                                               cached data of symbols')
+    check_parser.add_argument("--symbol-file",
+                              action="store", dest="symbol_file",
+                              default=None,
+                              metavar="FILE",
+                              help="read symbols from FILE, one per line")
+    check_parser.add_argument("symbols", metavar='SYMBOL', nargs='*',
+                              help='the symbols of the securities to check')
+
     return parser
 
 
 def __process_options(options):
+    if options.log_json:
+        import logging
+        from pypf.log_format import use_json_logging
+        if options.debug:
+            use_json_logging(logging.DEBUG)
+        else:
+            use_json_logging(logging.INFO)
+
+    if options.command == 'screen':
+        __process_screen(options)
+    elif options.command == 'serve':
+        __process_serve(options)
+    elif options.command == 'backtest':
+        __process_backtest(options)
+    elif options.command == 'check':
+        __process_check(options)
+    else:
+        __process_pf(options)
+
+
+def __process_check(options):
+    symbols = list(options.symbols)
+    if options.symbol_file is not None:
+        with open(options.symbol_file) as f:
+            symbols.extend(line.strip() for line in f if line.strip())
+
+    instrument_class = get_instrument_class(options.provider)
+    for symbol in symbols:
+        try:
+            instrument = instrument_class(symbol, options.force_download,
+                                          options.force_cache,
+                                          options.period, options.debug)
+            if instrument.download_required:
+                instrument.populate_data()
+            print(instrument.check_data().summary())
+        except Exception as e:
+            print('%s: unable to check: %r' % (symbol.upper(), e))
+
+
+def __process_backtest(options):
+    from pypf.backtest import run_backtests
+
+    symbols = list(options.symbols)
+    if options.symbol_file is not None:
+        with open(options.symbol_file) as f:
+            symbols.extend(line.strip() for line in f if line.strip())
+
+    parameter_sets = []
+    for box_size in options.box_sizes:
+        for reversal in options.reversals:
+            parameter_sets.append({'box_size': box_size,
+                                   'duration': options.duration,
+                                   'interval': options.interval,
+                                   'method': options.method,
+                                   'reversal': reversal,
+                                   'scale_mode': options.scale_mode})
+
+    results, errors = run_backtests(symbols, parameter_sets,
+                                    options.provider, options.force_download,
+                                    options.force_cache, options.period,
+                                    options.slippage, options.commission,
+                                    options.workers, options.debug,
+                                    options.archive)
+
+    row_format = ('{symbol:<8}{box_size:>6}{reversal:>4}{trades:>7}'
+                  '{total_return:>10}{max_drawdown:>10}{win_rate:>7}'
+                  '{exposure:>7}')
+    print(row_format.format(symbol='symbol', box_size='box', reversal='rev',
+                            trades='trades', total_return='return',
+                            max_drawdown='drawdown', win_rate='win',
+                            exposure='exp'))
+    for row in results:
+        print(row_format.format(symbol=row['symbol'],
+                                box_size=row['box_size'],
+                                reversal=row['reversal'],
+                                trades=row['trades'],
+                                total_return='{:.2%}'.format(
+                                    row['total_return']),
+                                max_drawdown='{:.2%}'.format(
+                                    row['max_drawdown']),
+                                win_rate='{:.0%}'.format(row['win_rate']),
+                                exposure='{:.0%}'.format(row['exposure'])))
+
+
+def __process_serve(options):
+    from pypf.server import ChartServer
+
+    server = ChartServer(options.host, options.port, options.provider,
+                         options.force_download, options.force_cache,
+                         options.period, options.refresh_interval,
+                         options.debug, options.max_charts)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def __process_screen(options):
+    from pypf import screener
+
+    if options.sort not in screener.Screener.FIELDS:
+        raise SystemExit('unknown sort field: ' + options.sort)
+
+    symbols = list(options.symbols)
+    if options.symbol_file is not None:
+        with open(options.symbol_file) as f:
+            symbols.extend(line.strip() for line in f if line.strip())
+
+    filters = []
+    if options.new_signal and options.signal == 'buy':
+        filters.append(screener.new_buy_signal)
+    elif options.new_signal and options.signal == 'sell':
+        filters.append(screener.new_sell_signal)
+    elif options.new_signal:
+        filters.append(screener.new_signal)
+    elif options.signal is not None:
+        filters.append(screener.signal_is(options.signal))
+    if options.status is not None:
+        filters.append(screener.status_is(options.status))
+    if options.min_move > 0:
+        filters.append(screener.min_move(options.min_move))
+
+    s = screener.Screener(symbols, options.provider, options.force_download,
+                          options.force_cache, options.period,
+                          options.box_size, options.duration,
+                          options.interval, options.method, options.reversal,
+                          options.workers, options.debug,
+                          options.benchmark, options.scale_mode,
+                          options.archive)
+    s.run(filters)
+    s.sort(options.sort, options.reverse)
+
+    row_format = ('{symbol:<10}{date:<12}{close:>10} {signal:<5}{new:<4}'
+                  '{status:<16}{direction:<4}{column_index:>6}{move:>5}')
+    print(row_format.format(symbol='symbol', date='date', close='close',
+                            signal='sig', new='new', status='status',
+                            direction='dir', column_index='col',
+                            move='move'))
+    for row in s.results:
+        print(row_format.format(symbol=row['symbol'], date=row['date'],
+                                close=str(row['close']),
+                                signal=row['signal'],
+                                new='*' if row['new_signal'] else '',
+                                status=row['status'],
+                                direction=row['direction'],
+                                column_index=row['column_index'],
+                                move=row['move']))
+
+
+def __process_pf(options):
     debug = options.debug
     interval = options.interval
     force_download = options.force_download
@@ -124,20 +576,133 @@ def __process_options(options):
     indent = options.indent
     truncate = options.truncate
 
-    if options.provider == 'google':
+    # Phases are only timed when profiling, so JSON logs need it too
+    profile = options.profile or options.log_json
+
+    if options.data_file is not None:
+        security = CsvSecurity(symbol, os.path.abspath(options.data_file),
+                               debug=debug, profile=profile)
+    elif options.provider == 'google':
         security = GoogleSecurity(symbol, force_download, force_cache,
-                                  period, debug)
+                                  period, debug, profile=profile)
     else:
         security = YahooSecurity(symbol, force_download, force_cache,
-                                 period, debug)
+                                 period, debug, profile=profile)
+    security.archive = options.archive
+    if options.benchmark is not None:
+        benchmark = get_instrument_class(options.provider)(
+            options.benchmark, force_download, force_cache, period, debug,
+            profile=profile)
+        benchmark.archive = options.archive
+        security = DerivedInstrument([security, benchmark], debug=debug,
+                                     profile=profile)
+    if options.bundle:
+        __process_bundle(options, security)
+        return
+    if options.replay:
+        __process_replay(options, security)
+        return
+
+    # Only the json format shows the columns that are truncated
     chart = PFChart(security, box_size, duration, interval, method,
-                    reversal, style, trend_lines, debug, indent, truncate)
-    chart.create_chart()
-    if options.suppress_chart is False:
-        print(chart.chart)
-    if options.dump_meta_data is True:
-        for day in chart.chart_meta_data:
-            print(chart.chart_meta_data[day])
+                    reversal, style, trend_lines, debug, indent, truncate,
+                    profile, options.scale_mode,
+                    windowed=options.format != 'json',
+                    snapshot=options.snapshot, end_date=options.end_date)
+    if options.format == 'text':
+        chart.create_chart()
+        if options.suppress_chart is False:
+            print(chart.chart)
+        if options.dump_meta_data is True:
+            for day in chart.chart_meta_data:
+                print(chart.chart_meta_data[day])
+    else:
+        from pypf.render import JsonRenderer
+        from pypf.render import get_renderer
+        chart.create_chart(render=False)
+        if options.format == 'json':
+            renderer = JsonRenderer(meta_data=options.dump_meta_data)
+        else:
+            renderer = get_renderer(options.format)
+        if options.output is None:
+            chart.write(sys.stdout, renderer)
+        else:
+            with open(options.output, 'w') as output:
+                chart.write(output, renderer)
+
+    if options.profile:
+        print(security.stats.report(security.__class__.__name__ + ' '
+                                    + security.symbol), file=sys.stderr)
+        print(chart.stats.report('PFChart ' + security.symbol),
+              file=sys.stderr)
+
+
+def __process_bundle(options, security):
+    profile = options.profile or options.log_json
+    bundle = ChartBundle(security, box_size=options.box_size,
+                         duration=options.duration, method=options.method,
+                         reversal=options.reversal, style=options.style,
+                         trend_lines=options.trend_lines,
+                         debug=options.debug, indent=options.indent,
+                         truncate=options.truncate, profile=profile,
+                         scale_mode=options.scale_mode,
+                         windowed=options.format != 'json',
+                         snapshot=options.snapshot,
+                         end_date=options.end_date)
+    if options.format == 'text':
+        bundle.create_charts()
+        if options.suppress_chart is False:
+            for chart in bundle:
+                print(chart.chart)
+        if options.dump_meta_data is True:
+            for chart in bundle:
+                for day in chart.chart_meta_data:
+                    print(chart.chart_meta_data[day])
+    else:
+        from pypf.render import JsonRenderer
+        from pypf.render import get_renderer
+        bundle.create_charts(render=False)
+        if options.format == 'json':
+            renderer = JsonRenderer(meta_data=options.dump_meta_data)
+        else:
+            renderer = get_renderer(options.format)
+        if options.output is None:
+            bundle.write(sys.stdout, renderer)
+        else:
+            with open(options.output, 'w') as output:
+                bundle.write(output, renderer)
+
+    if options.profile:
+        print(security.stats.report(security.__class__.__name__ + ' '
+                                    + security.symbol), file=sys.stderr)
+        print(bundle.stats.report('ChartBundle ' + security.symbol),
+              file=sys.stderr)
+        for interval, chart in bundle.charts.items():
+            print(chart.stats.report('PFChart %s %s' % (security.symbol,
+                                                        interval)),
+                  file=sys.stderr)
+
+
+def __process_replay(options, security):
+    from pypf.replay import ChartReplay
+
+    profile = options.profile or options.log_json
+    replay = ChartReplay(security, options.box_size, options.duration,
+                         options.interval, options.method, options.reversal,
+                         options.debug, profile, options.scale_mode)
+    replay.run()
+    if options.output is None:
+        replay.write(sys.stdout)
+    else:
+        with open(options.output, 'w', newline='') as output:
+            replay.write(output)
+
+    if options.profile:
+        print(security.stats.report(security.__class__.__name__ + ' '
+                                    + security.symbol), file=sys.stderr)
+        print(replay.stats.report('ChartReplay ' + security.symbol),
+              file=sys.stderr)
+
 
 if __name__ == "__main__":
     main()
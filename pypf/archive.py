@@ -0,0 +1,196 @@
+"""Classes to store daily bars compactly, in blocks indexed by year.
+
+A PriceArchive holds an instrument's daily bars in one file. Each year
+is a block of fixed point integers: prices in cents and dates as day
+numbers, each stored as the difference from the one before, which
+zlib compresses to a fraction of the csv text. The index at the start
+of the file gives each block's position, so reading the last few
+hundred bars decompresses only the last block or two.
+"""
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+
+import datetime
+import json
+import os
+import struct
+import sys
+import zlib
+
+
+class PriceArchive(object):
+    """Daily Date,Open,High,Low,Close,Volume bars in year blocks."""
+
+    MAGIC = b'PFA1'
+    VERSION = 1
+    HEADER = struct.Struct('<4sI')
+
+    def __init__(self, path):
+        """Initialize the archive stored at path."""
+        self.path = path
+        self._index = None
+
+    @property
+    def exists(self):
+        """Return True if the archive file exists."""
+        return os.path.isfile(self.path)
+
+    @property
+    def bars(self):
+        """Get the number of bars in the archive."""
+        return sum(block[1] for block in self._get_index()['blocks'])
+
+    @property
+    def source(self):
+        """Get the source signature written with the bars, or None."""
+        index = self._get_index()
+        if index is None:
+            return None
+        return index['source']
+
+    def read(self, bars=None):
+        """Read the bars of the last blocks holding at least bars bars.
+
+        All of the bars are read if bars is None. Returns an OrderedDict
+        of bar dicts keyed by date, as Instrument keeps them.
+        """
+        index = self._get_index()
+        blocks = index['blocks']
+        first = 0
+        if bars is not None:
+            count = 0
+            first = len(blocks)
+            while first > 0 and count < bars:
+                first -= 1
+                count += blocks[first][1]
+
+        data = OrderedDict()
+        with open(self.path, 'rb') as archive_file:
+            for year, count, offset, length, checksum in blocks[first:]:
+                archive_file.seek(index['start'] + offset)
+                self._decode_block(zlib.decompress(archive_file.read(length)),
+                                   count, data)
+        return data
+
+    def write(self, data, source):
+        """Write the bars of an OrderedDict of bar dicts, in date order.
+
+        source is a signature of the files the bars were read from,
+        returned by the source property so a reader can tell whether
+        the archive is out of date. A year whose bars are unchanged is
+        copied from the existing archive rather than compressed again.
+        """
+        old_blocks = {}
+        if self.exists:
+            try:
+                old_blocks = self._read_raw_blocks()
+            except (OSError, ValueError, zlib.error):
+                old_blocks = {}
+
+        years = OrderedDict()
+        for date, bar in data.items():
+            years.setdefault(date[:4], []).append(bar)
+
+        blocks = []
+        payloads = []
+        offset = 0
+        for year, bars in years.items():
+            raw = self._encode_block(bars)
+            checksum = zlib.crc32(raw)
+            old = old_blocks.get(year)
+            if old is not None and old[0] == checksum:
+                payload = old[1]
+            else:
+                payload = zlib.compress(raw, 9)
+            blocks.append([int(year), len(bars), offset, len(payload),
+                           checksum])
+            payloads.append(payload)
+            offset += len(payload)
+
+        index = json.dumps({'version': PriceArchive.VERSION,
+                            'source': source,
+                            'blocks': blocks}).encode()
+        # Write to a temporary file first so a reader never sees a
+        # partial archive
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'wb') as archive_file:
+            archive_file.write(PriceArchive.HEADER.pack(PriceArchive.MAGIC,
+                                                        len(index)))
+            archive_file.write(index)
+            for payload in payloads:
+                archive_file.write(payload)
+        os.replace(temporary_path, self.path)
+        self._index = None
+
+    def _get_index(self):
+        if self._index is not None:
+            return self._index
+        if not self.exists:
+            return None
+        with open(self.path, 'rb') as archive_file:
+            magic, length = PriceArchive.HEADER.unpack(
+                archive_file.read(PriceArchive.HEADER.size))
+            if magic != PriceArchive.MAGIC:
+                raise ValueError(self.path + ' is not a price archive')
+            index = json.loads(archive_file.read(length).decode())
+        if index['version'] != PriceArchive.VERSION:
+            return None
+        index['start'] = PriceArchive.HEADER.size + length
+        self._index = index
+        return index
+
+    def _read_raw_blocks(self):
+        index = self._get_index()
+        if index is None:
+            return {}
+        blocks = {}
+        with open(self.path, 'rb') as archive_file:
+            for year, count, offset, length, checksum in index['blocks']:
+                archive_file.seek(index['start'] + offset)
+                blocks[str(year)] = (checksum, archive_file.read(length))
+        return blocks
+
+    def _encode_block(self, bars):
+        # Dates and closes are differences from the previous bar, and
+        # the open, high and low differences from the bar's close, so
+        # nearly every value is small
+        values = array('q')
+        last_day = 0
+        last_close = 0
+        for bar in bars:
+            date = bar['Date']
+            day = datetime.date(int(date[:4]), int(date[5:7]),
+                                int(date[8:10])).toordinal()
+            close = int(bar['Close'].scaleb(2))
+            values.append(day - last_day)
+            values.append(close - last_close)
+            values.append(int(bar['Open'].scaleb(2)) - close)
+            values.append(int(bar['High'].scaleb(2)) - close)
+            values.append(int(bar['Low'].scaleb(2)) - close)
+            values.append(bar['Volume'])
+            last_day = day
+            last_close = close
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tobytes()
+
+    def _decode_block(self, raw, count, data):
+        values = array('q')
+        values.frombytes(raw)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        day = 0
+        close = 0
+        fromordinal = datetime.date.fromordinal
+        for position in range(0, 6 * count, 6):
+            day += values[position]
+            close += values[position + 1]
+            date = fromordinal(day).isoformat()
+            data[date] = {
+                'Date': date,
+                'Open': Decimal(close + values[position + 2]).scaleb(-2),
+                'High': Decimal(close + values[position + 3]).scaleb(-2),
+                'Low': Decimal(close + values[position + 4]).scaleb(-2),
+                'Close': Decimal(close).scaleb(-2),
+                'Volume': values[position + 5]}
@@ -0,0 +1,267 @@
+"""Classes to backtest point and figure signals over price history.
+
+A position is entered at the close of the bar on which the chart's
+signal changes to buy and exited at the close of the bar on which it
+changes to sell. Slippage moves each fill against the trade and
+commission is charged on each side, both as fractions of the price.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import logging
+import os
+
+from pypf.chart import PFChart
+from pypf.instrument import get_instrument_class
+
+
+class Trade(object):
+    """A single round trip."""
+
+    __slots__ = ('entry_date', 'entry_price', 'exit_date', 'exit_price',
+                 'bars', 'open')
+
+    def __init__(self, entry_date, entry_price):
+        """Open a trade."""
+        self.entry_date = entry_date
+        self.entry_price = entry_price
+        self.exit_date = None
+        self.exit_price = None
+        self.bars = 0
+        self.open = True
+
+    @property
+    def trade_return(self):
+        """Get the return of the trade as a fraction."""
+        return self.exit_price / self.entry_price - 1
+
+    def close(self, exit_date, exit_price):
+        """Close the trade."""
+        self.exit_date = exit_date
+        self.exit_price = exit_price
+        self.open = False
+
+    def as_dict(self):
+        """Return the trade as a dict."""
+        return OrderedDict([('entry_date', self.entry_date),
+                            ('entry_price', self.entry_price),
+                            ('exit_date', self.exit_date),
+                            ('exit_price', self.exit_price),
+                            ('bars', self.bars),
+                            ('return', self.trade_return),
+                            ('open', self.open)])
+
+
+class BacktestResult(object):
+    """The trades, returns and drawdown of one backtest."""
+
+    def __init__(self, trades, equity, dates, exposure):
+        """Initialize the result."""
+        self.trades = trades
+        self.equity = equity
+        self.dates = dates
+        self.exposure = exposure
+
+    @property
+    def total_return(self):
+        """Get the compounded return of all trades as a fraction."""
+        if len(self.equity) == 0:
+            return 0.0
+        return self.equity[-1] - 1
+
+    @property
+    def max_drawdown(self):
+        """Get the largest peak to trough fall in equity as a fraction."""
+        peak = 1.0
+        drawdown = 0.0
+        for value in self.equity:
+            if value > peak:
+                peak = value
+            elif 1 - value / peak > drawdown:
+                drawdown = 1 - value / peak
+        return drawdown
+
+    @property
+    def win_rate(self):
+        """Get the fraction of trades with a positive return."""
+        if len(self.trades) == 0:
+            return 0.0
+        wins = sum(1 for trade in self.trades if trade.trade_return > 0)
+        return wins / len(self.trades)
+
+    def summary(self):
+        """Return the headline numbers as a dict."""
+        return OrderedDict([('trades', len(self.trades)),
+                            ('total_return', self.total_return),
+                            ('max_drawdown', self.max_drawdown),
+                            ('win_rate', self.win_rate),
+                            ('exposure', self.exposure)])
+
+
+class Backtest(object):
+    """Replay chart signals as long-only trades."""
+
+    def __init__(self, slippage=0.0, commission=0.0):
+        """Initialize the backtest.
+
+        slippage and commission are fractions of the fill price, e.g.
+        0.001 for 10 basis points.
+        """
+        self.slippage = slippage
+        self.commission = commission
+
+    @property
+    def commission(self):
+        """Get the commission charged on each side of a trade."""
+        return self._commission
+
+    @commission.setter
+    def commission(self, value):
+        if value < 0:
+            raise ValueError('commission must not be negative.')
+        self._commission = float(value)
+
+    @property
+    def slippage(self):
+        """Get the slippage applied to each fill."""
+        return self._slippage
+
+    @slippage.setter
+    def slippage(self, value):
+        if value < 0:
+            raise ValueError('slippage must not be negative.')
+        self._slippage = float(value)
+
+    def run(self, chart_meta_data):
+        """Backtest the signals in a chart's meta data."""
+        return self._run((meta['date'], meta['close'], meta['signal'])
+                         for meta in chart_meta_data.values())
+
+    def run_chart(self, chart):
+        """Backtest the signals of a PFChart.
+
+        The chart need not be created: its bars are fed through its
+        engine and the signal read after each one, so no meta data is
+        built.
+        """
+        return self._run((day['Date'], day['Close'], engine.signal)
+                         for day, engine in chart.iterate_engine())
+
+    def _run(self, rows):
+        # rows are (date, close, signal) for every bar but the first
+        buy_cost = (1 + self._slippage) * (1 + self._commission)
+        sell_proceeds = (1 - self._slippage) * (1 - self._commission)
+        trades = []
+        equity = []
+        dates = []
+        trade = None
+        cash = 1.0
+        shares = 0.0
+        bars_held = 0
+        signal = None
+
+        for date, close, bar_signal in rows:
+            close = float(close)
+            if bar_signal != signal:
+                signal = bar_signal
+                if signal == 'buy' and trade is None:
+                    price = close * buy_cost
+                    shares = cash / price
+                    cash = 0.0
+                    trade = Trade(date, price)
+                elif signal == 'sell' and trade is not None:
+                    price = close * sell_proceeds
+                    cash = shares * price
+                    shares = 0.0
+                    trade.close(date, price)
+                    trades.append(trade)
+                    trade = None
+            if trade is not None:
+                trade.bars += 1
+                bars_held += 1
+            equity.append(cash + shares * close)
+            dates.append(date)
+
+        if trade is not None:
+            # Mark the open trade to the last close
+            trade.exit_date = dates[-1]
+            trade.exit_price = equity[-1] / shares
+            trades.append(trade)
+
+        exposure = bars_held / len(equity) if len(equity) > 0 else 0.0
+        return BacktestResult(trades, equity, dates, exposure)
+
+
+def _backtest_symbol(task):
+    """Backtest every parameter set for one symbol in a worker process.
+
+    The instrument is loaded once and shared by all of the charts, and
+    only the charts' engines are run.
+    """
+    symbol, instrument_options, parameter_sets, backtest_options = task
+    rows = []
+    try:
+        instrument_class = get_instrument_class(
+            instrument_options['provider'])
+        instrument = instrument_class(symbol,
+                                      instrument_options['force_download'],
+                                      instrument_options['force_cache'],
+                                      instrument_options['period'],
+                                      instrument_options['debug'])
+        instrument.archive = instrument_options['archive']
+        instrument.populate_data()
+        backtest = Backtest(**backtest_options)
+        for parameters in parameter_sets:
+            chart = PFChart(instrument, **parameters)
+            row = OrderedDict([('symbol', instrument.symbol)])
+            row.update(parameters)
+            row.update(backtest.run_chart(chart).summary())
+            rows.append(row)
+    except Exception as e:
+        return symbol, rows, repr(e)
+    return symbol, rows, None
+
+
+def run_backtests(symbols, parameter_sets, provider='yahoo',
+                  force_download=False, force_cache=False, period=10,
+                  slippage=0.0, commission=0.0, workers=None, debug=False,
+                  archive=False):
+    """Backtest each parameter set on each symbol in parallel.
+
+    parameter_sets is a list of dicts of PFChart keyword arguments
+    (box_size, duration, interval, method, reversal, scale_mode). If
+    archive is True the daily bars are read from the instruments'
+    archives, as pf.py --archive does. Returns a list of
+    summary rows, one per symbol and parameter set, sorted by total
+    return, and a dict of symbols that could not be tested.
+    """
+    log = logging.getLogger('Backtest')
+    instrument_options = {'provider': provider,
+                          'force_download': force_download,
+                          'force_cache': force_cache,
+                          'period': period,
+                          'debug': debug,
+                          'archive': archive}
+    backtest_options = {'slippage': slippage, 'commission': commission}
+    tasks = [(symbol, instrument_options, parameter_sets, backtest_options)
+             for symbol in symbols]
+
+    if workers == 1:
+        outcomes = list(map(_backtest_symbol, tasks))
+    else:
+        chunksize = max(1, len(tasks)
+                        // ((workers or os.cpu_count() or 1) * 8))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(_backtest_symbol, tasks,
+                                         chunksize=chunksize))
+
+    results = []
+    errors = OrderedDict()
+    for symbol, rows, error in outcomes:
+        results.extend(rows)
+        if error is not None:
+            log.warning('unable to backtest %s: %s', symbol, error)
+            errors[symbol] = error
+    results.sort(key=itemgetter('total_return'), reverse=True)
+    return results, errors
@@ -0,0 +1,90 @@
+"""Classes to chart one instrument at several intervals together."""
+from collections import OrderedDict
+
+import logging
+
+from pypf.chart import PFChart
+from pypf.stats import Stats
+
+
+class ChartBundle(object):
+    """Daily, weekly and monthly point and figure charts of an instrument.
+
+    The instrument's data is read once; the weekly and monthly bars are
+    resampled from the daily bars in the same pass, and every chart
+    reads its window from the shared instrument without copying the
+    rest of the data.
+    """
+
+    INTERVALS = ['d', 'w', 'm']
+
+    def __init__(self, instrument, intervals=None, durations=None,
+                 debug=False, profile=False, **parameters):
+        """Initialize the bundle.
+
+        intervals defaults to INTERVALS. durations maps an interval to
+        its duration in years, overriding the duration parameter for
+        that interval. The remaining parameters are passed to every
+        PFChart.
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if debug is True:
+            self._log.setLevel(logging.DEBUG)
+
+        self.stats = Stats(profile, self._log)
+        self.instrument = instrument
+        if intervals is None:
+            intervals = ChartBundle.INTERVALS
+        if durations is None:
+            durations = {}
+
+        self.charts = OrderedDict()
+        for interval in intervals:
+            chart_parameters = dict(parameters)
+            if interval in durations:
+                chart_parameters['duration'] = durations[interval]
+            self.charts[interval] = PFChart(instrument, interval=interval,
+                                            debug=debug, profile=profile,
+                                            **chart_parameters)
+
+    def __getitem__(self, interval):
+        """Get the chart of an interval."""
+        return self.charts[interval]
+
+    def __iter__(self):
+        """Iterate over the charts in interval order."""
+        return iter(self.charts.values())
+
+    def __len__(self):
+        """Return the number of charts."""
+        return len(self.charts)
+
+    def create_charts(self, render=True):
+        """Populate the data once and create every chart."""
+        stats = self.stats
+        stats.reset()
+        bars = [chart.required_bars for chart in self.charts.values()]
+        if None in bars:
+            bars = None
+        else:
+            bars = max(bars)
+        with stats.phase('populate_data'):
+            if not self.instrument.has_bars(bars):
+                self.instrument.populate_data(bars)
+        for interval, chart in self.charts.items():
+            self._log.debug('creating %s chart', interval)
+            with stats.phase('create_chart_' + interval):
+                chart.create_chart(render)
+
+    def write(self, output, renderer=None):
+        """Write every chart to a file-like object.
+
+        Text charts are written one after another; the other renderers
+        write one document of every chart, e.g. a JSON object keyed by
+        interval or one SVG image with the charts stacked.
+        """
+        if renderer is None:
+            for chart in self.charts.values():
+                chart.write(output)
+        else:
+            renderer.render_charts(self.charts, output)
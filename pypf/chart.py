@@ -1,29 +1,73 @@
 """Classes to generate point and figure charts."""
+from array import array
 from collections import OrderedDict
-from datetime import datetime
 from decimal import Decimal
+from io import StringIO
+from itertools import islice
 
+import hashlib
 import logging
+import os
+import pickle
 import pypf.terminal_format
+import re
+import zlib
+
+from pypf.engine import PFEngine
+from pypf.packing import pack_records
+from pypf.packing import unpack_records
+from pypf.scale import get_scale_class
+from pypf.stats import Stats
 
 
 class PFChart(object):
     """Base class for point and figure charts."""
 
     TWOPLACES = Decimal('0.01')
+    ATR_PERCENT_PLACES = Decimal('0.0001')
+    MONTHS = '123456789ABC'
+    SNAPSHOT_VERSION = 2
+    SIGNALS = ['none', 'buy', 'sell']
+    ACTIONS = ['none', 'x', 'o', 'reverse x->o', 'reverse o->x']
+    DIRECTIONS = ['x', 'o']
 
     def __init__(self, instrument, box_size=.01, duration=1.0,
                  interval='d', method='hl', reversal=3, style=False,
-                 trend_lines=False, debug=False, indent=0, truncate=0):
-        """Initialize common functionality."""
+                 trend_lines=False, debug=False, indent=0, truncate=0,
+                 profile=False, scale_mode='percent', windowed=False,
+                 snapshot=False, end_date=None):
+        """Initialize common functionality.
+
+        box_size is a fraction of the price (.01 is 1%) when scale_mode
+        is percent and a number of points when it is point. A box_size
+        of 'atr:N' sizes the boxes from the N bar average true range of
+        the chart's data when the chart is created, to a hundredth of
+        a percent (or a cent in point mode).
+
+        If windowed is True and truncate is set, only the columns that
+        can be shown are kept while the chart is built, so columns holds
+        just those columns and the ones before them are not available.
+
+        If snapshot is True, the state of the chart is saved after it is
+        built, and the next chart with the same instrument and
+        parameters resumes from it and processes only the new bars,
+        plus the first bars of a window that has moved on until they
+        rejoin the saved columns.
+
+        If end_date ('YYYY-MM-DD') is given, the chart is built as it
+        was at the end of that date, from the bars up to it.
+        """
         self._log = logging.getLogger(self.__class__.__name__)
         if debug is True:
             self._log.setLevel(logging.DEBUG)
             self._log.debug(self)
 
+        self.stats = Stats(profile, self._log)
+
         self.instrument = instrument
         self.interval = interval
-        self.box_size = Decimal(box_size).quantize(PFChart.TWOPLACES)
+        self.scale_mode = scale_mode
+        self.box_size = box_size
         self.duration = Decimal(duration).quantize(PFChart.TWOPLACES)
         self.method = method
         self.reversal = int(reversal)
@@ -31,6 +75,50 @@ class PFChart(object):
         self.trend_lines = trend_lines
         self.indent = indent
         self.truncate = truncate
+        self.windowed = windowed
+        self.snapshot = snapshot
+        self.end_date = end_date
+
+    def __getstate__(self):
+        """Return a compact state to pickle.
+
+        The logger and stats are recreated when unpickled. Of a created
+        chart, the columns and the meta data (packed into columns) are
+        kept; the window of bars and the scale are rebuilt from the
+        instrument, which is pickled compactly too.
+        """
+        state = self.__dict__.copy()
+        state['_log'] = self._log.level
+        state['stats'] = self.stats.enabled
+        if '_historical_data' in state:
+            state['_historical_data'] = None
+            state['_scale'] = None
+            state['_chart_data'] = self._chart_data[1:]
+            state['_chart_meta_data'] = pack_records(self._chart_meta_data)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state returned by __getstate__."""
+        level = state.pop('_log')
+        profile = state.pop('stats')
+        self.__dict__.update(state)
+        self._log = logging.getLogger(self.__class__.__name__)
+        if level == logging.DEBUG:
+            self._log.setLevel(logging.DEBUG)
+        self.stats = Stats(profile, self._log)
+        if '_historical_data' not in state:
+            return
+
+        self._chart_meta_data = unpack_records(self._chart_meta_data,
+                                               OrderedDict)
+        columns = self._chart_data
+        self._historical_data = []
+        self._scale = OrderedDict()
+        if self._engine is not None:
+            self._set_historical_data()
+            self._set_scale()
+            self._engine.scale = self._scale
+        self._chart_data = [self._scale] + columns
 
     @property
     def indent(self):
@@ -40,7 +128,7 @@ class PFChart(object):
     @indent.setter
     def indent(self, value):
         self._indent = value
-        self._log.debug('set self._indent to ' + str(value))
+        self._log.debug('set self._indent to %s', value)
 
     @property
     def truncate(self):
@@ -50,7 +138,7 @@ class PFChart(object):
     @truncate.setter
     def truncate(self, value):
         self._truncate = value
-        self._log.debug('set self._truncate to ' + str(self._truncate))
+        self._log.debug('set self._truncate to %s', self._truncate)
 
     @property
     def box_size(self):
@@ -59,8 +147,33 @@ class PFChart(object):
 
     @box_size.setter
     def box_size(self, value):
-        self._box_size = value
-        self._log.debug('set self._box_size to ' + str(self._box_size))
+        if isinstance(value, str) and value.startswith('atr:'):
+            self.atr_period = int(value[4:])
+            if self.atr_period <= 0:
+                raise ValueError('the atr period must be greater than 0.')
+            self._box_size = None
+        else:
+            self.atr_period = None
+            self._box_size = Decimal(value).quantize(PFChart.TWOPLACES)
+        self._log.debug('set self._box_size to %s', self._box_size)
+
+    @property
+    def box_label(self):
+        """Get the box size as shown in chart titles."""
+        if self.scale_mode == 'point':
+            return str(self.box_size) + ' points'
+        return str((self.box_size * 100).quantize(PFChart.TWOPLACES))
+
+    @property
+    def scale_mode(self):
+        """Specify percent or point boxes."""
+        return self._scale_mode
+
+    @scale_mode.setter
+    def scale_mode(self, value):
+        self._scale_class = get_scale_class(value)
+        self._scale_mode = value
+        self._log.debug('set self._scale_mode to %s', self._scale_mode)
 
     @property
     def chart(self):
@@ -80,7 +193,7 @@ class PFChart(object):
     @duration.setter
     def duration(self, value):
         self._duration = value
-        self._log.debug('set self._duration to ' + str(self._duration))
+        self._log.debug('set self._duration to %s', self._duration)
 
     @property
     def instrument(self):
@@ -90,21 +203,23 @@ class PFChart(object):
     @instrument.setter
     def instrument(self, value):
         self._instrument = value
-        self._log.debug('set self._instrument to ' + str(self._instrument))
+        self.stats.context['symbol'] = value.symbol
+        self._log.debug('set self._instrument to %s', self._instrument)
 
     @property
     def interval(self):
-        """Specify day (d), week (w), or month (m) interval."""
+        """Specify day (d), week (w), month (m) or minutes (e.g. 5min)."""
         return self._interval
 
     @interval.setter
     def interval(self, value):
-        if value not in ["d", "w", "m"]:
+        if (value not in ["d", "w", "m"]
+                and re.match('^[1-9][0-9]*min$', value) is None):
             raise ValueError("incorrect interval: "
-                             "valid intervals are d, w, m")
+                             "valid intervals are d, w, m, or a number "
+                             "of minutes such as 5min")
         self._interval = value
-        self._log.debug('set self._interval to '
-                        + str(self._interval))
+        self._log.debug('set self._interval to %s', self._interval)
 
     @property
     def method(self):
@@ -117,7 +232,7 @@ class PFChart(object):
             raise ValueError("incorrect method: "
                              "valid methods are hl, c")
         self._method = value
-        self._log.debug('set self._method to ' + self._method)
+        self._log.debug('set self._method to %s', self._method)
 
     @property
     def reversal(self):
@@ -127,7 +242,7 @@ class PFChart(object):
     @reversal.setter
     def reversal(self, value):
         self._reversal = value
-        self._log.debug('set self._reversal to ' + str(self._reversal))
+        self._log.debug('set self._reversal to %s', self._reversal)
 
     @property
     def style_output(self):
@@ -137,7 +252,7 @@ class PFChart(object):
     @style_output.setter
     def style_output(self, value):
         self._style_output = value
-        self._log.debug('set self._style_output to ' + str(self._style_output))
+        self._log.debug('set self._style_output to %s', self._style_output)
 
     @property
     def trend_lines(self):
@@ -147,72 +262,197 @@ class PFChart(object):
     @trend_lines.setter
     def trend_lines(self, value):
         self._trend_lines = value
-        self._log.debug('set self._trend_lines to ' + str(self._trend_lines))
+        self._log.debug('set self._trend_lines to %s', self._trend_lines)
+
+    @property
+    def column_count(self):
+        """Get the number of columns in the chart."""
+        return self._column_count
+
+    @property
+    def columns(self):
+        """Get the columns of the chart (PFColumn objects).
+
+        When the chart is windowed, only the retained columns from
+        first_column on are included.
+        """
+        return self._chart_data[1:]
 
-    def create_chart(self):
-        """Populate the data and create the chart."""
+    @property
+    def first_column(self):
+        """Get the column index of the first column in columns."""
+        return self._first_column
+
+    @property
+    def required_bars(self):
+        """Get the number of daily bars the chart needs, None if all."""
+        if self.end_date is not None:
+            return None
+        if self.interval == 'd':
+            return int(self.duration * 252)
+        if self.interval == 'w':
+            # A spare week or month so the first one is complete
+            return (int(self.duration * 52) + 2) * 5
+        if self.interval == 'm':
+            return (int(self.duration * 12) + 1) * 23
+        return None
+
+    @property
+    def scale(self):
+        """Get the scale values keyed by scale index."""
+        return self._scale
+
+    @property
+    def visible_columns(self):
+        """Get (column index, column) pairs shown after truncation."""
+        first_column = 1
+        if self.truncate > 0 and self._column_count > self.truncate:
+            first_column = self._column_count + 1 - self.truncate
+        position = first_column - self._first_column + 1
+        return list(enumerate(self._chart_data[position:], first_column))
+
+    @property
+    def trend_line_starts(self):
+        """Get the drawn trend lines.
+
+        Each line is a (type, column index, scale index) tuple, where
+        type is support or resistance. Lines run to the last column,
+        rising (support) or falling (resistance) one box per column.
+        """
+        lines = []
+        for offset, column_index in self._support_overlay.items():
+            lines.append(('support', column_index, offset + column_index))
+        for offset, column_index in self._resistance_overlay.items():
+            lines.append(('resistance', column_index, offset - column_index))
+        return lines
+
+    def create_chart(self, render=True):
+        """Populate the data and create the chart.
+
+        If render is False the chart data and meta data are generated
+        but the text chart is not, which is all that is needed to
+        inspect the current state of the chart.
+        """
+        stats = self.stats
+        stats.reset()
+        with stats.phase('initialize'):
+            self._initialize()
+        with stats.phase('set_historical_data'):
+            self._set_historical_data()
+        with stats.phase('set_price_fields'):
+            self._set_price_fields()
+        with stats.phase('set_scale'):
+            self._set_scale()
+        with stats.phase('set_chart_data'):
+            self._set_chart_data()
+        if render:
+            with stats.phase('get_chart'):
+                self._chart = self._get_chart()
+        else:
+            self._set_current_state()
+
+        if stats.enabled:
+            stats.count('bars', len(self._historical_data))
+            stats.count('scale_length', len(self._scale))
+            stats.count('columns', self._column_count)
+            stats.count('boxes', sum(len(column)
+                                     for column in self.columns))
+            if render:
+                stats.count('chart_characters', len(self._chart))
+
+    def iterate_engine(self):
+        """Feed the chart's bars through a new engine, one at a time.
+
+        Yields (bar, engine) after every bar but the first, when the
+        engine holds the state that create_chart would store as that
+        bar's meta data. No meta data or columns are kept and snapshots
+        are not used, so this is the cheap way to read the end state of
+        a chart or its signals over time. The scale is the chart's.
+        """
         self._initialize()
         self._set_historical_data()
         self._set_price_fields()
         self._set_scale()
-        self._set_chart_data()
-        self._chart = self._get_chart()
-    
+        # Marker months do not change the state, so none are given
+        engine = PFEngine(self._scale, self.reversal, retain=1)
+        self._engine = engine
+        date_field = self._date_field
+        high_field = self._high_field
+        low_field = self._low_field
+        for day in self._historical_data.values():
+            if engine.update(day[date_field], day[high_field],
+                             day[low_field], None):
+                yield day, engine
+
+    def remove_snapshot(self):
+        """Remove the snapshot saved for the chart, if there is one."""
+        path = self._get_snapshot_path(self._get_snapshot_key())
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def write(self, output, renderer=None):
+        """Write the chart to a file-like object.
+
+        renderer is one of the classes in pypf.render; the terminal text
+        chart is written by default. create_chart must be called first.
+        """
+        if renderer is None:
+            self._write_chart(output)
+        else:
+            renderer.render(self, output)
+
     def _get_chart(self):
+        output = StringIO()
+        self._write_chart(output)
+        return output.getvalue()
+
+    def _write_chart(self, output):
         self._set_current_state()
-        chart = ""
-        chart += "\n"
-        chart += self._get_chart_title()
-        
-        index = len(self._chart_data[0]) - 1
-        if self.truncate > 0:            
-            first_column = self._chart_data.pop(0)
-            self._chart_data = self._chart_data[-self.truncate:]
-            self._chart_data.insert(0,first_column)
-        
-        scale_right = None
-        self._log.info(len(self._chart_data))
+        output.write("\n")
+        output.write(self._get_chart_title())
+
+        scale = self._scale
+        columns = self.visible_columns
+        trend_line = self._style('bold', self._style('blue', '.'))
+
+        index = len(scale) - 1
         while index >= 0:
+            row = ''
             found = False
-            first = True
-            for column in self._chart_data:
-                    if first:
-                        first = False
-                        continue
-                    if index in column:
-                        found = True             
-                        break
+            for column_index, column in columns:
+                if index in column:
+                    symbol = column.symbol(index)
+                    if index in column.markers:
+                        symbol = self._style('bold', self._style('red',
+                                                                 symbol))
+                    row += ' ' + symbol
+                    found = True
+                elif self._is_trend_line(column_index, index):
+                    row += ' ' + trend_line
+                    found = True
+                else:
+                    row += '  '
             if found:
-                first = True
-                for column in self._chart_data:
-                    if index in column:
-                        if first:
-                            scale_value = column[index]
-                            if index == self._current_scale_index:
-                                scale_left = (self._style('red',
-                                              self._style('bold', '{:7.2f}'))
-                                              .format(scale_value))
-                                scale_right = (self._style('red',
-                                               self._style('bold', '<< '))
-                                               + self._style('red',
-                                                             self._style('bold',
-                                                                         '{:.2f}'))
-                                               .format(self._current_close))
-                            else:
-                                scale_left = '{:7.2f}'.format(scale_value)
-                                scale_right = '{:.2f}'.format(scale_value)
-                            chart = chart + self.indent + scale_left + '| '
-                            first = False
-                        else:
-                            chart = chart + ' ' + column[index][0]
-                    else:
-                        chart += '  '
-                
-                chart += '   |' + scale_right
-                chart += "\n"
-                
+                scale_value = scale[index]
+                if index == self._current_scale_index:
+                    scale_left = (self._style('red',
+                                  self._style('bold', '{:7.2f}'))
+                                  .format(scale_value))
+                    scale_right = (self._style('red',
+                                   self._style('bold', '<< '))
+                                   + self._style('red',
+                                                 self._style('bold',
+                                                             '{:.2f}'))
+                                   .format(self._current_close))
+                else:
+                    scale_left = '{:7.2f}'.format(scale_value)
+                    scale_right = '{:.2f}'.format(scale_value)
+                output.write(self.indent + scale_left + '| ' + row
+                             + '   |' + scale_right + "\n")
+
             index -= 1
-        return chart
 
     def _get_chart_title(self):
         self._set_current_prices()
@@ -231,7 +471,7 @@ class PFChart(object):
                  + "\n")         
         title = (title + self.indent
                  + "box: "
-                 + str((self.box_size * 100).quantize(PFChart.TWOPLACES)))
+                 + self.box_label)
         title = title + ", reversal: " + str(self.reversal)
         title = title + ", method: " + str(self.method) + "\n"
         title = (title + self.indent
@@ -242,29 +482,16 @@ class PFChart(object):
         return title
 
     def _get_month(self, date_value):
-        datetime_object = datetime.strptime(date_value, '%Y-%m-%d')
-        month = str(datetime_object.month)
-        if month == '10':
-            month = 'A'
-        elif month == '11':
-            month = 'B'
-        elif month == '12':
-            month = 'C'
-        return self._style('bold', self._style('red', month))
+        # Dates are stored as YYYY-MM-DD, so the month can be sliced
+        # rather than parsed
+        return PFChart.MONTHS[int(date_value[5:7]) - 1]
 
     def _get_scale_index(self, value, direction):
-        index = 0
-        while index < len(self._scale):
-            if self._scale[index] == value:
-                return index
-            elif self._scale[index] > value:
-                if direction == 'x':
-                    return index - 1
-                else:
-                    return index
-            index += 1
+        return self._scale.index(value, direction)
 
-    def _get_status(self, signal, direction):
+    @staticmethod
+    def get_status(signal, direction):
+        """Get the status of a chart from its signal and direction."""
         if signal == 'buy' and direction == 'x':
             status = 'bull confirmed'
         elif signal == 'buy' and direction == 'o':
@@ -281,170 +508,43 @@ class PFChart(object):
         self._log.info('generating chart')
         self._chart_data = []
         self._chart_meta_data = OrderedDict()
-        self._support_lines = []
-        self._resistance_lines = []
         self._chart_data.append(self._scale)
 
-        column = OrderedDict()
-        column_index = 1
-        direction = 'x'
-        index = None
-        month = None
-        signal = 'none'
-        prior_high_index = len(self._scale) - 1
-        prior_low_index = 0
-
-        for row in self._historical_data:
+        engine, position, checks, history, resumed = self._resume_engine()
+        if engine is None:
+            engine = PFEngine(self._scale, self.reversal, self._get_retain())
+            position = 0
+            checks = array('L')
+            history = array('l')
+            resumed = 0
+        self._engine = engine
+        self._support_lines = engine.support_lines
+        self._resistance_lines = engine.resistance_lines
+
+        for row in islice(self._historical_data, position, None):
             day = self._historical_data[row]
-            action = 'none'
-            move = 0
-            current_month = self._get_month(day[self._date_field])
-
-            if index is None:
-                # First day - set the starting index based
-                # on the high and 'x' direction
-                index = self._get_scale_index(day[self._high_field], 'x')
-                column[index] = ['x', day[self._date_field]]
-                month = current_month
-                continue
-
-            if direction == 'x':
-                scale_index = self._get_scale_index(day[self._high_field], 'x')
-
-                if scale_index > index:
-                    # new high
-                    action = 'x'
-                    move = scale_index - index
-
-                    if signal != 'buy' and scale_index > prior_high_index:
-                        signal = 'buy'
-
-                    first = True
-                    while index < scale_index:
-                        index += 1
-                        if first:
-                            if current_month != month:
-                                column[index] = [current_month,
-                                                 day[self._date_field]]
-                            else:
-                                column[index] = ['x', day[self._date_field]]
-                            first = False
-                        else:
-                            column[index] = ['x', day[self._date_field]]
-                    month = current_month
-                else:
-                    # check for reversal
-                    x_scale_index = scale_index
-                    scale_index = self._get_scale_index(day[self._low_field],
-                                                        'o')
-                    if index - scale_index >= self.reversal:
-                        # reversal
-                        action = 'reverse x->o'
-                        move = index - scale_index
-
-                        if signal != 'sell' and scale_index < prior_low_index:
-                            signal = 'sell'
-
-                        prior_high_index = index
-                        self._resistance_lines.append([column_index,
-                                                       prior_high_index + 1])
-                        self._chart_data.append(column)
-                        column_index += 1
-                        column = OrderedDict()
-                        direction = 'o'
-                        first = True
-                        while index > scale_index:
-                            index -= 1
-                            if first:
-                                if current_month != month:
-                                    column[index] = [current_month,
-                                                     day[self._date_field]]
-                                else:
-                                    column[index] = ['d',
-                                                     day[self._date_field]]
-                                first = False
-                            else:
-                                column[index] = ['d', day[self._date_field]]
-                        month = current_month
-                    else:
-                        # no reversal - reset the scale_index
-                        scale_index = x_scale_index
+            if self.snapshot:
+                checks.append(self._get_bar_check(day))
+            if self._update_engine(engine, day):
+                self._store_engine_state(engine, day, history)
+
+        if self.snapshot and resumed < len(self._historical_data):
+            self._save_snapshot(engine, checks, history)
+        self.stats.count('resumed_bars', resumed)
+
+        self._chart_data.extend(engine.columns)
+        self._column_count = engine.column_index
+        self._first_column = engine.dropped + 1
+        self._dropped_first = 0
+
+        low, high = engine.get_extent(1)
+        if high - low + 1 < self.reversal:
+            if engine.dropped == 0:
+                self._chart_data.pop(1)
             else:
-                # in an 'o' column
-                scale_index = self._get_scale_index(day[self._low_field], 'o')
-                if scale_index < index:
-                    # new low
-                    action = 'o'
-                    move = index - scale_index
-
-                    if signal != 'sell' and scale_index < prior_low_index:
-                        signal = 'sell'
-
-                    first = True
-                    while index > scale_index:
-                        index -= 1
-                        if first:
-                            if current_month != month:
-                                column[index] = [current_month,
-                                                 day[self._date_field]]
-                            else:
-                                column[index] = ['o', day[self._date_field]]
-                            first = False
-                        else:
-                            column[index] = ['o', day[self._date_field]]
-                    month = current_month
-                else:
-                    # check for reversal
-                    o_scale_index = scale_index
-                    scale_index = self._get_scale_index(day[self._high_field],
-                                                        'x')
-                    if scale_index - index >= self.reversal:
-                        # reversal
-                        action = 'reverse o->x'
-                        move = scale_index - index
-
-                        if signal != 'buy' and scale_index > prior_high_index:
-                            signal = 'buy'
-
-                        prior_low_index = index
-                        self._support_lines.append([column_index,
-                                                    prior_low_index - 1])
-                        self._chart_data.append(column)
-                        column_index += 1
-                        column = OrderedDict()
-                        direction = 'x'
-                        first = True
-                        while index < scale_index:
-                            index += 1
-                            if first:
-                                if current_month != month:
-                                    column[index] = [current_month,
-                                                     day[self._date_field]]
-                                else:
-                                    column[index] = ['u',
-                                                     day[self._date_field]]
-                                first = False
-                            else:
-                                column[index] = ['u', day[self._date_field]]
-                        month = current_month
-                    else:
-                        # no reversal - reset the scale_index
-                        scale_index = o_scale_index
-
-            # Store the meta data for the day
-            status = self._get_status(signal, direction)
-            scale_value = (self._scale[scale_index]
-                           .quantize(PFChart.TWOPLACES))
-            prior_high = self._scale[prior_high_index]
-            prior_low = self._scale[prior_low_index]
-            self._store_base_metadata(day, signal, status, action, move,
-                                      column_index, scale_index, scale_value,
-                                      direction, prior_high, prior_low)
-
-        self._chart_data.append(column)
-
-        if len(self._chart_data[1]) < self.reversal:
-            self._chart_data.pop(1)
+                self._first_column -= 1
+            self._column_count -= 1
+            self._dropped_first = 1
             for line in self._support_lines:
                 line[0] = line[0] - 1
             for line in self._resistance_lines:
@@ -455,9 +555,225 @@ class PFChart(object):
 
         return self._chart_data
 
+    def _get_retain(self):
+        if self.windowed and self.truncate > 0:
+            # One more column in case the first column is dropped
+            return self.truncate + 1
+        return None
+
+    def _update_engine(self, engine, day):
+        return engine.update(day[self._date_field], day[self._high_field],
+                             day[self._low_field],
+                             self._get_month(day[self._date_field]))
+
+    def _store_engine_state(self, engine, day, history):
+        # Store the meta data for the day
+        scale_index = engine.scale_index
+        status = self.get_status(engine.signal, engine.direction)
+        scale_value = (self._scale[scale_index]
+                       .quantize(PFChart.TWOPLACES))
+        prior_high = self._scale[engine.prior_high_index]
+        prior_low = self._scale[engine.prior_low_index]
+        self._store_base_metadata(day, engine.signal, status,
+                                  engine.action, engine.move,
+                                  engine.column_index, scale_index,
+                                  scale_value, engine.direction,
+                                  prior_high, prior_low)
+        if self.snapshot:
+            history.extend(self._get_history_row(engine))
+
+    def _get_history_row(self, engine):
+        return (PFChart.SIGNALS.index(engine.signal),
+                PFChart.ACTIONS.index(engine.action),
+                engine.move,
+                engine.column_index,
+                engine.scale_index,
+                PFChart.DIRECTIONS.index(engine.direction),
+                engine.prior_high_index,
+                engine.prior_low_index)
+
+    def _get_bar_check(self, day):
+        return zlib.crc32(('%s %s %s' % (day[self._date_field],
+                                         day[self._high_field],
+                                         day[self._low_field])).encode())
+
+    def _get_snapshot_key(self):
+        if self.atr_period is not None:
+            box_size = 'atr:' + str(self.atr_period)
+        else:
+            box_size = str(self.box_size)
+        return (PFChart.SNAPSHOT_VERSION, self.instrument.symbol,
+                self.instrument.data_path, box_size, self.scale_mode,
+                str(self.duration), self.interval, self.method,
+                self.reversal, self._get_retain(), self.end_date)
+
+    def _get_snapshot_path(self, key):
+        name = (self.instrument.symbol.replace('/', '_') + '_'
+                + hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+                + '.snapshot')
+        return os.path.join(self.instrument.data_directory, 'snapshots',
+                            name)
+
+    def _resume_engine(self):
+        # Returns the engine, the position of the first bar it has not
+        # seen, the checks and history of the bars before it and the
+        # number of bars taken from the snapshot without being fed
+        # through an engine. A snapshot is used if the bars it covered
+        # are unchanged and the window starts on one of them
+        if not self.snapshot:
+            return None, 0, None, None, 0
+        key = self._get_snapshot_key()
+        path = self._get_snapshot_path(key)
+        try:
+            with open(path, 'rb') as snapshot_file:
+                state = pickle.load(snapshot_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None, 0, None, None, 0
+        data = self._historical_data
+        if (state.get('key') != key
+                or state['box_size'] != self.box_size):
+            self._log.info('snapshot for %s is out of date',
+                           self.instrument.symbol)
+            return None, 0, None, None, 0
+        saved_checks = state['checks']
+        try:
+            start = saved_checks.index(
+                self._get_bar_check(next(iter(data.values()))))
+        except ValueError:
+            self._log.info('window for %s starts outside its snapshot',
+                           self.instrument.symbol)
+            return None, 0, None, None, 0
+        overlap = len(saved_checks) - start
+        checks = array('L', map(self._get_bar_check,
+                                islice(data.values(), overlap)))
+        if checks != saved_checks[start:]:
+            self._log.info('data for %s changed since its snapshot',
+                           self.instrument.symbol)
+            return None, 0, None, None, 0
+
+        # Indexes on the saved scale move to this one by the difference
+        # of their first boxes, which the box size fixes
+        boxes = state['first_box'] - self._scale.first_box
+        saved = state['engine']
+        saved.scale = self._scale
+        saved.shift(boxes)
+        saved_history = state['history']
+
+        history = array('l')
+        # Until the first reversal each way the prior high and low are
+        # the ends of the scale, which may have moved
+        no_high = None
+        no_low = None
+        if start == 0:
+            # The same window, with bars added at most
+            engine = saved
+            position = 0
+            columns = 0
+            resumed = overlap
+            no_high = len(self._scale) - 1
+            no_low = 0
+            if len(engine.resistance_lines) == 0:
+                engine.prior_high_index = no_high
+            if len(engine.support_lines) == 0:
+                engine.prior_low_index = no_low
+        else:
+            # The window has moved on, so its first bars are built
+            # again until the new engine reverses into the state the
+            # saved one had after the same bar; from then on both build
+            # the same columns
+            engine = PFEngine(self._scale, self.reversal,
+                              self._get_retain())
+            for position, day in enumerate(islice(data.values(),
+                                                  overlap)):
+                if not self._update_engine(engine, day):
+                    continue
+                self._store_engine_state(engine, day, history)
+                if not engine.action.startswith('reverse'):
+                    continue
+                row = 8 * (position + start - 1)
+                saved_row = list(saved_history[row:row + 8])
+                column_index = saved_row[3]
+                for field in [4, 6, 7]:
+                    saved_row[field] += boxes
+                saved_row[3] = engine.column_index
+                if tuple(saved_row) == self._get_history_row(engine):
+                    columns = engine.column_index - column_index
+                    engine.join(saved, column_index)
+                    break
+            else:
+                self._log.info('rebuilt the window of %s without its '
+                               'snapshot', self.instrument.symbol)
+                return engine, overlap, checks, history, 0
+            resumed = overlap - position - 1
+
+        # Rebuild the meta data of the remaining bars from the compact
+        # history
+        scale = self._scale
+        twoplaces = PFChart.TWOPLACES
+        reverse_down = PFChart.ACTIONS.index('reverse x->o')
+        reverse_up = PFChart.ACTIONS.index('reverse o->x')
+        rows = islice(data.values(), position + 1, overlap)
+        saved_rows = zip(*[iter(saved_history[8 * (position + start):])]
+                         * 8)
+        for day, (signal, action, move, column_index, scale_index,
+                  direction, prior_high_index,
+                  prior_low_index) in zip(rows, saved_rows):
+            column_index += columns
+            scale_index += boxes
+            if action == reverse_down:
+                no_high = None
+            elif action == reverse_up:
+                no_low = None
+            if no_high is None:
+                prior_high_index += boxes
+            else:
+                prior_high_index = no_high
+            if no_low is None:
+                prior_low_index += boxes
+            else:
+                prior_low_index = no_low
+            history.extend((signal, action, move, column_index, scale_index,
+                            direction, prior_high_index, prior_low_index))
+            signal = PFChart.SIGNALS[signal]
+            direction = PFChart.DIRECTIONS[direction]
+            self._store_base_metadata(day, signal,
+                                      self.get_status(signal, direction),
+                                      PFChart.ACTIONS[action], move,
+                                      column_index, scale_index,
+                                      scale[scale_index].quantize(twoplaces),
+                                      direction, scale[prior_high_index],
+                                      scale[prior_low_index])
+
+        self._log.info('resuming %s after %s', self.instrument.symbol,
+                       state['last_date'])
+        return engine, overlap, checks, history, resumed
+
+    def _save_snapshot(self, engine, checks, history):
+        key = self._get_snapshot_key()
+        path = self._get_snapshot_path(key)
+        state = {'key': key,
+                 'last_date': next(reversed(self._historical_data)),
+                 'box_size': self.box_size,
+                 'first_box': self._scale.first_box,
+                 'engine': engine,
+                 'checks': checks,
+                 'history': history}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a reader never sees a
+        # partial snapshot
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as snapshot_file:
+            pickle.dump(state, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+        self._log.info('saved snapshot to %s', path)
+
     def _initialize(self):
         self._chart = None
         self._chart_data = []
+        self._column_count = 0
+        self._first_column = 1
+        self._dropped_first = 0
+        self._engine = None
         self._chart_meta_data = OrderedDict()
         self._historical_data = []
         self._scale = OrderedDict()
@@ -485,47 +801,90 @@ class PFChart(object):
         self._current_direction = None
         self._support_lines = []
         self._resistance_lines = []
+        self._support_overlay = {}
+        self._resistance_overlay = {}
 
-    def _is_complete_line(self, start_point, line_type='support'):
-        c_index = start_point[0]
-        s_index = start_point[1]
-        while c_index < len(self._chart_data):
-            if s_index in self._chart_data[c_index]:
-                return False
-            c_index += 1
-            if line_type == 'support':
-                s_index += 1
-            else:
-                s_index -= 1
-        if c_index - start_point[0] > 2:
+    def _is_trend_line(self, column_index, index):
+        start = self._support_overlay.get(index - column_index)
+        if start is not None and column_index >= start:
             return True
-        else:
-            return False
+        start = self._resistance_overlay.get(index + column_index)
+        if start is not None and column_index >= start:
+            return True
+        return False
 
     def _set_trend_lines(self):
-        for start_point in self._support_lines:
-            c_index = start_point[0]
-            s_index = start_point[1]
-            if self._is_complete_line(start_point, 'support'):
-                while c_index < len(self._chart_data):
-                    self._chart_data[c_index][s_index] = [self._style('bold',
-                                                          self._style('blue',
-                                                                      '.')),
-                                                          '']
-                    c_index += 1
-                    s_index += 1
-
-        for start_point in self._resistance_lines:
-            c_index = start_point[0]
-            s_index = start_point[1]
-            if self._is_complete_line(start_point, 'resistance'):
-                while c_index < len(self._chart_data):
-                    self._chart_data[c_index][s_index] = [self._style('bold',
-                                                          self._style('blue',
-                                                                      '.')),
-                                                          '']
-                    c_index += 1
-                    s_index -= 1
+        # A support line rises one box per column, so every box it
+        # passes through has the same (scale index - column index).
+        # Likewise a resistance line keeps (scale index + column index)
+        # constant. Each column is a contiguous run of boxes, so one
+        # sweep from the last column back, collecting the shifted
+        # ranges covered so far, tells whether any later column blocks
+        # a line that starts at the current column.
+        last_column = self._column_count + 1
+        get_extent = self._engine.get_extent
+        dropped_first = self._dropped_first
+        support_starts = {}
+        for line in self._support_lines:
+            support_starts.setdefault(line[0], []).append(line)
+        resistance_starts = {}
+        for line in self._resistance_lines:
+            resistance_starts.setdefault(line[0], []).append(line)
+
+        support_blocked = set()
+        resistance_blocked = set()
+        blocked_lines = set()
+        for column_index in range(last_column - 1, -1, -1):
+            if column_index == 0:
+                low = 0
+                high = len(self._scale) - 1
+            else:
+                low, high = get_extent(column_index + dropped_first)
+            if low <= high:
+                support_blocked.update(range(low - column_index,
+                                             high - column_index + 1))
+                resistance_blocked.update(range(low + column_index,
+                                                high + column_index + 1))
+            for line in support_starts.get(column_index, []):
+                if line[1] - line[0] in support_blocked:
+                    blocked_lines.add(id(line))
+            for line in resistance_starts.get(column_index, []):
+                if line[1] + line[0] in resistance_blocked:
+                    blocked_lines.add(id(line))
+
+        # Lines are drawn in the order they were found, and a line that
+        # has been drawn blocks any later line it crosses.
+        self._support_overlay = {}
+        for line in self._support_lines:
+            offset = line[1] - line[0]
+            if (id(line) in blocked_lines
+                    or last_column - line[0] <= 2
+                    or offset in self._support_overlay):
+                continue
+            self._support_overlay[offset] = line[0]
+
+        self._resistance_overlay = {}
+        for line in self._resistance_lines:
+            offset = line[1] + line[0]
+            if (id(line) in blocked_lines
+                    or last_column - line[0] <= 2
+                    or offset in self._resistance_overlay
+                    or self._crosses_support(line[0], offset, last_column)):
+                continue
+            self._resistance_overlay[offset] = line[0]
+
+    def _crosses_support(self, start, offset, last_column):
+        # Complete lines can only cross near the end of the chart, since
+        # price must be above the support and below the resistance, so
+        # few support lines are ever drawn alongside resistance lines.
+        for support_offset, support_start in self._support_overlay.items():
+            distance = offset - support_offset
+            if distance % 2 != 0:
+                continue
+            column_index = distance // 2
+            if max(start, support_start) <= column_index < last_column:
+                return True
+        return False
 
     def _set_current_prices(self):
         day = next(reversed(self._historical_data))
@@ -554,25 +913,43 @@ class PFChart(object):
 
     def _set_historical_data(self):
         self._log.info('setting historical data')
-        if len(self.instrument.daily_historical_data) == 0:
-            self.instrument.populate_data()
+        bars = self.required_bars
+        if not self.instrument.has_bars(bars):
+            self.instrument.populate_data(bars)
 
+        # The window is a view of the instrument's bars rather than a
+        # copy, so the instrument can be shared by other charts
+        series = self.instrument.get_series(self.interval, self.end_date)
         if self.interval == 'd':
             days = int(self.duration * 252)
-            self._historical_data = self.instrument.daily_historical_data
         elif self.interval == 'w':
             days = int(self.duration * 52)
-            self._historical_data = self.instrument.weekly_historical_data
         elif self.interval == 'm':
             days = int(self.duration * 12)
-            self._historical_data = self.instrument.monthly_historical_data
-
-        if len(self._historical_data) > days:
-            offset = len(self._historical_data) - days
-            i = 0
-            while i < offset:
-                self._historical_data.popitem(False)
-                i += 1
+        else:
+            # Intraday - the duration covers the same number of
+            # sessions as days in a daily chart
+            days = self._get_intraday_window(series,
+                                             int(self.duration * 252))
+        self._historical_data = series.last_n(days)
+        if len(self._historical_data) == 0:
+            if self.end_date is None:
+                raise ValueError('no data to chart for '
+                                 + self.instrument.symbol)
+            raise ValueError('no data to chart for ' + self.instrument.symbol
+                             + ' on or before ' + self.end_date)
+
+    def _get_intraday_window(self, series, sessions):
+        bars = 0
+        session = None
+        for timestamp in reversed(series):
+            if timestamp[:10] != session:
+                if sessions == 0:
+                    break
+                sessions -= 1
+                session = timestamp[:10]
+            bars += 1
+        return bars
 
     def _set_price_fields(self):
         if self.method == 'hl':
@@ -586,6 +963,21 @@ class PFChart(object):
         self._volume_field = 'Volume'
         self._date_field = 'Date'
 
+    def _set_atr_box_size(self):
+        average = self.instrument.get_average_true_range(
+            self.atr_period, self.interval, len(self._historical_data),
+            self.end_date)
+        if self.scale_mode == 'percent':
+            # A fraction of the price, kept to a hundredth of a percent
+            last = next(reversed(self._historical_data))
+            average = average / self._historical_data[last]['Close']
+            places = PFChart.ATR_PERCENT_PLACES
+        else:
+            places = PFChart.TWOPLACES
+        self._box_size = max(average.quantize(places), places)
+        self._log.info('set the box size to %s from the average true '
+                       'range', self._box_size)
+
     def _set_scale(self):
         row = next(iter(self._historical_data))
         day = self._historical_data[row]
@@ -599,65 +991,37 @@ class PFChart(object):
             if day[self._low_field] < lowest:
                 lowest = day[self._low_field]
 
-        temp_scale = []
-        current = Decimal(.01)
-        temp_scale.append(current)
-
-        while current <= highest:
-            value = current + (current * self.box_size)
-            temp_scale.append(value)
-            current = value
-
-        slice_point = 0
-        for index, scale_value in enumerate(temp_scale):
-            if scale_value > lowest:
-                slice_point = index - 1
-                break
-        temp_scale = temp_scale[slice_point:]
-
-        self._scale = OrderedDict()
-        for index, scale_value in enumerate(temp_scale):
-            self._scale[index] = scale_value.quantize(PFChart.TWOPLACES)
+        # A percent scale compounds from $0.01, so it has no box for a
+        # price at or below zero, such as a spread can have
+        if self.scale_mode == 'percent' and lowest <= 0:
+            raise ValueError('prices of ' + self.instrument.symbol
+                             + ' fall to ' + str(lowest) + ', which needs '
+                             "scale_mode 'point'")
+        if self.atr_period is not None:
+            self._set_atr_box_size()
+        self._scale = self._scale_class(self.box_size, lowest, highest)
 
     def _store_base_metadata(self, day, signal, status, action, move,
                              column_index, scale_index, scale_value,
                              direction, prior_high, prior_low):
-        date_value = day['Date']
-        self._chart_meta_data[date_value] = {}
-        self._chart_meta_data[date_value]['signal'] = signal
-        self._chart_meta_data[date_value]['status'] = status
-        self._chart_meta_data[date_value]['action'] = action
-        self._chart_meta_data[date_value]['move'] = move
-        self._chart_meta_data[date_value]['column_index'] = column_index
-        self._chart_meta_data[date_value]['scale_index'] = scale_index
-        self._chart_meta_data[date_value]['scale_value'] = scale_value
-        self._chart_meta_data[date_value]['direction'] = direction
-        self._chart_meta_data[date_value]['prior_high'] = (prior_high
-                                                           .quantize(
-                                                               PFChart
-                                                               .TWOPLACES))
-        self._chart_meta_data[date_value]['prior_low'] = (prior_low
-                                                          .quantize(
-                                                              PFChart
-                                                              .TWOPLACES))
-        self._chart_meta_data[date_value]['date'] = day['Date']
-        self._chart_meta_data[date_value]['open'] = (day['Open']
-                                                     .quantize(
-                                                         PFChart
-                                                         .TWOPLACES))
-        self._chart_meta_data[date_value]['high'] = (day['High']
-                                                     .quantize(
-                                                         PFChart
-                                                         .TWOPLACES))
-        self._chart_meta_data[date_value]['low'] = (day['Low']
-                                                    .quantize(
-                                                        PFChart
-                                                        .TWOPLACES))
-        self._chart_meta_data[date_value]['close'] = (day['Close']
-                                                      .quantize(
-                                                          PFChart
-                                                          .TWOPLACES))
-        self._chart_meta_data[date_value]['volume'] = day['Volume']
+        twoplaces = PFChart.TWOPLACES
+        self._chart_meta_data[day['Date']] = {
+            'signal': signal,
+            'status': status,
+            'action': action,
+            'move': move,
+            'column_index': column_index,
+            'scale_index': scale_index,
+            'scale_value': scale_value,
+            'direction': direction,
+            'prior_high': prior_high.quantize(twoplaces),
+            'prior_low': prior_low.quantize(twoplaces),
+            'date': day['Date'],
+            'open': day['Open'].quantize(twoplaces),
+            'high': day['High'].quantize(twoplaces),
+            'low': day['Low'].quantize(twoplaces),
+            'close': day['Close'].quantize(twoplaces),
+            'volume': day['Volume']}
         self._store_custom_metadata(day)
 
     def _store_custom_metadata(self, day):
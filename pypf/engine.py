@@ -0,0 +1,420 @@
+"""Classes that build point and figure columns one bar or tick at a time.
+
+PFChart feeds its historical data through a PFEngine, and PFBuilder
+feeds one from live bars or individual trades. Only the compact
+columns and the current state are kept, never the prices themselves.
+"""
+from array import array
+from bisect import bisect_right
+from decimal import Decimal
+
+from pypf.scale import get_scale_class
+
+
+class PFColumn(object):
+    """A column of contiguous boxes in a point and figure chart.
+
+    Boxes always fill a contiguous range of scale indexes, so a column
+    is stored as its low and high index plus the few boxes that differ
+    from the column's symbol. Membership is a range check.
+    """
+
+    __slots__ = ('direction', 'low', 'high', 'markers', 'reversal_boxes',
+                 '_offsets', '_dates')
+
+    def __init__(self, direction, index):
+        """Create an empty column whose first box will be at index."""
+        self.direction = direction
+        if direction == 'x':
+            self.low = index
+            self.high = index - 1
+        else:
+            self.low = index + 1
+            self.high = index
+        self.markers = {}
+        self.reversal_boxes = 0
+        self._offsets = []
+        self._dates = []
+
+    def __contains__(self, index):
+        """Return True if the column has a box at the scale index."""
+        return self.low <= index <= self.high
+
+    def __len__(self):
+        """Return the number of boxes in the column."""
+        return self.high - self.low + 1
+
+    def add_boxes(self, index, date, marker=None, reversal=False):
+        """Extend the column to index with boxes filled on date.
+
+        marker replaces the symbol of the first new box (the month
+        marker). Boxes added with reversal are drawn as u or d.
+        """
+        if self.direction == 'x':
+            first = self.high + 1
+            if index < first:
+                return
+            self.high = index
+        else:
+            first = self.low - 1
+            if index > first:
+                return
+            self.low = index
+        self._offsets.append(self._get_offset(first))
+        self._dates.append(date)
+        if marker is not None:
+            self.markers[first] = marker
+        if reversal:
+            self.reversal_boxes = len(self)
+
+    def date(self, index):
+        """Get the date the box at index was filled."""
+        position = bisect_right(self._offsets, self._get_offset(index))
+        return self._dates[position - 1]
+
+    def symbol(self, index):
+        """Get the symbol drawn for the box at index."""
+        marker = self.markers.get(index)
+        if marker is not None:
+            return marker
+        if self._get_offset(index) < self.reversal_boxes:
+            return 'u' if self.direction == 'x' else 'd'
+        return self.direction
+
+    def shift(self, boxes):
+        """Move the column up the scale by a number of boxes."""
+        self.low += boxes
+        self.high += boxes
+        self.markers = {index + boxes: marker
+                        for index, marker in self.markers.items()}
+
+    def _get_offset(self, index):
+        if self.direction == 'x':
+            return index - self.low
+        return self.high - index
+
+
+class PFEngine(object):
+    """The state of a point and figure chart, updated one bar at a time.
+
+    update() applies one bar (or one trade, with high equal to low) and
+    sets action, move and scale_index for it, exactly as PFChart has
+    always built its columns. The work per update is a scale lookup or
+    two plus, when boxes are added, a constant amount of bookkeeping.
+    """
+
+    def __init__(self, scale, reversal, retain=None):
+        """Initialize an engine with no columns.
+
+        If retain is given, only the last retain to 2 * retain columns
+        are kept; the low and high indexes of older columns are kept in
+        extents, which is all the trend lines need of them.
+        """
+        self.scale = scale
+        self.reversal = reversal
+        self.retain = retain
+        self.columns = []
+        self.dropped = 0
+        self.extents = array('l')
+        self.support_lines = []
+        self.resistance_lines = []
+        self.direction = 'x'
+        self.signal = 'none'
+        self.index = None
+        self.month = None
+        self.prior_high_index = len(scale) - 1
+        self.prior_low_index = 0
+        self.action = 'none'
+        self.move = 0
+        self.scale_index = None
+
+    def __getstate__(self):
+        """Return the state to pickle, leaving out the scale.
+
+        The scale is rebuilt from the chart's data, so it must be set
+        again on the unpickled engine.
+        """
+        state = self.__dict__.copy()
+        state['scale'] = None
+        return state
+
+    @property
+    def column_index(self):
+        """Get the number of the current column, starting at 1."""
+        return self.dropped + len(self.columns)
+
+    def get_extent(self, column_index):
+        """Get the (low, high) scale indexes of a column, retained or not."""
+        if column_index > self.dropped:
+            column = self.columns[column_index - self.dropped - 1]
+            return column.low, column.high
+        position = 2 * (column_index - 1)
+        return self.extents[position], self.extents[position + 1]
+
+    def shift(self, boxes):
+        """Move every index up by a number of boxes.
+
+        Used when boxes are added below the bottom of the scale.
+        """
+        if boxes == 0:
+            return
+        if self.index is not None:
+            self.index += boxes
+        if self.scale_index is not None:
+            self.scale_index += boxes
+        self.prior_high_index += boxes
+        self.prior_low_index += boxes
+        for position in range(len(self.extents)):
+            self.extents[position] += boxes
+        for column in self.columns:
+            column.shift(boxes)
+        for line in self.support_lines:
+            line[1] += boxes
+        for line in self.resistance_lines:
+            line[1] += boxes
+
+    def update(self, date, high, low, month):
+        """Apply one bar to the chart.
+
+        month is the month marker drawn on the first box added in a new
+        month. Returns False for the very first bar, which only starts
+        the first column, and True otherwise.
+        """
+        scale = self.scale
+        self.action = 'none'
+        self.move = 0
+        if month != self.month:
+            marker = month
+        else:
+            marker = None
+
+        index = self.index
+        if index is None:
+            # First day - set the starting index based
+            # on the high and 'x' direction
+            index = scale.index(high, 'x')
+            column = PFColumn('x', index)
+            column.add_boxes(index, date)
+            self.columns.append(column)
+            self.index = index
+            self.scale_index = index
+            self.month = month
+            return False
+
+        if self.direction == 'x':
+            scale_index = scale.index(high, 'x')
+
+            if scale_index > index:
+                # new high
+                self.action = 'x'
+                self.move = scale_index - index
+
+                if (self.signal != 'buy'
+                        and scale_index > self.prior_high_index):
+                    self.signal = 'buy'
+
+                self.columns[-1].add_boxes(scale_index, date, marker)
+                self.index = scale_index
+                self.month = month
+            else:
+                # check for reversal
+                x_scale_index = scale_index
+                scale_index = scale.index(low, 'o')
+                if index - scale_index >= self.reversal:
+                    # reversal
+                    self.action = 'reverse x->o'
+                    self.move = index - scale_index
+
+                    if (self.signal != 'sell'
+                            and scale_index < self.prior_low_index):
+                        self.signal = 'sell'
+
+                    self.prior_high_index = index
+                    self.resistance_lines.append([self.column_index,
+                                                  index + 1])
+                    column = PFColumn('o', index - 1)
+                    column.add_boxes(scale_index, date, marker,
+                                     reversal=True)
+                    self._add_column(column)
+                    self.direction = 'o'
+                    self.index = scale_index
+                    self.month = month
+                else:
+                    # no reversal - reset the scale_index
+                    scale_index = x_scale_index
+        else:
+            # in an 'o' column
+            scale_index = scale.index(low, 'o')
+            if scale_index < index:
+                # new low
+                self.action = 'o'
+                self.move = index - scale_index
+
+                if (self.signal != 'sell'
+                        and scale_index < self.prior_low_index):
+                    self.signal = 'sell'
+
+                self.columns[-1].add_boxes(scale_index, date, marker)
+                self.index = scale_index
+                self.month = month
+            else:
+                # check for reversal
+                o_scale_index = scale_index
+                scale_index = scale.index(high, 'x')
+                if scale_index - index >= self.reversal:
+                    # reversal
+                    self.action = 'reverse o->x'
+                    self.move = scale_index - index
+
+                    if (self.signal != 'buy'
+                            and scale_index > self.prior_high_index):
+                        self.signal = 'buy'
+
+                    self.prior_low_index = index
+                    self.support_lines.append([self.column_index,
+                                               index - 1])
+                    column = PFColumn('x', index + 1)
+                    column.add_boxes(scale_index, date, marker,
+                                     reversal=True)
+                    self._add_column(column)
+                    self.direction = 'x'
+                    self.index = scale_index
+                    self.month = month
+                else:
+                    # no reversal - reset the scale_index
+                    scale_index = o_scale_index
+
+        self.scale_index = scale_index
+        return True
+
+    def join(self, engine, column_index):
+        """Continue with the columns engine built from column_index on.
+
+        Both engines must be on the same scale and have reversed into
+        the same state on the same bar, starting this engine's current
+        column and engine's column column_index. From then on they build
+        the same columns, so this engine takes over engine's later
+        columns, trend lines and end state. engine is left unusable.
+        """
+        shift = self.column_index - column_index
+        current = self.columns[-1]
+        if column_index > engine.dropped:
+            later = engine.columns[column_index - engine.dropped - 1:]
+            # The month marker on the first box depends on the bars
+            # before the reversal, so this engine's is kept
+            first = later[0]
+            box = first.low if first.direction == 'x' else first.high
+            marker = current.markers.get(box)
+            if marker is None:
+                first.markers.pop(box, None)
+            else:
+                first.markers[box] = marker
+            self.columns[-1:] = later
+        else:
+            # engine no longer has the column, only its extent
+            for column in self.columns[:-1]:
+                self.extents.append(column.low)
+                self.extents.append(column.high)
+            self.extents.extend(engine.extents[2 * (column_index - 1):])
+            self.columns = engine.columns
+            self.dropped = engine.dropped + shift
+        self.support_lines.extend([line[0] + shift, line[1]]
+                                  for line in engine.support_lines
+                                  if line[0] >= column_index)
+        self.resistance_lines.extend([line[0] + shift, line[1]]
+                                     for line in engine.resistance_lines
+                                     if line[0] >= column_index)
+        for name in ['direction', 'signal', 'index', 'month',
+                     'prior_high_index', 'prior_low_index', 'action',
+                     'move', 'scale_index']:
+            setattr(self, name, getattr(engine, name))
+        self._drop_columns()
+
+    def _add_column(self, column):
+        self.columns.append(column)
+        self._drop_columns()
+
+    def _drop_columns(self):
+        columns = self.columns
+        if self.retain is not None and len(columns) > 2 * self.retain:
+            # Drop columns in batches so the cost per column stays
+            # constant
+            count = len(columns) - self.retain
+            for old in columns[:count]:
+                self.extents.append(old.low)
+                self.extents.append(old.high)
+            del columns[:count]
+            self.dropped += count
+
+
+class PFBuilder(object):
+    """Build a chart from live bars or individual trades.
+
+    Unlike PFChart, no price range is known in advance, so the scale
+    starts around the first price and is widened whenever a price falls
+    outside it. Prices are not kept, so memory grows only with the
+    number of columns, however many trades are applied.
+    """
+
+    TWOPLACES = Decimal('0.01')
+    MONTHS = '123456789ABC'
+
+    # Boxes added beyond the price when a point scale is widened
+    POINT_MARGIN = 100
+
+    def __init__(self, box_size=.01, reversal=3, scale_mode='percent'):
+        """Initialize the builder."""
+        self.box_size = Decimal(box_size).quantize(PFBuilder.TWOPLACES)
+        self.reversal = int(reversal)
+        self.scale_mode = scale_mode
+        self._scale_class = get_scale_class(scale_mode)
+        self.engine = None
+        self.count = 0
+
+    def add_bar(self, timestamp, high, low):
+        """Apply a bar. timestamp is a 'YYYY-MM-DD[ HH:MM[:SS]]' string.
+
+        Returns False for the first bar, which only starts the chart.
+        """
+        high = self._get_price(high)
+        low = self._get_price(low)
+        engine = self.engine
+        if engine is None:
+            scale = self._scale_class(self.box_size, *self._get_range(low,
+                                                                      high))
+            engine = self.engine = PFEngine(scale, self.reversal)
+        else:
+            scale = engine.scale
+            if low < scale[0] or high >= scale[len(scale) - 1]:
+                engine.shift(scale.extend(*self._get_range(low, high)))
+                # Until the first reversal the prior high and low are
+                # the ends of the scale, which have just moved
+                if len(engine.resistance_lines) == 0:
+                    engine.prior_high_index = len(scale) - 1
+                if len(engine.support_lines) == 0:
+                    engine.prior_low_index = 0
+        self.count += 1
+        return engine.update(timestamp, high, low,
+                             PFBuilder.MONTHS[int(timestamp[5:7]) - 1])
+
+    def add_tick(self, timestamp, price):
+        """Apply a single trade."""
+        return self.add_bar(timestamp, price, price)
+
+    def add_ticks(self, ticks):
+        """Apply an iterable of (timestamp, price) trades."""
+        for timestamp, price in ticks:
+            self.add_bar(timestamp, price, price)
+
+    def _get_range(self, low, high):
+        # Widen the scale well past the prices so that it is rarely
+        # extended again
+        if self.scale_mode == 'point':
+            margin = self.box_size * PFBuilder.POINT_MARGIN
+            return low - margin, high + margin
+        return low / 2, high * 2
+
+    def _get_price(self, value):
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        return value.quantize(PFBuilder.TWOPLACES)
@@ -8,10 +8,17 @@ import datetime
 import logging
 import os
 import re
-import requests
 import time
+import zlib
 
-import urllib.parse
+from pypf.archive import PriceArchive
+from pypf.packing import pack_records
+from pypf.packing import unpack_records
+from pypf.series import BarColumns
+from pypf.series import BarSeries
+from pypf.stats import Stats
+from pypf.validate import BarValidator
+from pypf.validate import QualityReport
 
 
 class Instrument(object):
@@ -19,15 +26,24 @@ class Instrument(object):
 
     TWOPLACES = Decimal('0.01')
 
+    # The bars packed into columns when an instrument is pickled
+    PACKED_DATA = ['daily_historical_data', 'weekly_historical_data',
+                   'monthly_historical_data']
+
+    # The number of intervals of resampled intraday bars that are kept
+    RESAMPLED_INTERVALS = 2
+
     def __init__(self, symbol, force_download=False, force_cache=False,
                  period=10, debug=False, data_directory='~/.pypf/data',
-                 data_file=''):
+                 data_file='', profile=False):
         """Initialize the common functionality for all Instruments."""
         self._log = logging.getLogger(self.__class__.__name__)
         if debug is True:
             self._log.setLevel(logging.DEBUG)
             self._log.debug(self)
 
+        self.stats = Stats(profile, self._log)
+
         self._data_directory = ''
         self._data_file = ''
 
@@ -35,11 +51,63 @@ class Instrument(object):
         self.data_file = data_file
         self.force_cache = force_cache
         self.force_download = force_download
+        self.intraday_historical_data = BarColumns()
         self.daily_historical_data = OrderedDict()
         self.weekly_historical_data = OrderedDict()
         self.monthly_historical_data = OrderedDict()
+        self._resampled_intraday_data = OrderedDict()
+        self._series = {}
+        self._average_true_ranges = {}
+        self.quality_report = None
         self.period = int(period)
         self.symbol = symbol
+        self.archive = False
+        self._partial = False
+
+    def __getstate__(self):
+        """Return a compact state to pickle.
+
+        The logger and stats are recreated when unpickled, the bars are
+        packed into columns (intraday bars already are) and resampled
+        intraday bars are dropped, so an instrument is cheap to send to
+        a worker process.
+        """
+        state = self.__dict__.copy()
+        state['_log'] = self._log.level
+        state['stats'] = self.stats.enabled
+        state['_resampled_intraday_data'] = OrderedDict()
+        state['_series'] = {}
+        packed_data = state.pop('_packed_data', {})
+        for name in Instrument.PACKED_DATA:
+            if name in state:
+                state[name] = pack_records(state[name])
+            else:
+                state[name] = packed_data[name]
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state returned by __getstate__.
+
+        The bars stay packed until they are first used.
+        """
+        level = state.pop('_log')
+        profile = state.pop('stats')
+        state['_packed_data'] = {name: state.pop(name)
+                                 for name in Instrument.PACKED_DATA}
+        self.__dict__.update(state)
+        self._log = logging.getLogger(self.__class__.__name__)
+        if level == logging.DEBUG:
+            self._log.setLevel(logging.DEBUG)
+        self.stats = Stats(profile, self._log)
+
+    def __getattr__(self, name):
+        """Unpack bars left packed by __setstate__ when first used."""
+        packed_data = self.__dict__.get('_packed_data')
+        if packed_data is None or name not in packed_data:
+            raise AttributeError(name)
+        data = unpack_records(packed_data.pop(name), OrderedDict)
+        setattr(self, name, data)
+        return data
 
     @property
     def data_directory(self):
@@ -50,13 +118,12 @@ class Instrument(object):
     def data_directory(self, value):
         value = os.path.expanduser(value)
         if os.path.isdir(value) is False:
-            self._log.info('creating data directory ' + value)
+            self._log.info('creating data directory %s', value)
             os.makedirs(value)
         self._data_directory = value
         self._data_path = os.path.join(value, self.data_file)
-        self._log.debug('set self._data_directory to '
-                        + str(self._data_directory))
-        self._log.debug('updating self._data_path to ' + str(self._data_path))
+        self._log.debug('set self._data_directory to %s', self._data_directory)
+        self._log.debug('updating self._data_path to %s', self._data_path)
 
     @property
     def data_file(self):
@@ -67,9 +134,18 @@ class Instrument(object):
     def data_file(self, value):
         self._data_file = value
         self._data_path = os.path.join(self.data_directory, value)
-        self._log.debug('set self._data_file to '
-                        + str(self._data_file))
-        self._log.debug('updating self._data_path to ' + str(self._data_path))
+        self._log.debug('set self._data_file to %s', self._data_file)
+        self._log.debug('updating self._data_path to %s', self._data_path)
+
+    @property
+    def archive_path(self):
+        """Get the path of the archive of the daily bars.
+
+        The archive is kept in the data directory even when the data
+        file is elsewhere.
+        """
+        name = os.path.splitext(os.path.basename(self.data_path))[0]
+        return os.path.join(self.data_directory, name + '.pfa')
 
     @property
     def data_path(self):
@@ -90,8 +166,7 @@ class Instrument(object):
     @force_cache.setter
     def force_cache(self, value):
         self._force_cache = value
-        self._log.debug('set self._force_cache to '
-                        + str(self._force_cache))
+        self._log.debug('set self._force_cache to %s', self._force_cache)
 
     @property
     def force_download(self):
@@ -101,8 +176,7 @@ class Instrument(object):
     @force_download.setter
     def force_download(self, value):
         self._force_download = value
-        self._log.debug('set self._force_download to '
-                        + str(self._force_download))
+        self._log.debug('set self._force_download to %s', self._force_download)
 
     @property
     def period(self):
@@ -121,12 +195,9 @@ class Instrument(object):
         self._start_date = int(time.mktime(datetime
                                            .datetime(y, m, d).timetuple()))
         self._end_date = int(time.time())
-        self._log.debug('set self._period to '
-                        + str(self._period))
-        self._log.debug('updating self._start_date to '
-                        + str(self._start_date))
-        self._log.debug('updating self._end_date to '
-                        + str(self._end_date))
+        self._log.debug('set self._period to %s', self._period)
+        self._log.debug('updating self._start_date to %s', self._start_date)
+        self._log.debug('updating self._end_date to %s', self._end_date)
 
     @property
     def symbol(self):
@@ -136,20 +207,12 @@ class Instrument(object):
     @symbol.setter
     def symbol(self, value):
         self._symbol = value.upper()
-        self._log.debug('set self._symbol to '
-                        + str(self._symbol))
-
-    def populate_data(self):
-        """Populate the instrument with data.
+        self.stats.context['symbol'] = self._symbol
+        self._log.debug('set self._symbol to %s', self._symbol)
 
-        Data will only be downloaded if the data file doesn't exist or
-        if the modification time of the file does not equal the current
-        date. This behavior can be overridden with the --force-cache
-        and --force-download options.
-        """
-        self.daily_historical_data = OrderedDict()
-        self.weekly_historical_data = OrderedDict()
-        self.monthly_historical_data = OrderedDict()
+    @property
+    def download_required(self):
+        """Return True if populate_data would download the data."""
         download_data = False
 
         if self.force_download:
@@ -174,34 +237,329 @@ class Instrument(object):
 
         if self.force_cache:
             download_data = False
+        return download_data
+
+    def has_bars(self, bars=None):
+        """Return True if the last bars daily bars are loaded.
 
-        if download_data:
-            self._log.info('downloading data for ' + self.symbol)
-            self._download_data()
+        If bars is None, all of the daily bars must be loaded.
+        """
+        if len(self.daily_historical_data) == 0:
+            return False
+        if not self._partial:
+            return True
+        return bars is not None and len(self.daily_historical_data) >= bars
+
+    def populate_data(self, bars=None):
+        """Populate the instrument with data.
+
+        Data will only be downloaded if the data file doesn't exist or
+        if the modification time of the file does not equal the current
+        date. This behavior can be overridden with the --force-cache
+        and --force-download options.
+
+        If archive is True, the daily bars are read from the archive
+        when it is up to date, and otherwise from the data file, which
+        is then archived. If bars is given, only the archive's last
+        years holding at least that many daily bars are read.
+        """
+        self._partial = False
+        self.intraday_historical_data = BarColumns()
+        self.daily_historical_data = OrderedDict()
+        self.weekly_historical_data = OrderedDict()
+        self.monthly_historical_data = OrderedDict()
+        self._resampled_intraday_data = OrderedDict()
+        self._series = {}
+        self._average_true_ranges = {}
+
+        stats = self.stats
+        stats.reset()
+        if self.download_required:
+            self._log.info('downloading data for %s', self.symbol)
+            with stats.phase('download_data'):
+                self._download_data()
         else:
-            self._log.info('using cached data for ' + self.symbol)
+            self._log.info('using cached data for %s', self.symbol)
+
+        with stats.phase('set_daily_data'):
+            if not self._read_archive(bars):
+                self._set_daily_data()
+                self._write_archive()
+        with stats.phase('set_period_data'):
+            self._set_period_data()
+
+        if stats.enabled:
+            stats.count('intraday_bars', len(self.intraday_historical_data))
+            stats.count('daily_bars', len(self.daily_historical_data))
+            stats.count('weekly_bars', len(self.weekly_historical_data))
+            stats.count('monthly_bars', len(self.monthly_historical_data))
+            stats.count('file_bytes', os.path.getsize(self.data_path))
+
+    def check_data(self):
+        """Validate the cached data file and return a QualityReport."""
+        report = QualityReport(self.symbol)
+        with open(self.data_path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader, None)
+            for fields in BarValidator().validate(reader, report):
+                pass
+        return report
+
+    def get_average_true_range(self, period, interval='d', bars=None,
+                               end_date=None):
+        """Get the average true range of the last bars of an interval.
+
+        The true ranges are averaged over the first period bars and then
+        smoothed as Wilder did, in a single pass. bars defaults to all
+        of the data up to end_date, which defaults to the last bar.
+        Results are cached until the data is repopulated.
+        """
+        key = (period, interval, bars, end_date)
+        average = self._average_true_ranges.get(key)
+        if average is not None:
+            return average
+
+        data = self.get_series(interval, end_date)
+        if bars is not None:
+            data = data.last_n(bars)
+        if len(data) == 0:
+            raise ValueError('no data to compute the average true range '
+                             'of ' + self.symbol)
+        values = data.values()
+
+        total = Decimal(0)
+        count = 0
+        close = None
+        for bar in values:
+            true_range = bar['High'] - bar['Low']
+            if close is not None:
+                if bar['High'] - close > true_range:
+                    true_range = bar['High'] - close
+                if close - bar['Low'] > true_range:
+                    true_range = close - bar['Low']
+            close = bar['Close']
+            count += 1
+            if count <= period:
+                total += true_range
+                average = total / count
+            else:
+                average = (average * (period - 1) + true_range) / period
+
+        self._average_true_ranges[key] = average
+        return average
 
-        self._set_daily_data()
-        self._set_weekly_data()
-        self._set_monthly_data()
+    def get_series(self, interval='d', end_date=None):
+        """Get the bars of an interval as a BarSeries indexed by date.
+
+        interval is d, w, m or a number of minutes such as 5min. The
+        index is built once and kept until the data is repopulated.
+
+        If end_date is given, the bars are those known at the end of
+        that date: a view of the bars up to it, with the week or month
+        in progress resampled from the daily bars up to end_date.
+        """
+        if end_date is not None:
+            return self._get_series_as_of(interval, end_date)
+        series = self._series.get(interval)
+        if series is not None:
+            return series
+
+        if interval == 'd':
+            data = self.daily_historical_data
+        elif interval == 'w':
+            data = self.weekly_historical_data
+        elif interval == 'm':
+            data = self.monthly_historical_data
+        else:
+            # Resampled bars are cached by get_intraday_data, and the
+            # view shares their timestamps, so it is not kept here
+            data = self.get_intraday_data(int(interval[:-3]))
+            return BarSeries(data, data.dates)
+        series = BarSeries(data)
+        self._series[interval] = series
+        return series
+
+    def _get_series_as_of(self, interval, end_date):
+        series = self.get_series(interval).window(end_date=end_date)
+        if interval not in ['w', 'm']:
+            return series
+
+        # Weeks and months are keyed by their last day, so the one in
+        # progress on end_date is after it
+        days = self.get_series('d').window(end_date=end_date)
+        last_date = series.last_date
+        if last_date is not None:
+            days = days.window(start_date=last_date + '\uffff')
+        if len(days) == 0:
+            return series
+        bar = None
+        for day in days.values():
+            if bar is None:
+                bar = self._start_period(day)
+            else:
+                self._extend_period(bar, day)
+        return series.with_last(bar)
+
+    def get_intraday_data(self, minutes):
+        """Get intraday bars resampled to a number of minutes.
+
+        Returns a BarColumns keyed by the 'YYYY-MM-DD HH:MM' time each
+        bar starts; each day's first bar starts at midnight plus a
+        multiple of minutes. The last RESAMPLED_INTERVALS intervals
+        used are cached until the data is repopulated.
+        """
+        cache = self._resampled_intraday_data
+        data = cache.get(minutes)
+        if data is not None:
+            cache.move_to_end(minutes)
+            return data
+
+        data = self.intraday_historical_data.resample(minutes)
+        cache[minutes] = data
+        while len(cache) > Instrument.RESAMPLED_INTERVALS:
+            cache.popitem(last=False)
+        return data
+
+    def _validate_rows(self, rows, previous=None):
+        """Yield the good rows of a download and keep the report.
+
+        Problems are logged, and quarantined rows are written to
+        SYMBOL_quarantine.csv in the data directory.
+        """
+        report = QualityReport(self.symbol)
+        self.quality_report = report
+        for fields in BarValidator().validate(rows, report, previous):
+            yield fields
+        if not report.clean:
+            self._log.warning('%s', report.summary())
+        if len(report.quarantine) > 0:
+            report.write_quarantine(os.path.join(
+                self.data_directory, self.symbol + '_quarantine.csv'))
 
     def _set_daily_data(self):
         self._log.debug('setting daily historical data')
         csv_file = open(self.data_path, newline='')
         reader = csv.DictReader(csv_file)
+        day = None
         for row in reader:
             row['Open'] = Decimal(row['Open']).quantize(Instrument.TWOPLACES)
             row['High'] = Decimal(row['High']).quantize(Instrument.TWOPLACES)
             row['Low'] = Decimal(row['Low']).quantize(Instrument.TWOPLACES)
             row['Close'] = Decimal(row['Close']).quantize(Instrument.TWOPLACES)
             row['Volume'] = int(row['Volume'])
-            self.daily_historical_data[row['Date']] = row
-
-    def _set_weekly_data(self):
-        self._log.debug('setting weekly historical data')
+            if len(row['Date']) == 10:
+                self.daily_historical_data[row['Date']] = row
+                continue
+
+            # Intraday bars are timestamped 'YYYY-MM-DD HH:MM[:SS]'; they
+            # are kept in columns and also rolled up into daily bars
+            self.intraday_historical_data.append(row['Date'], row['Open'],
+                                                 row['High'], row['Low'],
+                                                 row['Close'], row['Volume'])
+            date = row['Date'][:10]
+            if day is None or day['Date'] != date:
+                day = {'Date': date, 'Open': row['Open'],
+                       'High': row['High'], 'Low': row['Low'],
+                       'Close': row['Close'], 'Volume': row['Volume']}
+                self.daily_historical_data[date] = day
+            else:
+                if row['High'] > day['High']:
+                    day['High'] = row['High']
+                if row['Low'] < day['Low']:
+                    day['Low'] = row['Low']
+                day['Close'] = row['Close']
+                day['Volume'] += row['Volume']
+        csv_file.close()
+
+    def _get_source(self):
+        """Get the signature of the files the daily bars are read from."""
+        source = []
+        for path in self._get_source_paths():
+            if os.path.isfile(path):
+                status = os.stat(path)
+                source.append([os.path.basename(path), status.st_mtime_ns,
+                               status.st_size])
+        return source
+
+    def _get_source_paths(self):
+        return [self.data_path]
+
+    def _read_archive(self, bars):
+        if not self.archive:
+            return False
+        archive = PriceArchive(self.archive_path)
+        try:
+            if not archive.exists or archive.source != self._get_source():
+                return False
+            self.daily_historical_data = archive.read(bars)
+        except (OSError, ValueError, KeyError, zlib.error) as e:
+            self._log.warning('unable to read %s: %r', self.archive_path, e)
+            self.daily_historical_data = OrderedDict()
+            return False
+        self._partial = len(self.daily_historical_data) < archive.bars
+        self._log.debug('read %d bars from %s',
+                        len(self.daily_historical_data), self.archive_path)
+        return True
 
-    def _set_monthly_data(self):
-        self._log.debug('setting monthly historical data')
+    def _write_archive(self):
+        # Only daily bars are archived; intraday files are read as they
+        # are
+        if (not self.archive or len(self.daily_historical_data) == 0
+                or len(self.intraday_historical_data) > 0):
+            return
+        try:
+            PriceArchive(self.archive_path).write(self.daily_historical_data,
+                                                  self._get_source())
+        except OSError as e:
+            self._log.warning('unable to write %s: %r', self.archive_path, e)
+
+    def _set_period_data(self):
+        """Resample the daily bars into weekly and monthly bars.
+
+        Both are built in the same pass over the daily bars. A bar is
+        keyed by the date of the last day in it, so the most recent week
+        or month is included while it is still in progress.
+        """
+        self._log.debug('setting weekly and monthly historical data')
+        weeks = []
+        months = []
+        week = None
+        month = None
+        week_start = None
+        for date, row in self.daily_historical_data.items():
+            day = datetime.date(int(date[:4]), int(date[5:7]),
+                                int(date[8:10])).toordinal()
+            # Weeks start on Monday
+            start = day - (day - 1) % 7
+            if start != week_start:
+                week_start = start
+                week = self._start_period(row)
+                weeks.append(week)
+            else:
+                self._extend_period(week, row)
+            if month is None or month['Date'][:7] != date[:7]:
+                month = self._start_period(row)
+                months.append(month)
+            else:
+                self._extend_period(month, row)
+        self.weekly_historical_data = OrderedDict(
+            (bar['Date'], bar) for bar in weeks)
+        self.monthly_historical_data = OrderedDict(
+            (bar['Date'], bar) for bar in months)
+
+    def _start_period(self, row):
+        return {'Date': row['Date'], 'Open': row['Open'], 'High': row['High'],
+                'Low': row['Low'], 'Close': row['Close'],
+                'Volume': row['Volume']}
+
+    def _extend_period(self, bar, row):
+        if row['High'] > bar['High']:
+            bar['High'] = row['High']
+        if row['Low'] < bar['Low']:
+            bar['Low'] = row['Low']
+        bar['Close'] = row['Close']
+        bar['Volume'] += row['Volume']
+        bar['Date'] = row['Date']
 
     def _download_data(self):
         """To be implemented in derived classes.
@@ -214,22 +572,217 @@ class Instrument(object):
         raise
 
 
+class CsvSecurity(Instrument):
+    """Security whose data comes from an existing csv file.
+
+    The file is never downloaded or rewritten. It must have the heading
+    Date,Open,High,Low,Close,Volume, and dates may be timestamps
+    ('YYYY-MM-DD HH:MM[:SS]') for intraday bars.
+    """
+
+    def __init__(self, symbol, data_file, data_directory='~/.pypf/data',
+                 debug=False, profile=False):
+        """Initialize the security."""
+        super().__init__(symbol, False, True, 10, debug, data_directory,
+                         data_file, profile)
+
+    def _download_data(self):
+        raise ValueError('csv data for ' + self.symbol
+                         + ' can not be downloaded')
+
+
+class DerivedInstrument(Instrument):
+    """Instrument whose prices are computed from other instruments.
+
+    method 'ratio' divides the first instrument's prices by each of the
+    others (relative strength), scaled by multiplier so that the ratio
+    keeps its precision at two places; 'spread' subtracts them. Only
+    dates that every instrument has are kept. The open and close are
+    computed from the opens and closes, and the high and low from the
+    highs and lows, widened if needed to include the open and close.
+    A spread can fall to zero or below, which only a chart with
+    scale_mode 'point' can draw.
+
+    The instruments are populated only if they have no data yet, so a
+    benchmark can be loaded once and shared by many derived instruments.
+    Each instrument reads its archive if its own archive is set; the
+    instruments themselves are never changed.
+    """
+
+    def __init__(self, instruments, method='ratio', multiplier=100,
+                 debug=False, profile=False):
+        """Initialize the derived instrument."""
+        if len(instruments) < 2:
+            raise ValueError('a derived instrument needs at least '
+                             'two instruments.')
+        if method not in ['ratio', 'spread']:
+            raise ValueError("incorrect method: "
+                             "valid methods are ratio, spread")
+        self.instruments = instruments
+        self.method = method
+        self.multiplier = Decimal(multiplier)
+        separator = '/' if method == 'ratio' else '-'
+        symbol = separator.join(i.symbol for i in instruments)
+        first = instruments[0]
+        super().__init__(symbol, False, True, first.period, debug,
+                         first.data_directory, first.data_file, profile)
+
+    @property
+    def download_timestamp(self):
+        """Get the datetime the oldest of the instruments was downloaded."""
+        return min(i.download_timestamp for i in self.instruments)
+
+    @property
+    def download_required(self):
+        """Return True if any of the instruments would be downloaded."""
+        return any(i.download_required for i in self.instruments)
+
+    def populate_data(self, bars=None):
+        """Populate the instruments if needed and compute the prices."""
+        self.intraday_historical_data = BarColumns()
+        self.daily_historical_data = OrderedDict()
+        self.weekly_historical_data = OrderedDict()
+        self.monthly_historical_data = OrderedDict()
+        self._resampled_intraday_data = OrderedDict()
+        self._series = {}
+        self._average_true_ranges = {}
+
+        stats = self.stats
+        stats.reset()
+        with stats.phase('populate_instruments'):
+            for instrument in self.instruments:
+                if not instrument.has_bars(bars):
+                    instrument.populate_data(bars)
+        self._partial = any(i._partial for i in self.instruments)
+        with stats.phase('set_daily_data'):
+            self._set_daily_data()
+        with stats.phase('set_period_data'):
+            self._set_period_data()
+
+        if stats.enabled:
+            stats.count('daily_bars', len(self.daily_historical_data))
+            stats.count('weekly_bars', len(self.weekly_historical_data))
+            stats.count('monthly_bars', len(self.monthly_historical_data))
+
+    def _set_daily_data(self):
+        self._log.debug('setting daily historical data')
+        first = self.instruments[0].daily_historical_data
+        others = [i.daily_historical_data for i in self.instruments[1:]]
+        ratio = self.method == 'ratio'
+        multiplier = self.multiplier
+        for date in first:
+            bar = first[date]
+            open_price = bar['Open']
+            high = bar['High']
+            low = bar['Low']
+            close = bar['Close']
+            if ratio:
+                open_price = open_price * multiplier
+                high = high * multiplier
+                low = low * multiplier
+                close = close * multiplier
+            for data in others:
+                other = data.get(date)
+                if other is None:
+                    break
+                if ratio:
+                    open_price = open_price / other['Open']
+                    high = high / other['High']
+                    low = low / other['Low']
+                    close = close / other['Close']
+                else:
+                    open_price = open_price - other['Open']
+                    high = high - other['High']
+                    low = low - other['Low']
+                    close = close - other['Close']
+            else:
+                open_price = open_price.quantize(Instrument.TWOPLACES)
+                close = close.quantize(Instrument.TWOPLACES)
+                high = max(high.quantize(Instrument.TWOPLACES), open_price,
+                           close)
+                low = min(low.quantize(Instrument.TWOPLACES), open_price,
+                          close)
+                self.daily_historical_data[date] = {
+                    'Date': date, 'Open': open_price, 'High': high,
+                    'Low': low, 'Close': close, 'Volume': bar['Volume']}
+
+    def _download_data(self):
+        raise ValueError(self.symbol + ' is derived and can not be '
+                         'downloaded')
+
+
 class YahooSecurity(Instrument):
-    """Security instrument that uses Yahoo as the datasource."""
+    """Security instrument that uses Yahoo as the datasource.
+
+    Unadjusted prices are kept in SYMBOL_yahoo_raw.csv and dividends and
+    splits in SYMBOL_yahoo_events.csv. Prices are adjusted for dividends
+    when the data is loaded, so a refresh only appends the new bars and
+    rewrites the small events file. Yahoo's prices are already adjusted
+    for splits, so a new split makes the next refresh download the
+    whole history again.
+
+    A SYMBOL_yahoo.csv of adjusted prices from earlier versions is used
+    until the data is next downloaded.
+    """
 
     def __init__(self, symbol, force_download=False, force_cache=False,
-                 period=10, debug=False, data_directory='~/.pypf/data'):
+                 period=10, debug=False, data_directory='~/.pypf/data',
+                 profile=False):
         """Initialize the security."""
         super().__init__(symbol, force_download, force_cache,
-                         period, debug, data_directory)
+                         period, debug, data_directory, profile=profile)
         self._log.info('formatting symbol for yahoo')
         self.symbol = self.symbol.replace('.', '-')
         self.data_file = (self.symbol
-                          + '_yahoo'
+                          + '_yahoo_raw'
                           + '.csv')
+        self._legacy_data = False
+        legacy_path = os.path.join(self.data_directory,
+                                   self.symbol + '_yahoo.csv')
+        if (not os.path.isfile(self.data_path)
+                and os.path.isfile(legacy_path)):
+            self.data_file = self.symbol + '_yahoo.csv'
+            self._legacy_data = True
+
+    @property
+    def events_path(self):
+        """Get the full path of the dividends and splits file."""
+        return os.path.join(self.data_directory,
+                            self.symbol + '_yahoo_events.csv')
+
+    def _get_source_paths(self):
+        return [self.data_path, self.events_path]
+
+    def get_adjustment_factors(self, dates, closes, events):
+        """Get the dividend adjustment factor of each bar.
+
+        dates and closes are the unadjusted bars in order and events the
+        (date, event, value) rows of the events file. A dividend paid on
+        an ex-date scales every earlier bar by 1 - dividend / the close
+        before the ex-date, so the factors are a cumulative product
+        taken from the last bar back.
+        """
+        dividends = sorted((date, Decimal(value))
+                           for date, event, value in events
+                           if event == 'dividend')
+        factors = [Decimal(1)] * len(dates)
+        factor = Decimal(1)
+        position = len(dividends) - 1
+        for index in range(len(dates) - 1, -1, -1):
+            while position >= 0 and dividends[position][0] > dates[index]:
+                if index + 1 < len(dates):
+                    # dates[index] is the last bar before the ex-date
+                    factor *= 1 - dividends[position][1] / closes[index]
+                position -= 1
+            factors[index] = factor
+        return factors
 
     def _get_cookie_crumb(self):
         """Return a tuple pair of cookie and crumb used in the request."""
+        # requests is only imported when a download actually happens;
+        # it is slow to import and most runs use cached data
+        import requests
+
         self._log.info('getting cookie and crumb')
         url = 'https://finance.yahoo.com/quote/%s/history' % (self.symbol)
         self._log.debug(url)
@@ -244,61 +797,136 @@ class YahooSecurity(Instrument):
                 crumb = crumb.replace(u'\\u002F', '/')
         return cookie, crumb
 
-    def _download_data(self):
-        cookie, crumb = self._get_cookie_crumb()
-        self._log.debug('cookie is ' + str(cookie))
-        self._log.debug('crumb is ' + str(crumb))
+    def _download_rows(self, cookie, crumb, start_date, events):
+        """Download rows of fields, without the heading."""
+        import requests
+
         api_url = ("https://query1.finance.yahoo.com/v7/finance/"
                    "download/%s?period1=%s&period2=%s&interval=%s"
-                   "&events=history&crumb=%s")
-        url = api_url % (self.symbol, self._start_date, self._end_date,
-                         '1d', crumb)
-        self._log.info('fetching data')
+                   "&events=%s&crumb=%s")
+        url = api_url % (self.symbol, start_date, self._end_date,
+                         '1d', events, crumb)
+        self._log.info('fetching %s', events)
         self._log.debug(url)
-        data = requests.get(url, headers={'User-agent': 'Mozilla/5.0'}, cookies={'B': cookie})
-        content = StringIO(data.content.decode("utf-8"))
-        self._log.info('saving data to ' + self.data_path)
-        with open(self.data_path, 'w', newline='') as csvfile:
-            first = True
-            for row in content.readlines():
-                if first is True:
-                    csvfile.write("Date,Open,High,Low,Close,Volume\n")
-                    first = False
-                    continue
-                # Yahoo provides an Adj Close - fields[5]
-                # We use it to compute a factor to adjust the data
-                fields = row.split(',')
-                new_row = []
-                factor = Decimal(fields[5]) / Decimal(fields[4])
-                new_row.append(str(fields[0]))
-                new_row.append(str((Decimal(fields[1]) * factor)
-                                   .quantize(Instrument.TWOPLACES)))
-                new_row.append(str((Decimal(fields[2]) * factor)
-                                   .quantize(Instrument.TWOPLACES)))
-                new_row.append(str((Decimal(fields[3]) * factor)
-                                   .quantize(Instrument.TWOPLACES)))
-                new_row.append(str((Decimal(fields[4]) * factor)
-                                   .quantize(Instrument.TWOPLACES)))
-                new_row.append(str(int(fields[6])))
-                write_row = ','.join(new_row) + "\n"
-                csvfile.write(write_row)
+        data = requests.get(url, headers={'User-agent': 'Mozilla/5.0'},
+                            cookies={'B': cookie})
+        self.stats.add('bytes_downloaded', len(data.content))
+        lines = data.content.decode("utf-8").splitlines()
+        return [line.split(',') for line in lines[1:] if line]
+
+    def _download_data(self):
+        cookie, crumb = self._get_cookie_crumb()
+        self._log.debug('cookie is %s', cookie)
+        self._log.debug('crumb is %s', crumb)
+
+        events = []
+        for fields in self._download_rows(cookie, crumb, self._start_date,
+                                          'div'):
+            events.append([fields[0], 'dividend', fields[1]])
+        for fields in self._download_rows(cookie, crumb, self._start_date,
+                                          'split'):
+            events.append([fields[0], 'split', fields[1]])
+        events.sort()
+
+        raw_path = os.path.join(self.data_directory,
+                                self.symbol + '_yahoo_raw.csv')
+        last_date = None
+        previous = None
+        if (not self.force_download and os.path.isfile(raw_path)
+                and self._get_splits(self._read_events()) ==
+                self._get_splits(events)):
+            with open(raw_path, newline='') as csvfile:
+                for row in csv.reader(csvfile):
+                    last_date = row[0]
+                    last_close = row[4]
+            if last_date == 'Date':
+                last_date = None
+            else:
+                previous = (last_date, Decimal(last_close))
+
+        if last_date is None:
+            rows = self._download_rows(cookie, crumb, self._start_date,
+                                       'history')
+            mode = 'w'
+        else:
+            start_date = int(time.mktime(datetime.datetime.strptime(
+                last_date, '%Y-%m-%d').timetuple())) + 86400
+            rows = [fields for fields in
+                    self._download_rows(cookie, crumb, start_date, 'history')
+                    if fields[0] > last_date]
+            mode = 'a'
+
+        # Yahoo's Close is unadjusted for dividends and its Adj Close
+        # (fields[5]) is not kept
+        rows = ([fields[0], fields[1], fields[2], fields[3], fields[4],
+                 fields[6] if len(fields) > 6 else '']
+                for fields in rows)
+        self._log.info('saving bars to %s', raw_path)
+        with open(raw_path, mode, newline='') as csvfile:
+            if mode == 'w':
+                csvfile.write("Date,Open,High,Low,Close,Volume\n")
+            for fields in self._validate_rows(rows, previous):
+                fields[5] = str(int(float(fields[5])))
+                csvfile.write(','.join(fields) + "\n")
+        with open(self.events_path, 'w', newline='') as csvfile:
+            csvfile.write("Date,Event,Value\n")
+            for event in events:
+                csvfile.write(','.join(event) + "\n")
+
+        self.data_file = self.symbol + '_yahoo_raw.csv'
+        self._legacy_data = False
         return True
 
+    def _get_splits(self, events):
+        return [event for event in events if event[1] == 'split']
+
+    def _read_events(self):
+        if not os.path.isfile(self.events_path):
+            return []
+        with open(self.events_path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader, None)
+            return [row for row in reader]
+
+    def _set_daily_data(self):
+        if self._legacy_data:
+            super()._set_daily_data()
+            return
+
+        self._log.debug('setting daily historical data')
+        with open(self.data_path, newline='') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+        closes = [Decimal(row['Close']) for row in rows]
+        factors = self.get_adjustment_factors([row['Date'] for row in rows],
+                                              closes, self._read_events())
+        twoplaces = Instrument.TWOPLACES
+        for row, close, factor in zip(rows, closes, factors):
+            row['Open'] = (Decimal(row['Open']) * factor).quantize(twoplaces)
+            row['High'] = (Decimal(row['High']) * factor).quantize(twoplaces)
+            row['Low'] = (Decimal(row['Low']) * factor).quantize(twoplaces)
+            row['Close'] = (close * factor).quantize(twoplaces)
+            row['Volume'] = int(row['Volume'])
+            self.daily_historical_data[row['Date']] = row
+
 
 class GoogleSecurity(Instrument):
     """Security instrument that uses Yahoo as the datasource."""
 
     def __init__(self, symbol, force_download=False, force_cache=False,
-                 period=10, debug=False, data_directory='~/.pypf/data'):
+                 period=10, debug=False, data_directory='~/.pypf/data',
+                 profile=False):
         """Initialize the security."""
         super().__init__(symbol, force_download, force_cache,
-                         period, debug, data_directory)
+                         period, debug, data_directory, profile=profile)
 
         self.data_file = (self.symbol
                           + '_google'
                           + '.csv')
 
     def _download_data(self):
+        import requests
+        import urllib.parse
+
         # Download data from Google and transform into Yahoo format
         api_url = ('http://www.google.com/finance/historical?')
         params = {
@@ -315,6 +943,7 @@ class GoogleSecurity(Instrument):
 
         self._log.debug(url)
         data = requests.get(url)
+        self.stats.add('bytes_downloaded', len(data.content))
         content = StringIO(data.content.decode("utf-8"))
         lines = content.readlines()
 
@@ -323,29 +952,33 @@ class GoogleSecurity(Instrument):
         lines.reverse()
         lines.pop()
 
-        self._log.info('saving data to ' + self.data_path)
+        self._log.info('saving data to %s', self.data_path)
         with open(self.data_path, 'w', newline='') as csvfile:
             csvfile.write("Date,Open,High,Low,Close,Volume\n")
-            for row in lines:
-                fields = row.split(',')
+            for fields in self._validate_rows(self._get_google_rows(lines)):
+                csvfile.write(','.join(fields) + "\n")
+        return True
+
+    def _get_google_rows(self, lines):
+        for row in lines:
+            fields = row.strip().split(',')
 
-                # Format the date
+            # Format the date
+            try:
                 fields[0] = (datetime.datetime
                              .strptime(fields[0], '%d-%b-%y')
                              .strftime('%Y-%m-%d'))
-
-                # Check for missing data
-                missing_data = False
-                for field in fields:
-                    if field == '-':
-                        missing_data = True
-                        break
-
-                if missing_data is True:
-                    self._log.warning('Missing data on ' + fields[0])
-                    # Skip the day
-                    continue
-                else:
-                    new_row = ','.join(fields)
-                    csvfile.write(new_row)
-        return True
+            except ValueError:
+                # Left for the validator to quarantine
+                pass
+            yield fields
+
+
+def get_instrument_class(provider):
+    """Return the Instrument class for a data provider (yahoo or google)."""
+    if provider == 'google':
+        return GoogleSecurity
+    elif provider == 'yahoo':
+        return YahooSecurity
+    raise ValueError("incorrect provider: "
+                     "valid providers are google, yahoo")
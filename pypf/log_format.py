@@ -0,0 +1,43 @@
+"""Classes to format log records as JSON lines for log aggregation."""
+from datetime import datetime
+from datetime import timezone
+
+import json
+import logging
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each log record as one JSON object per line.
+
+    The symbol, phase and duration (in seconds) attributes are included
+    when a record carries them, as the phase timings logged by
+    pypf.stats do.
+    """
+
+    EXTRA_FIELDS = ['symbol', 'phase', 'duration']
+
+    def format(self, record):
+        """Return the record as a JSON string."""
+        entry = {'time': datetime.fromtimestamp(record.created, timezone.utc)
+                 .isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'function': record.funcName,
+                 'message': record.getMessage()}
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def use_json_logging(level=logging.INFO):
+    """Switch the root logger's handlers to JSON lines at level."""
+    root = logging.getLogger()
+    if len(root.handlers) == 0:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        handler.setFormatter(JsonFormatter())
+    root.setLevel(level)
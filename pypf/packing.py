@@ -0,0 +1,74 @@
+"""Functions to pickle price records compactly.
+
+Bars and chart meta data are dicts of Decimals keyed by date. Pickled
+as they are, every Decimal is written as its class and its string, so
+shipping an instrument to a worker process is dominated by them.
+pack_records turns the records into columns instead: a column of
+Decimals or strings becomes one comma separated string, which converts
+back exactly, and a column of integers an array, which pickles as raw
+bytes.
+"""
+from array import array
+from decimal import Decimal
+
+
+def pack_records(records):
+    """Pack an OrderedDict of dicts with the same fields into columns.
+
+    Records whose fields differ are returned unchanged.
+    """
+    if len(records) == 0:
+        return None
+    values = list(records.values())
+    fields = list(values[0])
+    if any(len(record) != len(fields) for record in values):
+        return records
+
+    columns = []
+    for field in fields:
+        try:
+            column = [record[field] for record in values]
+        except KeyError:
+            return records
+        columns.append(_pack_column(column))
+    return (list(records), fields, columns)
+
+
+def unpack_records(packed, records_class):
+    """Return the records_class mapping packed by pack_records."""
+    if packed is None:
+        return records_class()
+    if not isinstance(packed, tuple):
+        return packed
+    keys, fields, columns = packed
+    columns = [_unpack_column(column) for column in columns]
+    return records_class(
+        (key, dict(zip(fields, values)))
+        for key, values in zip(keys, zip(*columns)))
+
+
+def _pack_column(column):
+    kinds = set(type(value) for value in column)
+    if kinds == {Decimal}:
+        return ('decimal', ','.join(map(str, column)))
+    if kinds == {str}:
+        text = ','.join(column)
+        if text.count(',') == len(column) - 1:
+            return ('str', text)
+    elif kinds == {int}:
+        try:
+            return ('int', array('q', column))
+        except OverflowError:
+            pass
+    return ('list', column)
+
+
+def _unpack_column(column):
+    kind, values = column
+    if kind == 'decimal':
+        return list(map(Decimal, values.split(',')))
+    if kind == 'str':
+        return values.split(',')
+    if kind == 'int':
+        return values.tolist()
+    return values
@@ -0,0 +1,328 @@
+"""Classes to write point and figure charts in formats other than text.
+
+Renderers write directly to a file-like object, piece by piece, so many
+charts can be written without building large strings in memory. The
+chart must be created with PFChart.create_chart before it is rendered.
+"""
+from xml.sax.saxutils import escape
+
+import json
+
+
+class Renderer(object):
+    """Base class for chart renderers."""
+
+    def render(self, chart, output):
+        """To be implemented in derived classes.
+
+        Write the chart to output, a file-like object opened for text.
+        """
+        raise NotImplementedError
+
+    def render_charts(self, charts, output):
+        """Write several charts, keyed by interval, to output.
+
+        charts is an ordered mapping of interval to chart. The charts
+        are written one after another by default; renderers of
+        documents override this to write one document of every chart.
+        """
+        for chart in charts.values():
+            self.render(chart, output)
+
+
+class TextRenderer(Renderer):
+    """Render the chart as terminal text, the same as PFChart.chart."""
+
+    def render(self, chart, output):
+        """Write the text chart to output."""
+        chart.write(output)
+
+
+class JsonRenderer(Renderer):
+    """Render the chart as JSON.
+
+    Columns are written as box ranges and the meta data as one array
+    per field, which keeps the document small and quick to parse.
+    """
+
+    META_DATA_FIELDS = ['date', 'open', 'high', 'low', 'close', 'volume',
+                        'signal', 'status', 'action', 'move', 'column_index',
+                        'scale_index', 'scale_value', 'direction',
+                        'prior_high', 'prior_low']
+
+    def __init__(self, meta_data=False, visible_only=False):
+        """Initialize the renderer.
+
+        The meta data arrays are only written if meta_data is True. If
+        visible_only is True only the columns left after truncation are
+        written.
+        """
+        self.meta_data = meta_data
+        self.visible_only = visible_only
+
+    def render(self, chart, output):
+        """Write the JSON document to output."""
+        write = output.write
+        dumps = json.dumps
+        if self.visible_only:
+            columns = chart.visible_columns
+        else:
+            columns = list(enumerate(chart.columns, chart.first_column))
+
+        write('{"symbol": ' + dumps(chart.instrument.symbol))
+        write(', "box_size": ' + str(chart.box_size))
+        write(', "scale_mode": ' + dumps(chart.scale_mode))
+        write(', "reversal": ' + str(chart.reversal))
+        write(', "method": ' + dumps(chart.method))
+        write(', "interval": ' + dumps(chart.interval))
+
+        write(', "scale": [')
+        write(', '.join(str(value) for value in chart.scale.values()))
+        write(']')
+
+        write(', "columns": {"column_index": [')
+        write(', '.join(str(number) for number, column in columns))
+        write('], "direction": [')
+        write(', '.join('"' + column.direction + '"'
+                        for number, column in columns))
+        write('], "low": [')
+        write(', '.join(str(column.low) for number, column in columns))
+        write('], "high": [')
+        write(', '.join(str(column.high) for number, column in columns))
+        write('], "reversal_boxes": [')
+        write(', '.join(str(column.reversal_boxes)
+                        for number, column in columns))
+        write('], "markers": [')
+        write(', '.join(dumps([[index, column.markers[index]]
+                               for index in sorted(column.markers)])
+                        for number, column in columns))
+        write(']}')
+
+        write(', "trend_lines": ')
+        write(dumps([{'type': line_type, 'column_index': column_index,
+                      'scale_index': scale_index}
+                     for line_type, column_index, scale_index
+                     in chart.trend_line_starts]))
+
+        if self.meta_data:
+            meta_data = chart.chart_meta_data
+            write(', "meta_data": {')
+            first = True
+            for field in self.META_DATA_FIELDS:
+                if not first:
+                    write(', ')
+                first = False
+                write(dumps(field) + ': [')
+                if field in ('date', 'signal', 'status', 'action',
+                             'direction'):
+                    write(', '.join(dumps(meta_data[day][field])
+                                    for day in meta_data))
+                else:
+                    write(', '.join(str(meta_data[day][field])
+                                    for day in meta_data))
+                write(']')
+            write('}')
+        write('}\n')
+
+    def render_charts(self, charts, output):
+        """Write one JSON object of the chart documents by interval."""
+        write = output.write
+        write('{')
+        first = True
+        for interval, chart in charts.items():
+            if not first:
+                write(', ')
+            first = False
+            write(json.dumps(interval) + ': ')
+            self.render(chart, output)
+        write('}\n')
+
+
+class SvgRenderer(Renderer):
+    """Render the chart as a standalone SVG image."""
+
+    CELL = 12
+    MARGIN = 60
+
+    STYLE = ('.x, .u { stroke: #1a7f37; stroke-width: 1.5; fill: none; } '
+             '.o, .d { stroke: #cf222e; stroke-width: 1.5; fill: none; } '
+             '.u, .d { stroke-dasharray: 2 1; } '
+             '.marker { fill: #0550ae; font-weight: bold; } '
+             '.trend { stroke: #0969da; stroke-width: 1; '
+             'stroke-dasharray: 3 3; } '
+             '.grid { stroke: #eaeef2; stroke-width: 1; } '
+             '.current { fill: #cf222e; font-weight: bold; } '
+             'text { font-family: monospace; font-size: 10px; }')
+
+    def render(self, chart, output):
+        """Write the SVG document to output."""
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self._write_svg(chart, output)
+
+    def render_charts(self, charts, output):
+        """Write one SVG document with the charts stacked by interval."""
+        write = output.write
+        layouts = [self._get_layout(chart) for chart in charts.values()]
+        width = max([layout[-2] for layout in layouts] + [0])
+        height = sum(layout[-1] + self.CELL for layout in layouts)
+        write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        write('<svg xmlns="http://www.w3.org/2000/svg" '
+              'width="%d" height="%d" viewBox="0 0 %d %d">\n'
+              % (width, height, width, height))
+        y = 0
+        for (interval, chart), layout in zip(charts.items(), layouts):
+            write('<text x="%d" y="%d">%s</text>\n'
+                  % (self.MARGIN, y + self.CELL - 2, escape(interval)))
+            self._write_svg(chart, output, y + self.CELL, layout)
+            y += layout[-1] + self.CELL
+        write('</svg>\n')
+
+    def _get_layout(self, chart):
+        # Return the visible columns, the rows from low to high, the
+        # current scale index and the width and height of the chart
+        cell = self.CELL
+        columns = chart.visible_columns
+        meta_data = chart.chart_meta_data
+        current_index = meta_data[next(reversed(meta_data))]['scale_index']
+
+        if len(columns) > 0:
+            low = min(column.low for number, column in columns)
+            high = max(column.high for number, column in columns)
+        else:
+            low = high = current_index
+        low = max(0, min(low, current_index))
+        high = min(len(chart.scale) - 1, max(high, current_index))
+        rows = high - low + 1
+        width = 2 * self.MARGIN + len(columns) * cell
+        height = rows * cell + cell
+        return columns, low, high, current_index, width, height
+
+    def _write_svg(self, chart, output, y=None, layout=None):
+        write = output.write
+        cell = self.CELL
+        margin = self.MARGIN
+        scale = chart.scale
+        if layout is None:
+            layout = self._get_layout(chart)
+        columns, low, high, current_index, width, height = layout
+
+        if y is None:
+            position = ''
+        else:
+            position = 'x="0" y="%d" ' % y
+        write('<svg xmlns="http://www.w3.org/2000/svg" %s'
+              'width="%d" height="%d" viewBox="0 0 %d %d">\n'
+              % (position, width, height, width, height))
+        write('<style>' + self.STYLE + '</style>\n')
+
+        for index in range(low, high + 1):
+            y = (high - index) * cell + cell
+            css_class = ' class="current"' if index == current_index else ''
+            write('<line class="grid" x1="%d" y1="%.1f" x2="%d" y2="%.1f"/>'
+                  % (margin, y - cell / 2, width - margin, y - cell / 2))
+            write('<text x="%d" y="%d" text-anchor="end"%s>%.2f</text>'
+                  % (margin - 4, y - 2, css_class, scale[index]))
+            write('<text x="%d" y="%d"%s>%.2f</text>\n'
+                  % (width - margin + 4, y - 2, css_class, scale[index]))
+
+        for position, (number, column) in enumerate(columns):
+            x = margin + position * cell
+            for index in range(max(low, column.low),
+                               min(high, column.high) + 1):
+                y = (high - index) * cell
+                symbol = column.symbol(index)
+                if index in column.markers:
+                    write('<text class="marker" x="%d" y="%d" '
+                          'text-anchor="middle">%s</text>'
+                          % (x + cell / 2, y + cell - 2, escape(symbol)))
+                elif column.direction == 'x':
+                    write('<path class="%s" d="M%d %dL%d %dM%d %dL%d %d"/>'
+                          % (symbol, x + 2, y + 2, x + cell - 2,
+                             y + cell - 2, x + 2, y + cell - 2,
+                             x + cell - 2, y + 2))
+                else:
+                    write('<circle class="%s" cx="%.1f" cy="%.1f" r="%.1f"/>'
+                          % (symbol, x + cell / 2, y + cell / 2,
+                             cell / 2 - 2))
+            write('\n')
+
+        if len(columns) > 0:
+            first_column = columns[0][0]
+            last_column = columns[-1][0]
+            for line_type, column_index, scale_index in \
+                    chart.trend_line_starts:
+                step = 1 if line_type == 'support' else -1
+                start = max(column_index, first_column)
+                start_index = scale_index + step * (start - column_index)
+                end_index = scale_index + step * (last_column - column_index)
+                if start > last_column:
+                    continue
+                x1 = margin + (start - first_column) * cell + cell / 2
+                x2 = margin + (last_column - first_column) * cell + cell / 2
+                y1 = (high - start_index) * cell + cell / 2
+                y2 = (high - end_index) * cell + cell / 2
+                write('<line class="trend" x1="%.1f" y1="%.1f" '
+                      'x2="%.1f" y2="%.1f"/>\n' % (x1, y1, x2, y2))
+        write('</svg>\n')
+
+
+class HtmlRenderer(SvgRenderer):
+    """Render the chart as a self-contained HTML page.
+
+    The page embeds the SVG chart and the current state of the chart,
+    so it needs no other files, scripts or images.
+    """
+
+    def render(self, chart, output):
+        """Write the HTML document to output."""
+        self._write_head(chart, output)
+        self._write_chart(chart, output)
+        output.write('</body>\n</html>\n')
+
+    def render_charts(self, charts, output):
+        """Write one HTML page with a section for each interval."""
+        write = output.write
+        first = True
+        for interval, chart in charts.items():
+            if first:
+                self._write_head(chart, output)
+            first = False
+            write('<h2>' + escape(interval) + '</h2>\n')
+            self._write_chart(chart, output)
+        write('</body>\n</html>\n')
+
+    def _write_head(self, chart, output):
+        write = output.write
+        symbol = escape(chart.instrument.symbol)
+        write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n')
+        write('<title>' + symbol + '</title>\n')
+        write('<style>body { font-family: monospace; }</style>\n')
+        write('</head>\n<body>\n')
+        write('<h1>' + symbol + '</h1>\n')
+
+    def _write_chart(self, chart, output):
+        write = output.write
+        meta_data = chart.chart_meta_data
+        current = meta_data[next(reversed(meta_data))]
+        write('<p>o: %.2f h: %.2f l: %.2f c: %.2f (%s)</p>\n'
+              % (current['open'], current['high'], current['low'],
+                 current['close'], escape(current['date'])))
+        write('<p>box: %s, reversal: %d, method: %s</p>\n'
+              % (chart.box_label, chart.reversal, escape(chart.method)))
+        write('<p>signal: <b>%s</b>, status: <b>%s</b></p>\n'
+              % (escape(current['signal']), escape(current['status'])))
+        self._write_svg(chart, output)
+
+
+RENDERERS = {'text': TextRenderer,
+             'json': JsonRenderer,
+             'svg': SvgRenderer,
+             'html': HtmlRenderer}
+
+
+def get_renderer(name):
+    """Return a renderer instance for a format name (text, json, svg, html)."""
+    if name not in RENDERERS:
+        raise ValueError("incorrect format: "
+                         "valid formats are " + ', '.join(sorted(RENDERERS)))
+    return RENDERERS[name]()
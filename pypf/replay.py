@@ -0,0 +1,378 @@
+"""Classes to replay the state a chart had as of every bar of its history.
+
+A chart built as of a date covers the last duration of bars up to that
+date, on a scale from their lowest to their highest price. Building one
+for every date repeats nearly all of the work of the one before, so a
+ChartReplay makes a single pass instead. Every scale of a window is a
+range of one scale covering the whole history, so each window start
+gets a PFEngine on that scale, and engines that reach the same state
+are merged, since they build the same columns from then on. Only the
+few distinct engines of the current window are ever kept, and the
+lowest and highest prices of the sliding window come from monotonic
+queues.
+
+Below $1 neighbouring boxes of a percent scale can round to the same
+value, and a window's scale then finds a price in its own first box
+rather than in the duplicates below it. The engine of a window start
+searches from the first box of the window it is read as, which is
+known ahead from the bars, and engines are only merged with engines
+that search from the same box.
+"""
+from array import array
+from bisect import bisect_right
+from collections import deque
+from collections import OrderedDict
+from decimal import Decimal
+
+import csv
+import logging
+
+from pypf.chart import PFChart
+from pypf.engine import PFEngine
+from pypf.scale import get_scale_class
+from pypf.stats import Stats
+
+
+class _Lineage(object):
+    """An engine and the window starts it is shared by.
+
+    bound is the first box the engine's searches start at, or None if
+    the window's first box makes no difference to them. The lineage of
+    the first window start is rebuilt while that window grows, so no
+    other start is merged with it.
+    """
+
+    __slots__ = ('engine', 'starts', 'bound', 'growing')
+
+    def __init__(self, engine, start, bound, growing=False):
+        """Start a lineage for one window start."""
+        self.engine = engine
+        self.starts = [start]
+        self.bound = bound
+        self.growing = growing
+
+
+class _WindowScale(object):
+    """The history's scale as seen by a window starting at box first."""
+
+    __slots__ = ('scale', 'first')
+
+    def __init__(self, scale, first):
+        """Initialize the view of scale."""
+        self.scale = scale
+        self.first = first
+
+    def __len__(self):
+        """Return the number of boxes on the history's scale."""
+        return len(self.scale)
+
+    def index(self, value, direction):
+        """Get the index of the box for value, searching from first."""
+        return self.scale.index(value, direction, self.first)
+
+
+class ChartReplay(object):
+    """The as-of state of a point and figure chart on every bar.
+
+    Row n holds the signal, status and meta data that PFChart with
+    end_date set to the date of bar n would have on its last bar. The
+    rows are stored as columns of codes and scale indexes, which take a
+    few bytes a bar.
+    """
+
+    FIELDS = ['date', 'close', 'signal', 'status', 'direction', 'action',
+              'move', 'column_index', 'scale_index', 'scale_value',
+              'prior_high', 'prior_low']
+
+    def __init__(self, instrument, box_size=.01, duration=1.0,
+                 interval='d', method='hl', reversal=3, debug=False,
+                 profile=False, scale_mode='percent'):
+        """Initialize the replay of a chart with PFChart's parameters.
+
+        Box sizes from the average true range ('atr:N') and intraday
+        intervals are not supported.
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if debug is True:
+            self._log.setLevel(logging.DEBUG)
+
+        self.stats = Stats(profile, self._log)
+        if interval not in ['d', 'w', 'm']:
+            raise ValueError("incorrect interval: "
+                             "valid intervals are d, w, m")
+        if isinstance(box_size, str) and box_size.startswith('atr:'):
+            raise ValueError('atr box sizes cannot be replayed.')
+        self.instrument = instrument
+        self.box_size = box_size
+        self.duration = duration
+        self.interval = interval
+        self.method = method
+        self.reversal = int(reversal)
+        self.scale_mode = scale_mode
+        self._scale = None
+        self._clear()
+
+    def __len__(self):
+        """Return the number of rows."""
+        return len(self._dates)
+
+    @property
+    def bars(self):
+        """Get the number of bars in each window."""
+        if self.interval == 'd':
+            return int(self.duration * 252)
+        elif self.interval == 'w':
+            return int(self.duration * 52)
+        return int(self.duration * 12)
+
+    @property
+    def box_size(self):
+        """Get the box_size."""
+        return self._box_size
+
+    @box_size.setter
+    def box_size(self, value):
+        self._box_size = Decimal(value).quantize(PFChart.TWOPLACES)
+
+    @property
+    def duration(self):
+        """Get the duration."""
+        return self._duration
+
+    @duration.setter
+    def duration(self, value):
+        self._duration = Decimal(value).quantize(PFChart.TWOPLACES)
+
+    def as_of(self, date):
+        """Get the row of the last bar on or before date, or None."""
+        position = bisect_right(self._dates, date + '\uffff') - 1
+        if position < 0:
+            return None
+        return self._get_row(position)
+
+    def rows(self):
+        """Iterate over the rows as OrderedDicts of FIELDS."""
+        for position in range(len(self)):
+            yield self._get_row(position)
+
+    def run(self):
+        """Replay the chart over the instrument's history."""
+        stats = self.stats
+        stats.reset()
+        self._clear()
+        with stats.phase('populate_data'):
+            if not self.instrument.has_bars(None):
+                self.instrument.populate_data()
+        series = self.instrument.get_series(self.interval)
+        if len(series) == 0:
+            return self
+        if self.method == 'hl':
+            high_field = 'High'
+            low_field = 'Low'
+        else:
+            high_field = 'Close'
+            low_field = 'Close'
+        highs = [bar[high_field] for bar in series.values()]
+        lows = [bar[low_field] for bar in series.values()]
+        scale = get_scale_class(self.scale_mode)(self.box_size, min(lows),
+                                                 max(highs))
+        self._scale = scale
+
+        with stats.phase('replay'):
+            self._replay(series, highs, lows, scale)
+        stats.count('bars', len(series))
+        stats.count('rows', len(self))
+        return self
+
+    def write(self, output):
+        """Write the rows to a file-like object as csv."""
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(ChartReplay.FIELDS)
+        for row in self.rows():
+            writer.writerow(row.values())
+
+    def _clear(self):
+        self._dates = []
+        self._closes = []
+        self._signals = array('b')
+        self._directions = array('b')
+        self._actions = array('b')
+        self._moves = array('l')
+        self._column_indexes = array('l')
+        self._firsts = array('l')
+        self._scale_indexes = array('l')
+        self._prior_highs = array('l')
+        self._prior_lows = array('l')
+
+    def _get_row(self, position):
+        scale = self._scale
+        twoplaces = PFChart.TWOPLACES
+        signal = PFChart.SIGNALS[self._signals[position]]
+        direction = PFChart.DIRECTIONS[self._directions[position]]
+        first = self._firsts[position]
+        scale_index = self._scale_indexes[position]
+        return OrderedDict([
+            ('date', self._dates[position]),
+            ('close', self._closes[position]),
+            ('signal', signal),
+            ('status', PFChart.get_status(signal, direction)),
+            ('direction', direction),
+            ('action', PFChart.ACTIONS[self._actions[position]]),
+            ('move', self._moves[position]),
+            ('column_index', self._column_indexes[position]),
+            ('scale_index', scale_index - first),
+            ('scale_value', scale[scale_index].quantize(twoplaces)),
+            ('prior_high', scale[self._prior_highs[position]]
+             .quantize(twoplaces)),
+            ('prior_low', scale[self._prior_lows[position]]
+             .quantize(twoplaces))])
+
+    def _replay(self, series, highs, lows, scale):
+        # The prior highs and lows an engine starts with
+        no_high = len(scale)
+        no_low = -1
+        size = self.bars
+        dates = list(series)
+        bounds = self._get_bounds(scale, lows, size)
+        lineages = []
+        # The lineage of each live window start and the number of
+        # columns its engine had when the start joined it
+        starts = {}
+        maximums = deque()
+        minimums = deque()
+        most = 0
+
+        for position, date in enumerate(dates):
+            high = highs[position]
+            low = lows[position]
+            first = max(0, position - size + 1)
+            starts.pop(first - 1, None)
+
+            while maximums and highs[maximums[-1]] <= high:
+                maximums.pop()
+            maximums.append(position)
+            if maximums[0] < first:
+                maximums.popleft()
+            while minimums and lows[minimums[-1]] >= low:
+                minimums.pop()
+            minimums.append(position)
+            if minimums[0] < first:
+                minimums.popleft()
+
+            if first == 0 and position > 0:
+                # The first window grows, and its first box may move
+                lineage = starts[0][0]
+                bound = self._get_bound(scale, lows[minimums[0]])
+                if bound != lineage.bound:
+                    lineage.bound = bound
+                    lineage.engine = self._get_engine(scale, bound)
+                    for before in range(position):
+                        lineage.engine.update(dates[before], highs[before],
+                                              lows[before], None)
+
+            # Marker months do not change the state, so none are given
+            for lineage in lineages:
+                lineage.engine.update(date, high, low, None)
+            if position == 0:
+                bound = self._get_bound(scale, low)
+            else:
+                bound = bounds[position]
+            engine = self._get_engine(scale, bound)
+            engine.update(date, high, low, None)
+            lineages.append(_Lineage(engine, position, bound,
+                                     position == 0))
+            starts[position] = (lineages[-1], 0)
+            lineages = self._merge(lineages, starts)
+            most = max(most, len(lineages))
+
+            lineage, offset = starts[first]
+            if first == position:
+                # The window has a single bar and no state yet
+                continue
+            engine = lineage.engine
+            window_first, window_last = scale.get_range(
+                lows[minimums[0]], highs[maximums[0]])
+            prior_high = engine.prior_high_index
+            if prior_high == no_high:
+                prior_high = window_last
+            prior_low = engine.prior_low_index
+            if prior_low == no_low:
+                prior_low = window_first
+
+            bar = series[date]
+            self._dates.append(bar['Date'])
+            self._closes.append(bar['Close'].quantize(PFChart.TWOPLACES))
+            self._signals.append(PFChart.SIGNALS.index(engine.signal))
+            self._directions.append(
+                PFChart.DIRECTIONS.index(engine.direction))
+            self._actions.append(PFChart.ACTIONS.index(engine.action))
+            self._moves.append(engine.move)
+            self._column_indexes.append(engine.column_index - offset)
+            self._firsts.append(window_first)
+            self._scale_indexes.append(engine.scale_index)
+            self._prior_highs.append(prior_high)
+            self._prior_lows.append(prior_low)
+        self.stats.count('most_engines', most)
+
+    def _get_engine(self, scale, bound):
+        # A window's engine starts with prior highs and lows that can
+        # never be crossed; these stand for them on the shared scale
+        if bound is not None:
+            scale = _WindowScale(scale, bound)
+        engine = PFEngine(scale, self.reversal, retain=1)
+        engine.prior_high_index = len(scale)
+        engine.prior_low_index = -1
+        return engine
+
+    def _get_bound(self, scale, lowest):
+        # The first box of a window whose lowest price is lowest, if a
+        # search starting there can find a different box for a price
+        # than a search of the whole scale
+        first = scale.get_range(lowest, lowest)[0]
+        if first > 0 and scale[first - 1] == scale[first]:
+            return first
+        return None
+
+    def _get_bounds(self, scale, lows, size):
+        # Every window start but the first is read once, when its
+        # window is full, so its first box is known from the bars
+        bounds = [None] * len(lows)
+        minimums = deque()
+        for position, low in enumerate(lows):
+            while minimums and lows[minimums[-1]] >= low:
+                minimums.pop()
+            minimums.append(position)
+            start = position - size + 1
+            if minimums[0] < start:
+                minimums.popleft()
+            if start > 0:
+                bounds[start] = self._get_bound(scale, lows[minimums[0]])
+        return bounds
+
+    def _merge(self, lineages, starts):
+        # Engines in the same state build the same columns from now on,
+        # so the starts of a later one move to the earlier one
+        survivors = []
+        by_state = {}
+        for lineage in lineages:
+            engine = lineage.engine
+            if lineage.growing:
+                survivors.append(lineage)
+                continue
+            state = (engine.direction, engine.index, engine.signal,
+                     engine.prior_high_index, engine.prior_low_index,
+                     lineage.bound)
+            other = by_state.get(state)
+            if other is None:
+                by_state[state] = lineage
+                survivors.append(lineage)
+                continue
+            shift = other.engine.column_index - engine.column_index
+            for start in lineage.starts:
+                if start in starts:
+                    starts[start] = (other, starts[start][1] + shift)
+                    other.starts.append(start)
+        for lineage in survivors:
+            lineage.starts = [start for start in lineage.starts
+                              if start in starts]
+        return [lineage for lineage in survivors if lineage.starts]
@@ -0,0 +1,316 @@
+"""Classes to map prices to the boxes of a point and figure chart."""
+from bisect import bisect_left
+from bisect import bisect_right
+from decimal import Decimal
+from decimal import ROUND_FLOOR
+
+import threading
+import weakref
+
+
+class PercentGrid(object):
+    """The box values of every percent scale with one box size.
+
+    Values compound by box_size from $0.01 and are only ever appended
+    to, never changed, so one grid is shared by every scale with its box
+    size as a range of offsets into it. get_percent_grid() interns the
+    grids, so a process builds each box size's values once however many
+    charts it draws at the same time; a grid is dropped with the last
+    scale using it, so box sizes no chart uses any more take no memory.
+    """
+
+    TWOPLACES = Decimal('0.01')
+
+    def __init__(self, box_size):
+        """Initialize a grid holding only the first box."""
+        self.box_size = box_size
+        first = Decimal(.01)
+        # The unrounded values, which place prices on the grid exactly
+        self.raw = [first]
+        self.values = [first.quantize(PercentGrid.TWOPLACES)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of boxes built so far."""
+        return len(self.raw)
+
+    def extend(self, highest):
+        """Build the grid up to the first box above highest."""
+        if self.raw[-1] > highest:
+            return
+        # Charts in other threads may extend the same grid
+        with self._lock:
+            current = self.raw[-1]
+            while current <= highest:
+                current = current + (current * self.box_size)
+                self.values.append(current.quantize(PercentGrid.TWOPLACES))
+                self.raw.append(current)
+
+    def get_start(self, lowest):
+        """Get the offset of the last box at or below lowest.
+
+        The grid must already extend above lowest.
+        """
+        return max(0, bisect_right(self.raw, lowest) - 1)
+
+    def get_stop(self, highest):
+        """Get the offset just past the first box above highest."""
+        self.extend(highest)
+        return bisect_right(self.raw, highest) + 1
+
+
+# Only the scales hold their grids, so the grids of box sizes that are
+# no longer charted, e.g. the many ATR box sizes a server sees, are freed
+_percent_grids = weakref.WeakValueDictionary()
+_percent_grids_lock = threading.Lock()
+
+
+def get_percent_grid(box_size):
+    """Return the process's shared PercentGrid for box_size."""
+    grid = _percent_grids.get(box_size)
+    if grid is None:
+        with _percent_grids_lock:
+            grid = _percent_grids.get(box_size)
+            if grid is None:
+                grid = PercentGrid(box_size)
+                _percent_grids[box_size] = grid
+    return grid
+
+
+class PercentScale(object):
+    """Scale whose boxes grow by box_size percent, compounded from $0.01.
+
+    Every chart with the same box size shares the same grid of box
+    values starting at $0.01, and a scale is just the range of offsets
+    into that grid that covers the chart's prices. Index 0 is the box at
+    or below the lowest price and the last index is the first box above
+    the highest price.
+
+    The scale can be read like the OrderedDict of index to value that
+    PFChart used to build, and index() finds the box for a price with a
+    binary search.
+    """
+
+    TWOPLACES = Decimal('0.01')
+
+    def __init__(self, box_size, lowest, highest):
+        """Build the scale covering lowest to highest."""
+        self.box_size = box_size
+        self._grid = get_percent_grid(box_size)
+        self._lowest = lowest
+        self._highest = highest
+        self._stop = self._grid.get_stop(highest)
+        self._start = self._grid.get_start(lowest)
+
+    def __contains__(self, index):
+        """Return True if index is on the scale."""
+        return 0 <= index < self._stop - self._start
+
+    def __getitem__(self, index):
+        """Get the value of the box at index."""
+        position = self._start + index
+        if index < 0 or position >= self._stop:
+            raise KeyError(index)
+        return self._grid.values[position]
+
+    def __getstate__(self):
+        """Return the state to pickle, leaving out the shared grid."""
+        state = self.__dict__.copy()
+        del state['_grid']
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state and find the process's grid again."""
+        self.__dict__.update(state)
+        self._grid = get_percent_grid(self.box_size)
+        self._grid.extend(self._highest)
+
+    def __iter__(self):
+        """Iterate over the indexes of the scale."""
+        return iter(range(len(self)))
+
+    @property
+    def first_box(self):
+        """Get the offset into the grid of index 0.
+
+        Every scale with the same box size numbers its boxes the same
+        way, so an index moves from one scale to another by adding the
+        difference of their first boxes.
+        """
+        return self._start
+
+    def __len__(self):
+        """Return the number of boxes on the scale."""
+        return self._stop - self._start
+
+    def extend(self, lowest, highest):
+        """Widen the scale to cover lowest to highest.
+
+        Returns the number of boxes added below the old first box; every
+        index held by the caller must be shifted up by that amount.
+        """
+        shift = 0
+        if highest > self._highest:
+            self._highest = highest
+            self._stop = self._grid.get_stop(highest)
+        if lowest < self._lowest:
+            self._lowest = lowest
+            start = self._grid.get_start(lowest)
+            shift = self._start - start
+            self._start = start
+        return shift
+
+    def get_range(self, lowest, highest):
+        """Get the first and last indexes of a scale of lowest to highest.
+
+        The indexes are on this scale, which must cover both prices.
+        """
+        return (self._grid.get_start(lowest) - self._start,
+                self._grid.get_stop(highest) - 1 - self._start)
+
+    def index(self, value, direction, first=0):
+        """Get the index of the box for value.
+
+        A value between two boxes belongs to the lower box in an x
+        column and the upper box in an o column. Below $1 neighbouring
+        boxes can round to the same value; the search starts at index
+        first, so it finds the box a scale starting there would.
+        """
+        values = self._grid.values
+        position = bisect_left(values, value, self._start + first,
+                               self._stop)
+        if position < self._stop and values[position] == value:
+            return position - self._start
+        if direction == 'x':
+            return position - 1 - self._start
+        return position - self._start
+
+    def items(self):
+        """Get (index, value) pairs."""
+        return enumerate(self.values())
+
+    def keys(self):
+        """Get the indexes."""
+        return range(len(self))
+
+    def values(self):
+        """Get the box values."""
+        return self._grid.values[self._start:self._stop]
+
+
+class PointScale(object):
+    """Scale whose boxes are a fixed number of points apart.
+
+    Box values are multiples of box_size, so the box for a price is
+    found with a division and no table of values is built. Index 0 is
+    the box at or below the lowest price and the last index is the
+    first box above the highest price. Prices may be negative, as the
+    prices of a spread can be.
+    """
+
+    TWOPLACES = Decimal('0.01')
+
+    def __init__(self, box_size, lowest, highest):
+        """Build the scale covering lowest to highest."""
+        if box_size <= 0:
+            raise ValueError('box_size must be greater than 0.')
+        self.box_size = box_size
+        self._lowest = lowest
+        self._highest = highest
+        self._first = self._get_box(lowest)
+        self._length = self._get_box(highest) + 2 - self._first
+
+    def __contains__(self, index):
+        """Return True if index is on the scale."""
+        return 0 <= index < self._length
+
+    def __getitem__(self, index):
+        """Get the value of the box at index."""
+        if index < 0 or index >= self._length:
+            raise KeyError(index)
+        return ((self._first + index) * self.box_size).quantize(
+            PointScale.TWOPLACES)
+
+    def __iter__(self):
+        """Iterate over the indexes of the scale."""
+        return iter(range(self._length))
+
+    @property
+    def first_box(self):
+        """Get the number of the box at index 0, its value / box_size.
+
+        Every scale with the same box size numbers its boxes the same
+        way, so an index moves from one scale to another by adding the
+        difference of their first boxes.
+        """
+        return self._first
+
+    def __len__(self):
+        """Return the number of boxes on the scale."""
+        return self._length
+
+    def extend(self, lowest, highest):
+        """Widen the scale to cover lowest to highest.
+
+        Returns the number of boxes added below the old first box; every
+        index held by the caller must be shifted up by that amount.
+        """
+        shift = 0
+        if highest > self._highest:
+            self._highest = highest
+        if lowest < self._lowest:
+            self._lowest = lowest
+            first = self._get_box(lowest)
+            shift = self._first - first
+            self._first = first
+        self._length = self._get_box(self._highest) + 2 - self._first
+        return shift
+
+    def get_range(self, lowest, highest):
+        """Get the first and last indexes of a scale of lowest to highest.
+
+        The indexes are on this scale, which must cover both prices.
+        """
+        return (self._get_box(lowest) - self._first,
+                self._get_box(highest) + 1 - self._first)
+
+    def index(self, value, direction):
+        """Get the index of the box for value.
+
+        A value between two boxes belongs to the lower box in an x
+        column and the upper box in an o column.
+        """
+        box = self._get_box(value)
+        if direction == 'x' or box * self.box_size == value:
+            return box - self._first
+        return box + 1 - self._first
+
+    def items(self):
+        """Get (index, value) pairs."""
+        return enumerate(self.values())
+
+    def keys(self):
+        """Get the indexes."""
+        return range(self._length)
+
+    def values(self):
+        """Get the box values."""
+        box_size = self.box_size
+        return [(box * box_size).quantize(PointScale.TWOPLACES)
+                for box in range(self._first, self._first + self._length)]
+
+    def _get_box(self, value):
+        # The number of the box at or below value
+        return int((value / self.box_size).to_integral_value(ROUND_FLOOR))
+
+
+SCALES = {'percent': PercentScale,
+          'point': PointScale}
+
+
+def get_scale_class(scale_mode):
+    """Return the scale class for a scale mode (percent or point)."""
+    if scale_mode not in SCALES:
+        raise ValueError("incorrect scale mode: "
+                         "valid scale modes are percent, point")
+    return SCALES[scale_mode]
@@ -0,0 +1,233 @@
+"""Classes to screen many instruments using point and figure chart state."""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import logging
+import os
+
+from pypf.chart import PFChart
+from pypf.instrument import DerivedInstrument
+from pypf.instrument import get_instrument_class
+
+
+# Benchmarks loaded by this process, shared by all of its symbols
+_benchmarks = {}
+
+
+def new_signal(row):
+    """Match rows where the signal changed on the last bar."""
+    return row['new_signal']
+
+
+def new_buy_signal(row):
+    """Match rows where the signal changed to buy on the last bar."""
+    return row['signal'] == 'buy' and row['new_signal']
+
+
+def new_sell_signal(row):
+    """Match rows where the signal changed to sell on the last bar."""
+    return row['signal'] == 'sell' and row['new_signal']
+
+
+def min_move(boxes):
+    """Match rows whose last bar moved at least the number of boxes."""
+    def match(row):
+        return row['move'] >= boxes
+    return match
+
+
+def signal_is(signal):
+    """Match rows with the given signal (buy, sell or none)."""
+    def match(row):
+        return row['signal'] == signal
+    return match
+
+
+def status_is(status):
+    """Match rows with the given status (e.g. 'bull confirmed')."""
+    def match(row):
+        return row['status'] == status
+    return match
+
+
+def _screen_symbol(task):
+    """Get the end state of the chart of one symbol.
+
+    Runs in a worker process, so it only receives and returns plain
+    values. Errors are returned rather than raised so that a single bad
+    symbol does not abort the whole screen.
+    """
+    symbol, instrument_options, chart_options = task
+    try:
+        instrument = _get_instrument(symbol, instrument_options)
+        if instrument_options['benchmark'] is not None:
+            benchmark = _get_benchmark(instrument_options)
+            instrument = DerivedInstrument([instrument, benchmark],
+                                           debug=instrument_options['debug'])
+        chart = PFChart(instrument, **chart_options)
+        return symbol, Screener.get_row(instrument.symbol, chart), None
+    except Exception as e:
+        return symbol, None, repr(e)
+
+
+def _get_instrument(symbol, instrument_options):
+    instrument_class = get_instrument_class(instrument_options['provider'])
+    instrument = instrument_class(symbol,
+                                  instrument_options['force_download'],
+                                  instrument_options['force_cache'],
+                                  instrument_options['period'],
+                                  instrument_options['debug'])
+    instrument.archive = instrument_options['archive']
+    return instrument
+
+
+def _get_benchmark(instrument_options):
+    """Get the populated benchmark, loading it once per process."""
+    key = tuple(sorted(instrument_options.items()))
+    benchmark = _benchmarks.get(key)
+    if benchmark is None:
+        benchmark = _get_instrument(instrument_options['benchmark'],
+                                    instrument_options)
+        benchmark.populate_data()
+        _benchmarks[key] = benchmark
+    return benchmark
+
+
+class Screener(object):
+    """Compute the current chart state for a universe of symbols.
+
+    Only the end state of each chart is computed; no charts are
+    rendered. Symbols are processed in parallel across worker processes.
+
+    With a benchmark, each symbol is charted as its relative strength:
+    the ratio of its prices to the benchmark's. The benchmark is loaded
+    once by each worker process.
+    """
+
+    FIELDS = ['symbol', 'date', 'close', 'signal', 'new_signal', 'status',
+              'direction', 'column_index', 'move', 'scale_value',
+              'prior_high', 'prior_low']
+
+    def __init__(self, symbols, provider='yahoo', force_download=False,
+                 force_cache=False, period=10, box_size=.01, duration=1.0,
+                 interval='d', method='hl', reversal=3, workers=None,
+                 debug=False, benchmark=None, scale_mode='percent',
+                 archive=False):
+        """Initialize the screener."""
+        self._log = logging.getLogger(self.__class__.__name__)
+        if debug is True:
+            self._log.setLevel(logging.DEBUG)
+
+        self.symbols = symbols
+        self.workers = workers
+        self.errors = OrderedDict()
+        self._results = []
+        self._instrument_options = {'provider': provider,
+                                    'force_download': force_download,
+                                    'force_cache': force_cache,
+                                    'period': period,
+                                    'debug': debug,
+                                    'benchmark': benchmark,
+                                    'archive': archive}
+        self._chart_options = {'box_size': box_size,
+                               'duration': duration,
+                               'interval': interval,
+                               'method': method,
+                               'reversal': reversal,
+                               'debug': debug,
+                               'scale_mode': scale_mode}
+
+    @property
+    def results(self):
+        """Get the rows produced by the last run."""
+        return self._results
+
+    @property
+    def symbols(self):
+        """Get the symbols to screen."""
+        return self._symbols
+
+    @symbols.setter
+    def symbols(self, value):
+        self._symbols = [symbol.upper() for symbol in value]
+        self._log.debug('set self._symbols to %s', self._symbols)
+
+    @property
+    def workers(self):
+        """Get the number of worker processes (None uses all CPUs)."""
+        return self._workers
+
+    @workers.setter
+    def workers(self, value):
+        self._workers = value
+        self._log.debug('set self._workers to %s', self._workers)
+
+    @staticmethod
+    def get_row(symbol, chart):
+        """Return the screen row for the last bar of a PFChart.
+
+        Only the chart's engine is run; the chart is not created, so no
+        meta data is built.
+        """
+        twoplaces = PFChart.TWOPLACES
+        day = None
+        previous_signal = signal = 'none'
+        for day, engine in chart.iterate_engine():
+            previous_signal = signal
+            signal = engine.signal
+        if day is None:
+            raise ValueError('not enough data to screen ' + symbol)
+        scale = chart.scale
+        row = OrderedDict()
+        row['symbol'] = symbol
+        row['date'] = day['Date']
+        row['close'] = day['Close'].quantize(twoplaces)
+        row['signal'] = signal
+        row['new_signal'] = signal != previous_signal
+        row['status'] = PFChart.get_status(signal, engine.direction)
+        row['direction'] = engine.direction
+        row['column_index'] = engine.column_index
+        row['move'] = engine.move
+        row['scale_value'] = scale[engine.scale_index].quantize(twoplaces)
+        row['prior_high'] = scale[engine.prior_high_index].quantize(twoplaces)
+        row['prior_low'] = scale[engine.prior_low_index].quantize(twoplaces)
+        return row
+
+    def run(self, filters=None):
+        """Screen the symbols and return the rows that match.
+
+        filters is a list of callables that accept a row and return
+        True if the row should be kept; all filters must match.
+        """
+        filters = filters or []
+        tasks = [(symbol, self._instrument_options, self._chart_options)
+                 for symbol in self.symbols]
+        self.errors = OrderedDict()
+        self._results = []
+
+        if self.workers == 1:
+            outcomes = map(_screen_symbol, tasks)
+            self._collect(outcomes, filters)
+        else:
+            workers = self.workers or os.cpu_count() or 1
+            chunksize = max(1, len(tasks) // (workers * 8))
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = executor.map(_screen_symbol, tasks,
+                                        chunksize=chunksize)
+                self._collect(outcomes, filters)
+        return self._results
+
+    def sort(self, field, reverse=False):
+        """Sort the results in place by a field and return them."""
+        self._results.sort(key=itemgetter(field), reverse=reverse)
+        return self._results
+
+    def _collect(self, outcomes, filters):
+        for symbol, row, error in outcomes:
+            if error is not None:
+                self._log.warning('unable to screen %s: %s', symbol, error)
+                self.errors[symbol] = error
+                continue
+            if all(f(row) for f in filters):
+                self._results.append(row)
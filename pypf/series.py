@@ -0,0 +1,277 @@
+"""Classes to store bars compactly and select ranges of them by date."""
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from decimal import Decimal
+from itertools import chain
+
+
+class BarSeries(object):
+    """Bars in date order with a sorted index of their dates.
+
+    A BarSeries reads like the OrderedDict of bars it is built from:
+    iterating gives the dates, and a date gives its bar. window() and
+    last_n() return views that share the bars and the index, found by
+    binary search, so selecting a chart's bars takes O(log n) time
+    whatever the length of the history. The bars must not be changed
+    while views of them are in use.
+
+    A view may end with one bar that is not in the index, added by
+    with_last(), such as a week that is still in progress.
+    """
+
+    __slots__ = ('_data', '_dates', '_start', '_stop', '_last')
+
+    def __init__(self, data, dates=None, start=0, stop=None, last=None):
+        """Index data, a mapping of bars keyed by date in date order."""
+        self._data = data
+        if dates is None:
+            dates = list(data)
+        self._dates = dates
+        self._start = start
+        self._stop = len(dates) if stop is None else stop
+        self._last = last
+
+    def __contains__(self, date):
+        """Return True if the view has a bar for date."""
+        if self._last is not None and date == self._last['Date']:
+            return True
+        return (date in self._data and self._stop > self._start
+                and self._dates[self._start] <= date
+                <= self._dates[self._stop - 1])
+
+    def __getitem__(self, date):
+        """Get the bar for date."""
+        if date not in self:
+            raise KeyError(date)
+        if self._last is not None and date == self._last['Date']:
+            return self._last
+        return self._data[date]
+
+    def __iter__(self):
+        """Iterate over the dates in order."""
+        dates = map(self._dates.__getitem__, range(self._start, self._stop))
+        if self._last is None:
+            return dates
+        return chain(dates, [self._last['Date']])
+
+    def __len__(self):
+        """Return the number of bars."""
+        return self._stop - self._start + (self._last is not None)
+
+    def __reversed__(self):
+        """Iterate over the dates from the last back."""
+        dates = map(self._dates.__getitem__,
+                    range(self._stop - 1, self._start - 1, -1))
+        if self._last is None:
+            return dates
+        return chain([self._last['Date']], dates)
+
+    @property
+    def first_date(self):
+        """Get the date of the first bar, or None if there are none."""
+        if self._stop > self._start:
+            return self._dates[self._start]
+        if self._last is not None:
+            return self._last['Date']
+        return None
+
+    @property
+    def last_date(self):
+        """Get the date of the last bar, or None if there are none."""
+        if self._last is not None:
+            return self._last['Date']
+        if self._stop > self._start:
+            return self._dates[self._stop - 1]
+        return None
+
+    def get(self, date, default=None):
+        """Get the bar for date, or default."""
+        if date not in self:
+            return default
+        return self[date]
+
+    def items(self):
+        """Iterate over the (date, bar) pairs in order."""
+        return zip(self, self.values())
+
+    def keys(self):
+        """Iterate over the dates in order."""
+        return iter(self)
+
+    def values(self):
+        """Iterate over the bars in order."""
+        bars = map(self._data.__getitem__,
+                   map(self._dates.__getitem__,
+                       range(self._start, self._stop)))
+        if self._last is None:
+            return bars
+        return chain(bars, [self._last])
+
+    def last_n(self, bars):
+        """Get a view of the last bars bars."""
+        if bars <= 0:
+            return BarSeries(self._data, self._dates, self._stop, self._stop)
+        if self._last is not None:
+            bars -= 1
+        return BarSeries(self._data, self._dates,
+                         max(self._start, self._stop - bars), self._stop,
+                         self._last)
+
+    def window(self, start_date=None, end_date=None):
+        """Get a view of the bars from start_date to end_date inclusive.
+
+        Either end may be None to leave it open. A date without a time
+        includes every timestamped bar on that day.
+        """
+        start = self._start
+        stop = self._stop
+        last = self._last
+        if start_date is not None:
+            start = bisect_left(self._dates, start_date, start, stop)
+            if last is not None and last['Date'] < start_date:
+                last = None
+        if end_date is not None:
+            # Timestamps sort after their date and before this
+            stop = bisect_right(self._dates, end_date + '\uffff', start,
+                                stop)
+            if last is not None and last['Date'] > end_date + '\uffff':
+                last = None
+        return BarSeries(self._data, self._dates, start, stop, last)
+
+    def with_last(self, bar):
+        """Get a view of these bars followed by bar.
+
+        bar must be dated after every bar of the view, which must not
+        already end with such a bar.
+        """
+        if self._last is not None:
+            raise ValueError('the series already ends with an extra bar')
+        return BarSeries(self._data, self._dates, self._start, self._stop,
+                         bar)
+
+
+class BarColumns(object):
+    """Timestamped bars stored as columns rather than dicts.
+
+    Prices are kept in cents and volumes as integers, in arrays, so a
+    long intraday history takes a few dozen bytes a bar. It reads like
+    the OrderedDict of bar dicts keyed by timestamp that Instrument
+    keeps for daily bars, but a bar's dict is only built when the bar
+    is read. Bars must be appended in timestamp order.
+    """
+
+    __slots__ = ('dates', '_opens', '_highs', '_lows', '_closes',
+                 '_volumes')
+
+    def __init__(self):
+        """Initialize with no bars."""
+        self.dates = []
+        self._opens = array('q')
+        self._highs = array('q')
+        self._lows = array('q')
+        self._closes = array('q')
+        self._volumes = array('q')
+
+    def __contains__(self, date):
+        """Return True if there is a bar for the timestamp."""
+        return self._find(date) is not None
+
+    def __getitem__(self, date):
+        """Get the bar dict for the timestamp."""
+        position = self._find(date)
+        if position is None:
+            raise KeyError(date)
+        return self.get_bar(position)
+
+    def __iter__(self):
+        """Iterate over the timestamps in order."""
+        return iter(self.dates)
+
+    def __len__(self):
+        """Return the number of bars."""
+        return len(self.dates)
+
+    def __reversed__(self):
+        """Iterate over the timestamps from the last back."""
+        return reversed(self.dates)
+
+    def append(self, date, open_price, high, low, close, volume):
+        """Append a bar; prices are Decimals with at most two places."""
+        self.dates.append(date)
+        self._opens.append(int(open_price.scaleb(2)))
+        self._highs.append(int(high.scaleb(2)))
+        self._lows.append(int(low.scaleb(2)))
+        self._closes.append(int(close.scaleb(2)))
+        self._volumes.append(volume)
+
+    def get(self, date, default=None):
+        """Get the bar dict for the timestamp, or default."""
+        position = self._find(date)
+        if position is None:
+            return default
+        return self.get_bar(position)
+
+    def get_bar(self, position):
+        """Get the bar dict at a position."""
+        return {'Date': self.dates[position],
+                'Open': Decimal(self._opens[position]).scaleb(-2),
+                'High': Decimal(self._highs[position]).scaleb(-2),
+                'Low': Decimal(self._lows[position]).scaleb(-2),
+                'Close': Decimal(self._closes[position]).scaleb(-2),
+                'Volume': self._volumes[position]}
+
+    def items(self):
+        """Iterate over the (timestamp, bar) pairs in order."""
+        return zip(self.dates, self.values())
+
+    def keys(self):
+        """Iterate over the timestamps in order."""
+        return iter(self.dates)
+
+    def values(self):
+        """Iterate over the bar dicts in order."""
+        return map(self.get_bar, range(len(self.dates)))
+
+    def resample(self, minutes):
+        """Get the bars combined into bars of a number of minutes.
+
+        Bars are keyed by the 'YYYY-MM-DD HH:MM' time they start, and
+        each day's first bar starts at midnight plus a multiple of
+        minutes.
+        """
+        resampled = BarColumns()
+        dates = resampled.dates
+        opens = resampled._opens
+        highs = resampled._highs
+        lows = resampled._lows
+        closes = resampled._closes
+        volumes = resampled._volumes
+        key = None
+        for position, timestamp in enumerate(self.dates):
+            minute = int(timestamp[11:13]) * 60 + int(timestamp[14:16])
+            start = minute - minute % minutes
+            bar_key = '%s %02d:%02d' % (timestamp[:10], start // 60,
+                                        start % 60)
+            if bar_key != key:
+                key = bar_key
+                dates.append(key)
+                opens.append(self._opens[position])
+                highs.append(self._highs[position])
+                lows.append(self._lows[position])
+                closes.append(self._closes[position])
+                volumes.append(self._volumes[position])
+            else:
+                if self._highs[position] > highs[-1]:
+                    highs[-1] = self._highs[position]
+                if self._lows[position] < lows[-1]:
+                    lows[-1] = self._lows[position]
+                closes[-1] = self._closes[position]
+                volumes[-1] += self._volumes[position]
+        return resampled
+
+    def _find(self, date):
+        position = bisect_left(self.dates, date)
+        if position < len(self.dates) and self.dates[position] == date:
+            return position
+        return None
@@ -0,0 +1,324 @@
+"""Classes to serve point and figure charts from a long running process.
+
+The server keeps instruments and built charts in memory, so a request
+for a chart that has already been built only pays for rendering, and
+rendered output is cached as well. Instruments are reloaded when their
+data file changes or a download is due, and the charts built from them
+resume from their snapshots, so only the new bars are processed. The
+least recently used charts are dropped once max_charts are cached,
+along with their snapshots and any instrument no cached chart is built
+from.
+
+Each instrument and each chart has its own lock, so a download or a
+build holds up only the requests that need the same data.
+
+Requests take the same parameters as the pf command, for example::
+
+    GET /chart?symbol=AAPL&box_size=0.02&reversal=3&trend_lines=1
+    GET /chart?symbol=AAPL&format=svg
+    GET /meta?symbol=AAPL&duration=2
+"""
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import logging
+import os
+import threading
+import time
+
+from pypf.chart import PFChart
+from pypf.instrument import get_instrument_class
+
+
+def _get_bool(value):
+    if isinstance(value, bool):
+        return value
+    return value.lower() in ['1', 'true', 'yes', 'on', '']
+
+
+def _get_box_size(value):
+    if isinstance(value, str) and value.startswith('atr:'):
+        return value
+    return float(value)
+
+
+class ChartServer(object):
+    """Serve charts and chart meta data over HTTP."""
+
+    # name: (type, default) for each chart parameter, matching pf.py pf
+    PARAMETERS = {'box_size': (_get_box_size, .01),
+                  'duration': (float, 1),
+                  'interval': (str, 'd'),
+                  'method': (str, 'hl'),
+                  'reversal': (int, 3),
+                  'scale_mode': (str, 'percent'),
+                  'indent': (int, 3),
+                  'truncate': (int, 50),
+                  'style': (_get_bool, False),
+                  'trend_lines': (_get_bool, False)}
+
+    FORMATS = {'text': 'text/plain; charset=utf-8',
+               'json': 'application/json',
+               'svg': 'image/svg+xml',
+               'html': 'text/html; charset=utf-8'}
+
+    def __init__(self, host='127.0.0.1', port=8080, provider='yahoo',
+                 force_download=False, force_cache=False, period=10,
+                 refresh_interval=60, debug=False, max_charts=256):
+        """Initialize the server.
+
+        At most max_charts built charts are kept, the least recently
+        requested being dropped first. An instrument is dropped with
+        the last of its charts.
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if debug is True:
+            self._log.setLevel(logging.DEBUG)
+
+        self.host = host
+        self.port = port
+        self.provider = provider
+        self.force_download = force_download
+        self.force_cache = force_cache
+        self.period = period
+        self.refresh_interval = refresh_interval
+        self.debug = debug
+        self.max_charts = max_charts
+
+        # symbol: [instrument, data file mtime, time last checked, lock]
+        self._instruments = {}
+        # chart parameters: [chart, data file mtime, {format: bytes}, lock]
+        # from the least to the most recently used
+        self._charts = OrderedDict()
+        # Guards the two caches only, never a download or a build
+        self._lock = threading.Lock()
+        self._http_server = None
+
+    def get_chart(self, symbol, **parameters):
+        """Return a built chart, reusing the cached chart if it is current.
+
+        parameters are the chart parameters in PARAMETERS; any that are
+        left out take the pf command defaults.
+        """
+        entry = self._get_chart_entry(symbol, parameters)
+        return entry[0]
+
+    def render(self, symbol, output_format='text', **parameters):
+        """Return the rendered chart (or meta data) as bytes.
+
+        output_format is text, json, svg or html, or meta for the JSON
+        document with the meta data arrays included.
+        """
+        entry = self._get_chart_entry(symbol, parameters)
+        with entry[3]:
+            rendered = entry[2].get(output_format)
+            if rendered is None:
+                rendered = self._render(entry[0], output_format)
+                entry[2][output_format] = rendered
+            return rendered
+
+    def serve_forever(self):
+        """Start answering requests until interrupted."""
+        server = self
+
+        class Handler(_ChartRequestHandler):
+            chart_server = server
+
+        self._http_server = ThreadingHTTPServer((self.host, self.port),
+                                                Handler)
+        self._log.info('serving charts on http://%s:%s/', self.host,
+                       self.port)
+        try:
+            self._http_server.serve_forever()
+        finally:
+            self._http_server.server_close()
+
+    def shutdown(self):
+        """Stop the server started by serve_forever."""
+        if self._http_server is not None:
+            self._http_server.shutdown()
+
+    def _get_chart_entry(self, symbol, parameters):
+        values = {}
+        for name, (value_type, default) in self.PARAMETERS.items():
+            values[name] = value_type(parameters.get(name, default))
+        for name in parameters:
+            if name not in self.PARAMETERS:
+                raise ValueError('unknown parameter: ' + name)
+
+        symbol = symbol.upper()
+        key = (symbol,) + tuple(sorted(values.items()))
+        dropped = []
+        with self._lock:
+            entry = self._charts.get(key)
+            if entry is None:
+                entry = [None, None, {}, threading.Lock()]
+                self._charts[key] = entry
+                while len(self._charts) > self.max_charts:
+                    dropped_key, dropped_entry = self._charts.popitem(
+                        last=False)
+                    dropped.append(dropped_entry)
+                    self._drop_instrument(dropped_key[0])
+            else:
+                self._charts.move_to_end(key)
+            instrument_entry = self._get_instrument_entry(symbol)
+        for dropped_entry in dropped:
+            self._remove_snapshot(dropped_entry)
+
+        with entry[3]:
+            try:
+                return self._build_chart(symbol, values, entry,
+                                         instrument_entry)
+            except Exception:
+                if entry[0] is None:
+                    self._drop_chart(key, entry)
+                raise
+
+    def _build_chart(self, symbol, values, entry, instrument_entry):
+        # Called with the chart's lock held; the instrument is not
+        # changed while a chart is built from it
+        with instrument_entry[3]:
+            instrument, modification_time = self._get_instrument(
+                symbol, instrument_entry)
+            chart = entry[0]
+            if chart is None:
+                self._log.info('building chart for %s', symbol)
+                chart = PFChart(instrument, values['box_size'],
+                                values['duration'], values['interval'],
+                                values['method'], values['reversal'],
+                                values['style'], values['trend_lines'],
+                                self.debug, values['indent'],
+                                values['truncate'],
+                                scale_mode=values['scale_mode'],
+                                snapshot=True)
+                chart.create_chart()
+            elif entry[1] != modification_time:
+                self._log.info('updating chart for %s', symbol)
+                chart.create_chart()
+            else:
+                return entry
+            entry[0] = chart
+            entry[1] = modification_time
+            entry[2] = {}
+        return entry
+
+    def _remove_snapshot(self, entry):
+        # Snapshots of dropped charts would otherwise pile up in the
+        # data directory; a build in progress saves its snapshot first
+        with entry[3]:
+            if entry[0] is not None:
+                entry[0].remove_snapshot()
+
+    def _drop_chart(self, key, entry):
+        # Forget a chart that failed to build, and its instrument if no
+        # other chart is built from it, so it holds no place in the cache
+        with self._lock:
+            if self._charts.get(key) is entry:
+                del self._charts[key]
+            self._drop_instrument(key[0])
+
+    def _get_instrument_entry(self, symbol):
+        # Called with the cache lock held
+        entry = self._instruments.get(symbol)
+        if entry is None:
+            entry = [None, None, None, threading.Lock()]
+            self._instruments[symbol] = entry
+        return entry
+
+    def _drop_instrument(self, symbol):
+        # Called with the cache lock held; a request already using the
+        # instrument keeps its entry until it is done
+        if not any(key[0] == symbol for key in self._charts):
+            self._instruments.pop(symbol, None)
+
+    def _get_instrument(self, symbol, entry):
+        # Called with the instrument's lock held
+        now = time.time()
+        if entry[0] is None:
+            instrument = self._create_instrument(symbol)
+            instrument.populate_data()
+            entry[0] = instrument
+            entry[1] = os.path.getmtime(instrument.data_path)
+            entry[2] = now
+        elif now - entry[2] >= self.refresh_interval:
+            instrument = entry[0]
+            entry[2] = now
+            modification_time = os.path.getmtime(instrument.data_path)
+            if (instrument.download_required
+                    or modification_time != entry[1]):
+                self._log.info('reloading data for %s', symbol)
+                instrument.populate_data()
+                entry[1] = os.path.getmtime(instrument.data_path)
+        return entry[0], entry[1]
+
+    def _create_instrument(self, symbol):
+        instrument_class = get_instrument_class(self.provider)
+        return instrument_class(symbol, self.force_download,
+                                self.force_cache, self.period, self.debug)
+
+    def _render(self, chart, output_format):
+        from pypf.render import JsonRenderer
+        from pypf.render import get_renderer
+
+        if output_format == 'text':
+            return chart.chart.encode('utf-8')
+        if output_format == 'meta':
+            renderer = JsonRenderer(meta_data=True)
+        else:
+            renderer = get_renderer(output_format)
+        output = StringIO()
+        chart.write(output, renderer)
+        return output.getvalue().encode('utf-8')
+
+
+class _ChartRequestHandler(BaseHTTPRequestHandler):
+    """Answer GET /chart and GET /meta requests."""
+
+    chart_server = None
+
+    def do_GET(self):
+        """Handle a request."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        parameters = {name: values[-1] for name, values in query.items()}
+        symbol = parameters.pop('symbol', None)
+        output_format = parameters.pop('format', 'text')
+
+        if url.path == '/meta':
+            output_format = 'meta'
+        elif url.path != '/chart':
+            self.send_error(404, 'use /chart or /meta')
+            return
+        if symbol is None:
+            self.send_error(400, 'symbol is required')
+            return
+        if (output_format != 'meta'
+                and output_format not in ChartServer.FORMATS):
+            self.send_error(400, 'unknown format: ' + output_format)
+            return
+
+        try:
+            body = self.chart_server.render(symbol, output_format,
+                                            **parameters)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            self.send_error(500, repr(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type',
+                         ChartServer.FORMATS.get(output_format,
+                                                 'application/json'))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Send request logs to the logging module instead of stderr."""
+        self.chart_server._log.debug(format, *args)
@@ -0,0 +1,117 @@
+"""Classes to collect timings and counts from charts and instruments."""
+from collections import OrderedDict
+
+import logging
+import time
+
+
+class _Phase(object):
+    """Time one phase and record it in the stats when it ends."""
+
+    __slots__ = ('_stats', '_name', '_wall', '_cpu')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        self._stats.add_time(self._name, wall,
+                             time.process_time() - self._cpu)
+        logger = self._stats.logger
+        if logger is not None and logger.isEnabledFor(logging.INFO):
+            extra = dict(self._stats.context)
+            extra['phase'] = self._name
+            extra['duration'] = wall
+            logger.info('%s took %.3f ms', self._name, wall * 1000,
+                        extra=extra)
+        return False
+
+
+class _NullPhase(object):
+    """Stand in for _Phase when stats are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Stats(object):
+    """Per-phase wall and CPU time plus counts for one object.
+
+    When disabled, phase() returns a shared do-nothing context manager
+    and count() returns at once, so the hooks cost almost nothing.
+
+    If a logger is given, each timed phase is also logged at INFO with
+    the phase name, its duration and the entries of context (such as
+    the symbol) as record attributes.
+    """
+
+    def __init__(self, enabled=False, logger=None):
+        """Initialize the stats."""
+        self.enabled = enabled
+        self.logger = logger
+        self.context = {}
+        self.phases = OrderedDict()
+        self.counts = OrderedDict()
+
+    def phase(self, name):
+        """Return a context manager that times the named phase."""
+        if self.enabled:
+            return _Phase(self, name)
+        return _NULL_PHASE
+
+    def add_time(self, name, wall, cpu):
+        """Add wall and CPU seconds to the named phase."""
+        if name in self.phases:
+            total_wall, total_cpu = self.phases[name]
+            self.phases[name] = (total_wall + wall, total_cpu + cpu)
+        else:
+            self.phases[name] = (wall, cpu)
+
+    def count(self, name, value):
+        """Set the named count."""
+        if self.enabled:
+            self.counts[name] = value
+
+    def add(self, name, value):
+        """Add to the named count."""
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def reset(self):
+        """Clear all timings and counts."""
+        self.phases = OrderedDict()
+        self.counts = OrderedDict()
+
+    def report(self, title=''):
+        """Return the timings and counts formatted as a table."""
+        lines = []
+        if title:
+            lines.append(title)
+        lines.append('  {:<22}{:>10}{:>10}'.format('phase', 'wall ms',
+                                                   'cpu ms'))
+        total_wall = 0
+        total_cpu = 0
+        for name, (wall, cpu) in self.phases.items():
+            total_wall += wall
+            total_cpu += cpu
+            lines.append('  {:<22}{:>10.2f}{:>10.2f}'
+                         .format(name, wall * 1000, cpu * 1000))
+        lines.append('  {:<22}{:>10.2f}{:>10.2f}'
+                     .format('total', total_wall * 1000, total_cpu * 1000))
+        for name, value in self.counts.items():
+            lines.append('  {:<22}{:>10}'.format(name, value))
+        return '\n'.join(lines)
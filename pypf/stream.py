@@ -0,0 +1,187 @@
+"""Classes to keep point and figure charts current from a live feed.
+
+StreamingCharts keeps one PFBuilder per symbol and applies each trade
+or bar as it arrives, so the work per event is a scale lookup and a
+little bookkeeping, whatever the length of the history. Subscribers are
+told about each new box, reversal and signal change.
+"""
+from time import perf_counter
+from time import process_time
+
+import asyncio
+import logging
+
+from pypf.engine import PFBuilder
+from pypf.stats import Stats
+
+
+class ChartEvent(object):
+    """A change to one symbol's chart.
+
+    kind is 'box' when boxes are added to the current column, 'reversal'
+    when a new column is started and 'signal' when the signal changes.
+    """
+
+    __slots__ = ('kind', 'symbol', 'timestamp', 'direction',
+                 'column_index', 'boxes', 'value', 'signal')
+
+    def __init__(self, kind, symbol, timestamp, direction, column_index,
+                 boxes, value, signal):
+        """Initialize the event."""
+        self.kind = kind
+        self.symbol = symbol
+        self.timestamp = timestamp
+        self.direction = direction
+        self.column_index = column_index
+        self.boxes = boxes
+        self.value = value
+        self.signal = signal
+
+    def __repr__(self):
+        """Return a readable representation."""
+        return ('ChartEvent(%r, %r, %r, %r, column_index=%r, boxes=%r, '
+                'value=%r, signal=%r)' % (self.kind, self.symbol,
+                                          self.timestamp, self.direction,
+                                          self.column_index, self.boxes,
+                                          self.value, self.signal))
+
+    def as_dict(self):
+        """Return the event as a dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StreamingCharts(object):
+    """Point and figure charts for many symbols, updated per event.
+
+    Feed events with update() or, from an async iterator, with
+    consume(). Subscribers are callables that accept a ChartEvent; when
+    profiling, the time spent applying each event (not including the
+    subscribers) is recorded in stats.
+    """
+
+    def __init__(self, box_size=.01, reversal=3, debug=False,
+                 profile=False, scale_mode='percent'):
+        """Initialize the charts."""
+        self._log = logging.getLogger(self.__class__.__name__)
+        if debug is True:
+            self._log.setLevel(logging.DEBUG)
+
+        self.stats = Stats(profile, self._log)
+        self.box_size = box_size
+        self.reversal = reversal
+        self.scale_mode = scale_mode
+        self._builders = {}
+        self._subscribers = []
+
+    @property
+    def symbols(self):
+        """Get the symbols that have received events."""
+        return list(self._builders)
+
+    def get_builder(self, symbol):
+        """Get the PFBuilder holding a symbol's chart, or None."""
+        return self._builders.get(symbol.upper())
+
+    def subscribe(self, callback, symbols=None):
+        """Call callback with each ChartEvent.
+
+        If symbols is given, only events for those symbols are passed.
+        """
+        if symbols is not None:
+            symbols = frozenset(symbol.upper() for symbol in symbols)
+        self._subscribers.append((callback, symbols))
+
+    def unsubscribe(self, callback):
+        """Stop calling callback."""
+        self._subscribers = [(subscriber, symbols)
+                             for subscriber, symbols in self._subscribers
+                             if subscriber != callback]
+
+    def update(self, symbol, timestamp, high, low=None):
+        """Apply a trade (high only) or a bar to a symbol's chart.
+
+        Returns the list of events published for it.
+        """
+        stats = self.stats
+        if stats.enabled:
+            wall = perf_counter()
+            cpu = process_time()
+
+        symbol = symbol.upper()
+        builder = self._builders.get(symbol)
+        if builder is None:
+            self._log.debug('starting chart for %s', symbol)
+            builder = PFBuilder(self.box_size, self.reversal,
+                                self.scale_mode)
+            self._builders[symbol] = builder
+        engine = builder.engine
+        signal = engine.signal if engine is not None else 'none'
+
+        if low is None:
+            low = high
+        events = []
+        if builder.add_bar(timestamp, high, low):
+            engine = builder.engine
+            action = engine.action
+            if action != 'none':
+                kind = 'box' if len(action) == 1 else 'reversal'
+                events.append(ChartEvent(kind, symbol, timestamp,
+                                         engine.direction,
+                                         engine.column_index, engine.move,
+                                         engine.scale[engine.index],
+                                         engine.signal))
+            if engine.signal != signal:
+                events.append(ChartEvent('signal', symbol, timestamp,
+                                         engine.direction,
+                                         engine.column_index, 0,
+                                         engine.scale[engine.index],
+                                         engine.signal))
+
+        if stats.enabled:
+            stats.add_time('update', perf_counter() - wall,
+                           process_time() - cpu)
+            stats.add('events', 1)
+            stats.add('notifications', len(events))
+
+        for event in events:
+            self._publish(event)
+        return events
+
+    async def consume(self, feed):
+        """Apply every event from an async iterator until it ends.
+
+        Each item is (symbol, timestamp, price) for a trade or
+        (symbol, timestamp, high, low) for a bar. Subscribers that are
+        coroutine functions are awaited.
+        """
+        async for item in feed:
+            for event in self.update(*item):
+                for callback, symbols in self._subscribers:
+                    if symbols is None or event.symbol in symbols:
+                        if asyncio.iscoroutinefunction(callback):
+                            await callback(event)
+
+    def _publish(self, event):
+        for callback, symbols in self._subscribers:
+            if symbols is not None and event.symbol not in symbols:
+                continue
+            if asyncio.iscoroutinefunction(callback):
+                # Awaited by consume()
+                continue
+            callback(event)
+
+
+async def replay(instrument, interval='d', delay=0):
+    """Yield an instrument's bars as a feed for StreamingCharts.consume.
+
+    delay is the number of seconds to wait between bars; the default
+    replays as fast as the consumer accepts them.
+    """
+    if interval == 'd':
+        data = instrument.daily_historical_data
+    else:
+        data = instrument.get_intraday_data(int(interval[:-3]))
+    for bar in data.values():
+        yield instrument.symbol, bar['Date'], bar['High'], bar['Low']
+        if delay:
+            await asyncio.sleep(delay)
@@ -1 +1,77 @@
-"""Module initialization."""
+"""Module initialization and the data the tests share."""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypf.instrument import CsvSecurity
+
+
+def generate_bars(rnd, count):
+    """Return count random daily bars as csv lines.
+
+    The walk changes its drift and volatility from time to time and has
+    occasional gaps and flat days, so charts see long runs, frequent
+    reversals and moves across many boxes.
+    """
+    price = 10 ** rnd.uniform(0, 3)
+    drift = 0
+    volatility = .02
+    day = datetime.date(2000, 1, 3) + datetime.timedelta(
+        days=rnd.randint(0, 3650))
+    lines = []
+    while len(lines) < count:
+        if day.weekday() < 5:
+            if rnd.random() < .05:
+                drift = rnd.gauss(0, .005)
+                volatility = rnd.choice([.002, .01, .02, .05])
+            open_price = price
+            if rnd.random() < .01:
+                open_price = price * (1 + rnd.choice([-.2, .2]))
+            close = open_price * (1 + rnd.gauss(drift, volatility))
+            close = max(close, .5)
+            if rnd.random() < .03:
+                high = low = close = open_price
+            else:
+                high = max(open_price, close) * (
+                    1 + abs(rnd.gauss(0, volatility / 2)))
+                low = min(open_price, close) * (
+                    1 - abs(rnd.gauss(0, volatility / 2)))
+            lines.append('%s,%.2f,%.2f,%.2f,%.2f,%d\n' % (
+                day.isoformat(), open_price, high, low, close,
+                rnd.randint(100, 10 ** 7)))
+            price = close
+        day += datetime.timedelta(days=1)
+    return lines
+
+
+class DataTestCase(unittest.TestCase):
+    """Base class of tests that chart csv files in a temporary directory."""
+
+    def setUp(self):
+        """Create a directory for the data."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the data."""
+        shutil.rmtree(self.directory)
+
+    def _write_bars(self, symbol, lines):
+        """Write csv lines of daily bars to a file and return its path."""
+        path = os.path.join(self.directory, symbol + '.csv')
+        with open(path, 'w') as csvfile:
+            csvfile.write('Date,Open,High,Low,Close,Volume\n')
+            csvfile.writelines(lines)
+        return path
+
+    def _get_instrument(self, symbol, lines=None):
+        """Return a CsvSecurity of the symbol's csv file.
+
+        The lines are written to the file first unless lines is None.
+        """
+        if lines is None:
+            path = os.path.join(self.directory, symbol + '.csv')
+        else:
+            path = self._write_bars(symbol, lines)
+        return CsvSecurity(symbol, path, self.directory)
@@ -0,0 +1,91 @@
+"""Tests of the dividend adjustment of Yahoo's unadjusted prices."""
+from decimal import Decimal
+
+import csv
+import unittest
+
+from pypf.instrument import YahooSecurity
+from pypf.tests import DataTestCase
+
+
+DATES = ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05',
+         '2024-01-08']
+CLOSES = [Decimal(close) for close in ['10.00', '20.00', '25.00', '20.00',
+                                       '40.00']]
+
+# A dividend on the first bar, a split, a dividend mid series and one
+# on the last bar
+EVENTS = ('Date,Event,Value\n'
+          '2024-01-02,dividend,0.50\n'
+          '2024-01-03,split,2:1\n'
+          '2024-01-04,dividend,1.00\n'
+          '2024-01-08,dividend,2.00\n')
+
+
+class AdjustmentTestCase(DataTestCase):
+    """Check get_adjustment_factors against factors worked by hand."""
+
+    def setUp(self):
+        """Create a security in a temporary data directory."""
+        super().setUp()
+        self.security = YahooSecurity('TEST', force_cache=True,
+                                      data_directory=self.directory)
+
+    def _get_events(self, text):
+        path = self.security.events_path
+        with open(path, 'w') as events_file:
+            events_file.write(text)
+        return self.security._read_events()
+
+    def _get_factors(self, text):
+        return self.security.get_adjustment_factors(DATES, CLOSES,
+                                                    self._get_events(text))
+
+    def test_no_events(self):
+        """Without events every factor must be 1."""
+        self.assertEqual([1] * 5, self._get_factors('Date,Event,Value\n'))
+
+    def test_dividend(self):
+        """A dividend must scale the bars before its ex-date."""
+        # 1 - 1.00 / 20.00, the close before the ex-date
+        self.assertEqual([Decimal('0.95'), Decimal('0.95'), 1, 1, 1],
+                         self._get_factors(
+                             'Date,Event,Value\n2024-01-04,dividend,1.00\n'))
+
+    def test_first_bar(self):
+        """A dividend on the first bar has no earlier bars to scale."""
+        self.assertEqual([1] * 5, self._get_factors(
+            'Date,Event,Value\n2024-01-02,dividend,0.50\n'))
+
+    def test_split(self):
+        """Yahoo's prices already allow for splits, so they are ignored."""
+        self.assertEqual([1] * 5, self._get_factors(
+            'Date,Event,Value\n2024-01-03,split,2:1\n'))
+
+    def test_events(self):
+        """Dividends must compound from the last bar back."""
+        # 1 - 2.00 / 20.00 before the last bar, then also 0.95
+        self.assertEqual([Decimal('0.855'), Decimal('0.855'),
+                          Decimal('0.9'), Decimal('0.9'), 1],
+                         self._get_factors(EVENTS))
+
+    def test_adjusted_bars(self):
+        """Loaded bars must be the raw bars times their factors."""
+        with open(self.security.data_path, 'w') as csvfile:
+            writer = csv.writer(csvfile, lineterminator='\n')
+            writer.writerow(['Date', 'Open', 'High', 'Low', 'Close',
+                             'Volume'])
+            for date, close in zip(DATES, CLOSES):
+                writer.writerow([date, close, close + 1, close - 1, close,
+                                 100])
+        self._get_events(EVENTS)
+        self.security.populate_data()
+        closes = [bar['Close'] for bar in
+                  self.security.daily_historical_data.values()]
+        self.assertEqual([Decimal('8.55'), Decimal('17.10'),
+                          Decimal('22.50'), Decimal('18.00'),
+                          Decimal('40.00')], closes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Tests that a PriceArchive reads back the bars written to it."""
+from collections import OrderedDict
+from decimal import Decimal
+
+import datetime
+import os
+import unittest
+
+from pypf.archive import PriceArchive
+from pypf.instrument import CsvSecurity
+from pypf.tests import DataTestCase
+
+
+def _get_bars(first, count):
+    # Weekday bars from first, with prices that rise and fall
+    bars = OrderedDict()
+    day = first
+    close = 5000
+    while len(bars) < count:
+        if day.weekday() < 5:
+            close += (len(bars) % 7 - 3) * 13
+            date = day.isoformat()
+            bars[date] = {'Date': date,
+                          'Open': Decimal(close - 25).scaleb(-2),
+                          'High': Decimal(close + 110).scaleb(-2),
+                          'Low': Decimal(close - 90).scaleb(-2),
+                          'Close': Decimal(close).scaleb(-2),
+                          'Volume': 1000 + len(bars) * 37}
+        day += datetime.timedelta(days=1)
+    return bars
+
+
+class PriceArchiveTestCase(DataTestCase):
+    """Write and read archives of bars over several years."""
+
+    def setUp(self):
+        """Create a directory for the archives."""
+        super().setUp()
+        self.path = os.path.join(self.directory, 'TEST.pfa')
+
+    def test_round_trip(self):
+        """Every bar written must be read back exactly."""
+        bars = _get_bars(datetime.date(2021, 11, 1), 600)
+        PriceArchive(self.path).write(bars, [['TEST.csv', 1, 2]])
+
+        archive = PriceArchive(self.path)
+        self.assertTrue(archive.exists)
+        self.assertEqual(600, archive.bars)
+        self.assertEqual([['TEST.csv', 1, 2]], archive.source)
+        self.assertEqual(list(bars.items()), list(archive.read().items()))
+
+    def test_read_last_years(self):
+        """Reading some bars must read only the years that hold them."""
+        bars = _get_bars(datetime.date(2021, 11, 1), 600)
+        PriceArchive(self.path).write(bars, [])
+        archive = PriceArchive(self.path)
+
+        last_year = [date for date in bars if date >= '2023']
+        data = archive.read(len(last_year))
+        self.assertEqual(last_year, list(data))
+
+        data = archive.read(len(last_year) + 1)
+        self.assertEqual([date for date in bars if date >= '2022'],
+                         list(data))
+
+    def test_append_to_year(self):
+        """Appending must rewrite the last year and copy the others."""
+        bars = _get_bars(datetime.date(2022, 6, 1), 300)
+        PriceArchive(self.path).write(bars, [])
+        before = PriceArchive(self.path)._read_raw_blocks()
+
+        bars = _get_bars(datetime.date(2022, 6, 1), 310)
+        PriceArchive(self.path).write(bars, [['TEST.csv', 3, 4]])
+        archive = PriceArchive(self.path)
+        after = archive._read_raw_blocks()
+
+        self.assertEqual(['2022', '2023'], sorted(after))
+        self.assertEqual(before['2022'], after['2022'])
+        self.assertNotEqual(before['2023'], after['2023'])
+        self.assertEqual(310, archive.bars)
+        self.assertEqual(list(bars.items()), list(archive.read().items()))
+
+    def test_data_file_elsewhere(self):
+        """The archive of a data file must be in the data directory."""
+        data_directory = os.path.join(self.directory, 'data')
+        data_path = os.path.join(self.directory, 'prices.csv')
+        with open(data_path, 'w') as csvfile:
+            csvfile.write('Date,Open,High,Low,Close,Volume\n')
+            for bar in _get_bars(datetime.date(2023, 1, 2), 20).values():
+                csvfile.write('%s,%s,%s,%s,%s,%s\n' % (
+                    bar['Date'], bar['Open'], bar['High'], bar['Low'],
+                    bar['Close'], bar['Volume']))
+
+        security = CsvSecurity('TEST', data_path, data_directory)
+        security.archive = True
+        security.populate_data()
+        self.assertEqual(os.path.join(data_directory, 'prices.pfa'),
+                         security.archive_path)
+        self.assertTrue(os.path.isfile(security.archive_path))
+        self.assertEqual(['data', 'prices.csv'],
+                         sorted(os.listdir(self.directory)))
+
+        archived = CsvSecurity('TEST', data_path, data_directory)
+        archived.archive = True
+        archived.populate_data()
+        self.assertEqual(list(security.daily_historical_data.values()),
+                         list(archived.daily_historical_data.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests of average true ranges and the box sizes taken from them."""
+from decimal import Decimal
+
+import unittest
+
+from pypf.chart import PFChart
+from pypf.tests import DataTestCase
+
+
+# (date, high, low, close) with true ranges of 2, 2, 1, 3 and 4
+BARS = [('2024-01-02', '11.00', '9.00', '10.00'),
+        ('2024-01-03', '12.00', '10.00', '11.00'),
+        ('2024-01-04', '11.50', '10.50', '11.00'),
+        ('2024-01-05', '14.00', '12.00', '13.00'),
+        ('2024-01-08', '13.00', '9.00', '10.00')]
+
+
+class AverageTrueRangeTestCase(DataTestCase):
+    """Compare average true ranges with hand figures."""
+
+    def setUp(self):
+        """Write the bars."""
+        super().setUp()
+        self.instrument = self._get_instrument(
+            'TEST', ['%s,%s,%s,%s,%s,100\n' % (date, close, high, low, close)
+                     for date, high, low, close in BARS])
+        self.instrument.populate_data()
+
+    def test_average(self):
+        """The ranges must be averaged, then smoothed as Wilder did."""
+        # 2, (2 + 2) / 2, (2 + 1) / 2, (1.5 + 3) / 2, (2.25 + 4) / 2
+        self.assertEqual(Decimal('3.125'),
+                         self.instrument.get_average_true_range(2))
+        # A period as long as the data is the plain mean
+        self.assertEqual(Decimal('2.4'),
+                         self.instrument.get_average_true_range(5))
+
+    def test_window(self):
+        """Only the last bars up to end_date must be used."""
+        # The first of the bars has no close before it: 1, then
+        # (1 + 3) / 2 and (2 + 4) / 2
+        self.assertEqual(Decimal('3'),
+                         self.instrument.get_average_true_range(2, bars=3))
+        self.assertEqual(Decimal('2.25'),
+                         self.instrument.get_average_true_range(
+                             2, end_date='2024-01-05'))
+        self.assertEqual(Decimal('2'),
+                         self.instrument.get_average_true_range(
+                             2, bars=2, end_date='2024-01-05'))
+        self.assertRaises(ValueError,
+                          self.instrument.get_average_true_range, 2,
+                          end_date='2023-12-29')
+
+    def test_cache(self):
+        """An average must be computed once until the data is reloaded."""
+        instrument = self.instrument
+        average = instrument.get_average_true_range(2, bars=3)
+        self.assertIs(average, instrument.get_average_true_range(2, bars=3))
+        self.assertIn((2, 'd', 3, None), instrument._average_true_ranges)
+        instrument.populate_data()
+        self.assertEqual({}, instrument._average_true_ranges)
+        self.assertEqual(average,
+                         instrument.get_average_true_range(2, bars=3))
+
+    def test_box_size(self):
+        """Percent boxes must keep a hundredth of a percent."""
+        chart = PFChart(self.instrument, box_size='atr:2', reversal=1)
+        chart.create_chart()
+        # 3.125 / 10
+        self.assertEqual(Decimal('0.3125'), chart.box_size)
+        self.assertEqual('31.25', chart.box_label)
+
+        chart = PFChart(self.instrument, box_size='atr:2', reversal=1,
+                        scale_mode='point')
+        chart.create_chart()
+        self.assertEqual(Decimal('3.12'), chart.box_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Tests of the trades, equity and drawdown of a Backtest."""
+from collections import OrderedDict
+from decimal import Decimal
+
+import random
+import unittest
+
+from pypf.backtest import Backtest
+from pypf.chart import PFChart
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+# (date, close, signal) for a trade that wins, a sell signal, then a
+# trade still open on the last bar
+ROWS = [('2024-01-02', '10.00', 'none'),
+        ('2024-01-03', '10.00', 'buy'),
+        ('2024-01-04', '12.00', 'buy'),
+        ('2024-01-05', '9.00', 'buy'),
+        ('2024-01-08', '11.00', 'sell'),
+        ('2024-01-09', '10.00', 'sell'),
+        ('2024-01-10', '10.00', 'buy'),
+        ('2024-01-11', '12.00', 'buy')]
+
+
+def _get_meta_data(rows):
+    return OrderedDict((date, {'date': date, 'close': Decimal(close),
+                               'signal': signal})
+                       for date, close, signal in rows)
+
+
+class BacktestTestCase(unittest.TestCase):
+    """Check a backtest of a small fixed series against hand figures."""
+
+    def test_equity(self):
+        """Equity must follow the position from bar to bar."""
+        result = Backtest().run(_get_meta_data(ROWS))
+        self.assertEqual([date for date, close, signal in ROWS],
+                         result.dates)
+        for expected, value in zip([1, 1, 1.2, .9, 1.1, 1.1, 1.1, 1.32],
+                                   result.equity):
+            self.assertAlmostEqual(expected, value)
+        self.assertAlmostEqual(.32, result.total_return)
+        # 5 of the 8 bars are held
+        self.assertAlmostEqual(5 / 8, result.exposure)
+
+    def test_max_drawdown(self):
+        """The drawdown must be from the 1.2 peak to the .9 trough."""
+        result = Backtest().run(_get_meta_data(ROWS))
+        self.assertAlmostEqual(.25, result.max_drawdown)
+        self.assertEqual(0.0, Backtest().run(OrderedDict()).max_drawdown)
+
+    def test_trades(self):
+        """The closed trade and the open one must be recorded."""
+        trades = Backtest().run(_get_meta_data(ROWS)).trades
+        self.assertEqual(2, len(trades))
+        closed, marked = trades
+        self.assertFalse(closed.open)
+        self.assertEqual(('2024-01-03', '2024-01-08', 3),
+                         (closed.entry_date, closed.exit_date, closed.bars))
+        self.assertAlmostEqual(.1, closed.trade_return)
+
+        # The open trade is marked to the last close
+        self.assertTrue(marked.open)
+        self.assertEqual(('2024-01-10', '2024-01-11', 2),
+                         (marked.entry_date, marked.exit_date, marked.bars))
+        self.assertAlmostEqual(12, marked.exit_price)
+        self.assertAlmostEqual(.2, marked.trade_return)
+        self.assertEqual(1.0, Backtest().run(_get_meta_data(ROWS)).win_rate)
+
+    def test_costs(self):
+        """Slippage and commission must move each fill against the trade."""
+        result = Backtest(slippage=.01, commission=.002).run(
+            _get_meta_data(ROWS[:5]))
+        entry = 10 * 1.01 * 1.002
+        exit = 11 * .99 * .998
+        trade = result.trades[0]
+        self.assertAlmostEqual(entry, trade.entry_price)
+        self.assertAlmostEqual(exit, trade.exit_price)
+        self.assertAlmostEqual(exit / entry - 1, result.total_return)
+        self.assertRaises(ValueError, Backtest, -.01)
+        self.assertRaises(ValueError, Backtest, 0, -.01)
+
+    def test_no_signal(self):
+        """Without a buy signal nothing is traded."""
+        result = Backtest().run(_get_meta_data(
+            [(date, close, 'none') for date, close, signal in ROWS]))
+        self.assertEqual([], result.trades)
+        self.assertEqual(0.0, result.total_return)
+        self.assertEqual(0.0, result.exposure)
+
+
+class ChartBacktestTestCase(DataTestCase):
+    """Backtest charts from their engines and from their meta data."""
+
+    def test_run_chart(self):
+        """run_chart must match a run over the created chart's meta data."""
+        for seed in range(5):
+            rnd = random.Random(seed)
+            instrument = self._get_instrument('TEST',
+                                              generate_bars(rnd, 600))
+            scale_mode = rnd.choice(['percent', 'point'])
+            if scale_mode == 'percent':
+                box_size = rnd.choice([.01, .02, .03])
+            else:
+                box_size = rnd.choice([.1, .25])
+            parameters = {'box_size': box_size,
+                          'reversal': rnd.choice([1, 3]),
+                          'duration': 2,
+                          'scale_mode': scale_mode}
+            with self.subTest(seed=seed, **parameters):
+                backtest = Backtest(slippage=.001, commission=.001)
+                chart = PFChart(instrument, **parameters)
+                chart.create_chart(render=False)
+                expected = backtest.run(chart.chart_meta_data)
+                result = backtest.run_chart(PFChart(instrument,
+                                                    **parameters))
+                self.assertGreater(len(expected.trades), 0)
+                self.assertEqual(expected.dates, result.dates)
+                self.assertEqual(expected.equity, result.equity)
+                self.assertEqual([trade.as_dict()
+                                  for trade in expected.trades],
+                                 [trade.as_dict() for trade in result.trades])
+
+
+if __name__ == '__main__':
+    unittest.main()
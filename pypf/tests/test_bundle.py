@@ -0,0 +1,125 @@
+"""Tests that a ChartBundle draws the charts PFChart draws alone."""
+from html.parser import HTMLParser
+from io import StringIO
+from xml.etree import ElementTree
+
+import json
+import random
+import unittest
+
+from pypf.bundle import ChartBundle
+from pypf.chart import PFChart
+from pypf.render import get_renderer
+from pypf.render import JsonRenderer
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+class ChartBundleTestCase(DataTestCase):
+    """Compare bundled charts with independently built charts."""
+
+    def setUp(self):
+        """Write the generated data."""
+        super().setUp()
+        self._write_bars('TEST', generate_bars(random.Random(11), 1000))
+
+    def _assert_charts_equal(self, expected, chart):
+        self.assertEqual(expected.interval, chart.interval)
+        self.assertEqual(expected.duration, chart.duration)
+        self.assertEqual(expected.chart, chart.chart)
+        self.assertEqual(expected.chart_meta_data, chart.chart_meta_data)
+        self.assertEqual([(column.direction, column.low, column.high)
+                          for column in expected.columns],
+                         [(column.direction, column.low, column.high)
+                          for column in chart.columns])
+
+    def test_charts(self):
+        """Each bundled chart must be the chart of its interval."""
+        for scale_mode, box_size in [('percent', .02), ('point', .5)]:
+            with self.subTest(scale_mode=scale_mode):
+                parameters = {'box_size': box_size, 'duration': 1,
+                              'reversal': 2, 'scale_mode': scale_mode}
+                instrument = self._get_instrument('TEST')
+                loads = []
+                populate_data = instrument.populate_data
+
+                def count_loads(bars=None):
+                    loads.append(bars)
+                    populate_data(bars)
+
+                instrument.populate_data = count_loads
+                bundle = ChartBundle(instrument, **parameters)
+                bundle.create_charts()
+                self.assertEqual(1, len(loads))
+                self.assertEqual(['d', 'w', 'm'],
+                                 [chart.interval for chart in bundle])
+                for interval in ChartBundle.INTERVALS:
+                    expected = PFChart(self._get_instrument('TEST'),
+                                       interval=interval, **parameters)
+                    expected.create_chart()
+                    self._assert_charts_equal(expected, bundle[interval])
+
+    def test_durations(self):
+        """durations must override the duration of its intervals."""
+        parameters = {'box_size': .01, 'duration': .5, 'reversal': 3}
+        bundle = ChartBundle(self._get_instrument('TEST'),
+                             intervals=['d', 'm'], durations={'m': 3},
+                             **parameters)
+        bundle.create_charts()
+        self.assertEqual(2, len(bundle))
+        self.assertEqual(.5, bundle['d'].duration)
+        self.assertEqual(3, bundle['m'].duration)
+        for interval, duration in [('d', .5), ('m', 3)]:
+            expected = PFChart(self._get_instrument('TEST'),
+                               interval=interval,
+                               **dict(parameters, duration=duration))
+            expected.create_chart()
+            self._assert_charts_equal(expected, bundle[interval])
+
+    def _write(self, bundle, renderer):
+        output = StringIO()
+        bundle.write(output, renderer)
+        return output.getvalue()
+
+    def test_write(self):
+        """Each format must write one document of every chart."""
+        bundle = ChartBundle(self._get_instrument('TEST'), box_size=.02,
+                             duration=1, reversal=2)
+        bundle.create_charts(render=False)
+
+        document = json.loads(self._write(bundle, JsonRenderer()))
+        self.assertEqual(ChartBundle.INTERVALS, list(document))
+        for interval in ChartBundle.INTERVALS:
+            self.assertEqual(interval, document[interval]['interval'])
+            self.assertEqual(len(bundle[interval].columns),
+                             len(document[interval]['columns']['low']))
+
+        svg = self._write(bundle, get_renderer('svg'))
+        self.assertEqual(1, svg.count('<?xml'))
+        root = ElementTree.fromstring(svg)
+        charts = root.findall('{http://www.w3.org/2000/svg}svg')
+        self.assertEqual(3, len(charts))
+        self.assertEqual(int(root.get('height')),
+                         max(int(chart.get('y')) + int(chart.get('height'))
+                             for chart in charts))
+
+        page = self._write(bundle, get_renderer('html'))
+        self.assertEqual(1, page.count('<!DOCTYPE html>'))
+        tags = []
+        parser = HTMLParser()
+        parser.handle_starttag = lambda tag, attrs: tags.append(tag)
+        parser.feed(page)
+        parser.close()
+        self.assertEqual(1, tags.count('html'))
+        self.assertEqual(1, tags.count('body'))
+        self.assertEqual(3, tags.count('svg'))
+        self.assertEqual(3, tags.count('h2'))
+        start = page.index('<svg')
+        for interval in ChartBundle.INTERVALS:
+            end = page.index('</svg>', start) + len('</svg>')
+            ElementTree.fromstring(page[start:end])
+            start = page.find('<svg', end)
+
+
+if __name__ == '__main__':
+    unittest.main()
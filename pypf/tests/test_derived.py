@@ -0,0 +1,132 @@
+"""Tests of ratio and spread instruments derived from other instruments."""
+from decimal import Decimal
+
+import os
+import unittest
+
+from pypf.chart import PFChart
+from pypf.instrument import DerivedInstrument
+from pypf.tests import DataTestCase
+
+
+# Bars of two instruments as (date, open, high, low, close); B has no
+# bar on 2024-01-04 and A none on 2024-01-08
+BARS_A = [('2024-01-02', '10.00', '11.00', '9.00', '10.00'),
+          ('2024-01-03', '10.00', '12.00', '10.00', '11.00'),
+          ('2024-01-04', '11.00', '11.00', '10.00', '10.50'),
+          ('2024-01-05', '10.00', '11.00', '9.50', '1.00')]
+BARS_B = [('2024-01-02', '5.00', '11.00', '4.00', '5.00'),
+          ('2024-01-03', '5.00', '6.00', '5.00', '5.50'),
+          ('2024-01-05', '5.00', '5.50', '4.50', '3.00'),
+          ('2024-01-08', '5.00', '5.50', '4.50', '5.00')]
+
+
+def _get_lines(bars):
+    return [','.join(bar) + ',100\n' for bar in bars]
+
+
+class DerivedInstrumentTestCase(DataTestCase):
+    """Derive instruments from small csv files."""
+
+    def setUp(self):
+        """Write the bars of A and B."""
+        super().setUp()
+        self.a = self._get_instrument('A', _get_lines(BARS_A))
+        self.b = self._get_instrument('B', _get_lines(BARS_B))
+
+    def _get_derived(self, method, multiplier=100):
+        derived = DerivedInstrument([self.a, self.b], method, multiplier)
+        derived.populate_data()
+        return derived
+
+    def test_dates(self):
+        """Only the dates both instruments have must be kept."""
+        for method in ['ratio', 'spread']:
+            with self.subTest(method=method):
+                self.assertEqual(['2024-01-02', '2024-01-03', '2024-01-05'],
+                                 list(self._get_derived(method)
+                                      .daily_historical_data))
+
+    def test_multiplier(self):
+        """The multiplier must keep the ratio's precision."""
+        derived = self._get_derived('ratio')
+        self.assertEqual('A/B', derived.symbol)
+        self.assertEqual(Decimal('33.33'),
+                         derived.daily_historical_data['2024-01-05']['Close'])
+        self.assertEqual(Decimal('200.00'),
+                         derived.daily_historical_data['2024-01-03']['Close'])
+        derived = self._get_derived('ratio', 1)
+        self.assertEqual(Decimal('0.33'),
+                         derived.daily_historical_data['2024-01-05']['Close'])
+
+    def test_widened(self):
+        """The high and low must include the open and close."""
+        bar = self._get_derived('ratio').daily_historical_data['2024-01-02']
+        # The high ratio of 11 / 11 is below the open of 10 / 5 and the
+        # low ratio of 9 / 4 above it
+        self.assertEqual((Decimal('200.00'),) * 4,
+                         (bar['Open'], bar['High'], bar['Low'],
+                          bar['Close']))
+
+        bar = self._get_derived('spread').daily_historical_data['2024-01-02']
+        # The high spread of 11 - 11 is below the open of 10 - 5
+        self.assertEqual((Decimal('5.00'), Decimal('5.00'), Decimal('5.00'),
+                          Decimal('5.00')),
+                         (bar['Open'], bar['High'], bar['Low'],
+                          bar['Close']))
+
+    def test_negative_spread(self):
+        """A spread below zero needs a point scale."""
+        derived = self._get_derived('spread')
+        self.assertEqual(Decimal('-2.00'),
+                         derived.daily_historical_data['2024-01-05']['Close'])
+        chart = PFChart(derived)
+        self.assertRaisesRegex(ValueError, 'point', chart.create_chart)
+
+        chart = PFChart(derived, box_size=1, reversal=1, scale_mode='point')
+        chart.create_chart()
+        self.assertEqual(Decimal('-2.00'),
+                         chart.chart_meta_data['2024-01-05']['close'])
+
+    def test_shared_benchmark(self):
+        """A populated benchmark must be shared, not loaded again."""
+        benchmark = self.b
+        benchmark.populate_data()
+        loads = []
+        populate_data = benchmark.populate_data
+        benchmark.populate_data = lambda bars=None: loads.append(bars)
+        try:
+            derived = [DerivedInstrument([instrument, benchmark])
+                       for instrument in [self.a, self.a, self.b]]
+            for instrument in derived:
+                instrument.populate_data()
+        finally:
+            benchmark.populate_data = populate_data
+        self.assertEqual([], loads)
+        self.assertIs(derived[0].instruments[1], derived[2].instruments[0])
+        self.assertEqual(Decimal('100.00'),
+                         derived[2].daily_historical_data['2024-01-08']
+                         ['Close'])
+
+    def test_archive(self):
+        """Each instrument must keep its own archive setting."""
+        self.a.archive = True
+        derived = DerivedInstrument([self.a, self.b])
+        derived.populate_data()
+        self.assertTrue(os.path.isfile(self.a.archive_path))
+        self.assertFalse(self.b.archive)
+        self.assertFalse(os.path.isfile(self.b.archive_path))
+
+    def test_reload(self):
+        """Average true ranges must not outlive a reload."""
+        derived = self._get_derived('spread')
+        average = derived.get_average_true_range(2)
+        self._write_bars('A', _get_lines([(date, o, str(Decimal(h) + 10), l, c)
+                                          for date, o, h, l, c in BARS_A]))
+        self.a.populate_data()
+        derived.populate_data()
+        self.assertGreater(derived.get_average_true_range(2), average)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+"""Tests that the optimized PFChart builds the same charts as the original.
+
+Price series and chart parameters are generated at random from a seed,
+and each chart is built by the frozen reference_chart.PFChart and by
+pypf.chart.PFChart along each of its paths: built at once, windowed,
+resumed from a snapshot and unpickled. The columns, meta data and chart
+text must be identical. The time each path takes is added to stats and
+reported on stderr when PYPF_EQUIVALENCE_REPORT is set.
+
+Set PYPF_EQUIVALENCE_CASES and PYPF_EQUIVALENCE_SEED to run more or
+different cases; a failure names the seed and parameters that repeat it.
+"""
+from time import perf_counter
+from time import process_time
+
+import os
+import pickle
+import random
+import re
+import sys
+import unittest
+
+from pypf.chart import PFChart
+from pypf.instrument import CsvSecurity
+from pypf.stats import Stats
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+from pypf.tests import reference_chart
+
+
+CASES = int(os.environ.get('PYPF_EQUIVALENCE_CASES', 25))
+SEED = int(os.environ.get('PYPF_EQUIVALENCE_SEED', 0))
+REPORT = bool(os.environ.get('PYPF_EQUIVALENCE_REPORT'))
+
+BOX_SIZES = [.01, .02, .03, .05]
+DURATIONS = [.5, 1, 3, 10]
+METHODS = ['hl', 'c']
+REVERSALS = [1, 2, 3, 5]
+TRUNCATES = [0, 0, 3, 20, 50]
+
+# The reference styles month markers in its columns
+STYLE_PATTERN = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class ReferenceChart(reference_chart.PFChart):
+    """The reference chart, keeping its columns before they are drawn.
+
+    The reference draws trend lines into its columns and truncates them
+    in place, so they are recorded before either happens.
+    """
+
+    def _set_trend_lines(self):
+        self.reference_columns = _get_reference_columns(self._chart_data)
+        super()._set_trend_lines()
+
+    def _get_chart(self):
+        if not self.trend_lines:
+            self.reference_columns = _get_reference_columns(
+                self._chart_data)
+        return super()._get_chart()
+
+
+def _get_reference_columns(chart_data):
+    return [[(index, STYLE_PATTERN.sub('', column[index][0]),
+              column[index][1])
+             for index in sorted(column)]
+            for column in chart_data[1:]]
+
+
+def _get_columns(chart):
+    return [[(index, column.symbol(index), column.date(index))
+             for index in range(column.low, column.high + 1)]
+            for column in chart.columns]
+
+
+def generate_parameters(rnd):
+    """Return random chart parameters the reference supports."""
+    return {'box_size': rnd.choice(BOX_SIZES),
+            'duration': rnd.choice(DURATIONS),
+            'method': rnd.choice(METHODS),
+            'reversal': rnd.choice(REVERSALS),
+            'style': rnd.choice([True, False]),
+            'trend_lines': rnd.choice([True, False]),
+            'indent': rnd.randint(0, 4),
+            'truncate': rnd.choice(TRUNCATES)}
+
+
+class EquivalenceTestCase(DataTestCase):
+    """Compare PFChart with the reference on generated data."""
+
+    stats = Stats(True)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Report the time spent on each path if asked to."""
+        if REPORT:
+            print(cls.stats.report('PFChart equivalence'), file=sys.stderr)
+
+    def test_equivalence(self):
+        """Every path must build the reference chart."""
+        for case in range(CASES):
+            seed = SEED + case
+            rnd = random.Random(seed)
+            lines = generate_bars(rnd, rnd.randint(30, 1500))
+            parameters = generate_parameters(rnd)
+            with self.subTest(seed=seed, bars=len(lines), **parameters):
+                self._check_case(seed, rnd, lines, parameters)
+
+    def test_resume_after_append(self):
+        """A chart must resume from its snapshot after each new bar.
+
+        The window moves on with every bar, so its first bars are built
+        again until the chart rejoins the snapshot's columns.
+        """
+        for case in range(CASES // 5):
+            seed = SEED + case
+            rnd = random.Random(seed)
+            lines = generate_bars(rnd, rnd.randint(300, 700))
+            parameters = dict(generate_parameters(rnd),
+                              box_size=rnd.choice([.01, .02]),
+                              duration=rnd.choice([.5, 1]),
+                              reversal=rnd.choice([1, 2, 3]))
+            windowed = rnd.choice([True, False])
+            resumed_parameters = dict(parameters, windowed=windowed,
+                                      snapshot=True, profile=True)
+            with self.subTest(seed=seed, bars=len(lines), windowed=windowed,
+                              **parameters):
+                symbol = 'T%d' % seed
+                path = self._write_bars(symbol, lines[:-3])
+                self._create(PFChart, symbol, path, resumed_parameters,
+                             'snapshot')
+                for count in range(len(lines) - 2, len(lines) + 1):
+                    self._write_bars(symbol, lines[:count])
+                    resumed = self._create(PFChart, symbol, path,
+                                           resumed_parameters, 'resumed')
+                    self.assertGreater(
+                        resumed.stats.counts['resumed_bars'], 0)
+                    reference = self._create(ReferenceChart, symbol, path,
+                                             parameters, 'reference')
+                    self._assert_same(reference, resumed, 'resumed')
+
+    def _check_case(self, seed, rnd, lines, parameters):
+        symbol = 'T%d' % seed
+        self.stats.add('bars', len(lines))
+
+        # Snapshot some of the bars first, since the chart title shows
+        # when the data file was last written
+        path = self._write_bars(symbol, lines[:rnd.randint(2, len(lines))])
+        self._create(PFChart, symbol, path,
+                     dict(parameters, snapshot=True), 'snapshot')
+        self._write_bars(symbol, lines)
+
+        reference = self._create(ReferenceChart, symbol, path, parameters,
+                                 'reference')
+        chart = self._create(PFChart, symbol, path, parameters, 'chart')
+        self._assert_same(reference, chart, 'chart')
+
+        if parameters['truncate'] > 0:
+            windowed = self._create(PFChart, symbol, path,
+                                    dict(parameters, windowed=True),
+                                    'windowed')
+            self._assert_same(reference, windowed, 'windowed')
+
+        resumed = self._create(PFChart, symbol, path,
+                               dict(parameters, snapshot=True, profile=True),
+                               'resumed')
+        self.stats.add('resumed_bars', resumed.stats.counts['resumed_bars'])
+        self._assert_same(reference, resumed, 'resumed')
+
+        wall = perf_counter()
+        cpu = process_time()
+        unpickled = pickle.loads(pickle.dumps(chart))
+        self.stats.add_time('pickled', perf_counter() - wall,
+                            process_time() - cpu)
+        self._assert_same(reference, unpickled, 'pickled')
+
+    def _create(self, chart_class, symbol, path, parameters, name):
+        instrument = CsvSecurity(symbol, path, self.directory)
+        chart = chart_class(instrument, **parameters)
+        wall = perf_counter()
+        cpu = process_time()
+        chart.create_chart()
+        self.stats.add_time(name, perf_counter() - wall,
+                            process_time() - cpu)
+        return chart
+
+    def _assert_same(self, reference, chart, path):
+        self.assertEqual(reference.chart, chart.chart, path)
+        self.assertEqual(list(reference.chart_meta_data.items()),
+                         list(chart.chart_meta_data.items()), path)
+        first = chart.first_column - 1
+        self.assertEqual(reference.reference_columns[first:],
+                         _get_columns(chart), path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Tests of intraday bars stored in columns and resampled from them."""
+from collections import OrderedDict
+from decimal import Decimal
+
+import datetime
+import pickle
+import random
+import unittest
+
+from pypf.chart import PFChart
+from pypf.instrument import Instrument
+from pypf.series import BarColumns
+from pypf.tests import DataTestCase
+
+
+def _resample(rows, minutes):
+    # Resample bar dicts as Instrument once did, one dict per bar
+    data = OrderedDict()
+    bar = None
+    for row in rows:
+        timestamp = row['Date']
+        minute = int(timestamp[11:13]) * 60 + int(timestamp[14:16])
+        start = minute - minute % minutes
+        key = '%s %02d:%02d' % (timestamp[:10], start // 60, start % 60)
+        if bar is None or bar['Date'] != key:
+            bar = dict(row, Date=key)
+            data[key] = bar
+        else:
+            bar['High'] = max(bar['High'], row['High'])
+            bar['Low'] = min(bar['Low'], row['Low'])
+            bar['Close'] = row['Close']
+            bar['Volume'] += row['Volume']
+    return data
+
+
+class IntradayTestCase(DataTestCase):
+    """Load three sessions of one minute bars from a csv file."""
+
+    def setUp(self):
+        """Write the bars, some of them with seconds."""
+        super().setUp()
+        rnd = random.Random(0)
+        self.rows = []
+        price = 100.0
+        for day in [2, 3, 4]:
+            time = datetime.datetime(2024, 1, day, 9, 30)
+            while time.hour < 16:
+                price *= 1 + rnd.gauss(0, .002)
+                timestamp = time.strftime('%Y-%m-%d %H:%M')
+                if rnd.random() < .1:
+                    timestamp += ':00'
+                self.rows.append({
+                    'Date': timestamp,
+                    'Open': Decimal('%.2f' % price),
+                    'High': Decimal('%.2f' % (price * 1.001)),
+                    'Low': Decimal('%.2f' % (price * .999)),
+                    'Close': Decimal('%.2f' % price),
+                    'Volume': rnd.randint(1, 1000)})
+                time += datetime.timedelta(minutes=1)
+        self.security = self._get_instrument(
+            'TEST', ['%(Date)s,%(Open)s,%(High)s,%(Low)s,%(Close)s,'
+                     '%(Volume)s\n' % row for row in self.rows])
+        self.security.populate_data()
+
+    def test_columns(self):
+        """The bars must read back as the dicts they were loaded from."""
+        bars = self.security.intraday_historical_data
+        self.assertIsInstance(bars, BarColumns)
+        self.assertEqual(self.rows, list(bars.values()))
+        self.assertEqual([row['Date'] for row in self.rows], list(bars))
+        row = self.rows[100]
+        self.assertIn(row['Date'], bars)
+        self.assertEqual(row, bars[row['Date']])
+        self.assertNotIn('2024-01-02 08:00', bars)
+        self.assertIsNone(bars.get('2024-01-02 08:00'))
+
+    def test_daily(self):
+        """Each session must be rolled up into a daily bar."""
+        daily = self.security.daily_historical_data
+        self.assertEqual(['2024-01-02', '2024-01-03', '2024-01-04'],
+                         list(daily))
+        rows = [row for row in self.rows if row['Date'][:10] == '2024-01-03']
+        bar = daily['2024-01-03']
+        self.assertEqual(rows[0]['Open'], bar['Open'])
+        self.assertEqual(max(row['High'] for row in rows), bar['High'])
+        self.assertEqual(min(row['Low'] for row in rows), bar['Low'])
+        self.assertEqual(rows[-1]['Close'], bar['Close'])
+        self.assertEqual(sum(row['Volume'] for row in rows), bar['Volume'])
+
+    def test_resample(self):
+        """Resampled bars must match the bars of the dict resampler."""
+        for minutes in [1, 5, 15, 60]:
+            with self.subTest(minutes=minutes):
+                expected = _resample(self.rows, minutes)
+                data = self.security.get_intraday_data(minutes)
+                self.assertEqual(list(expected.items()), list(data.items()))
+
+    def test_cache_bound(self):
+        """Only the last intervals used must be kept."""
+        security = self.security
+        first = security.get_intraday_data(5)
+        for minutes in [15, 30, 60]:
+            security.get_series('%dmin' % minutes)
+        self.assertEqual(Instrument.RESAMPLED_INTERVALS,
+                         len(security._resampled_intraday_data))
+        self.assertEqual([30, 60], list(security._resampled_intraday_data))
+        self.assertIsNot(first, security.get_intraday_data(5))
+        self.assertIs(security.get_intraday_data(5),
+                      security.get_intraday_data(5))
+
+    def test_pickle(self):
+        """An unpickled instrument must have the same bars."""
+        security = pickle.loads(pickle.dumps(self.security))
+        self.assertEqual(self.rows,
+                         list(security.intraday_historical_data.values()))
+        self.assertEqual(list(self.security.get_intraday_data(5).items()),
+                         list(security.get_intraday_data(5).items()))
+
+    def test_chart(self):
+        """An intraday chart must be built from the resampled bars."""
+        chart = PFChart(self.security, interval='5min', duration=.01)
+        chart.create_chart()
+        dates = list(self.security.get_intraday_data(5))
+        meta_dates = list(chart.chart_meta_data)
+        self.assertGreater(len(meta_dates), 0)
+        self.assertEqual(dates[-len(meta_dates):], meta_dates)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Tests of the JSON lines log format."""
+from io import StringIO
+
+import json
+import logging
+import unittest
+
+from pypf.log_format import JsonFormatter
+from pypf.stats import Stats
+
+
+class JsonFormatterTestCase(unittest.TestCase):
+    """Log through a JsonFormatter into a string."""
+
+    def setUp(self):
+        """Send a test logger's records to a JSON lines stream."""
+        self.stream = StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.setFormatter(JsonFormatter())
+        self.logger = logging.getLogger('pypf.tests.log_format')
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        """Remove the handler."""
+        self.logger.removeHandler(self.handler)
+
+    def _get_entries(self):
+        return [json.loads(line)
+                for line in self.stream.getvalue().splitlines()]
+
+    def test_message(self):
+        """Each record must be one JSON object on its own line."""
+        self.logger.info('loaded %d bars of %s', 10, 'TEST')
+        self.logger.warning('no data\nfor TEST')
+        self.logger.debug('not logged')
+        entries = self._get_entries()
+        self.assertEqual(2, len(entries))
+        self.assertEqual('loaded 10 bars of TEST', entries[0]['message'])
+        self.assertEqual('INFO', entries[0]['level'])
+        self.assertEqual('pypf.tests.log_format', entries[0]['logger'])
+        self.assertEqual('test_message', entries[0]['function'])
+        self.assertIn('T', entries[0]['time'])
+        self.assertEqual('no data\nfor TEST', entries[1]['message'])
+        self.assertNotIn('phase', entries[0])
+        self.assertNotIn('exception', entries[0])
+
+    def test_phase(self):
+        """Phase timings must carry the symbol, phase and duration."""
+        stats = Stats(enabled=True, logger=self.logger)
+        stats.context['symbol'] = 'TEST'
+        with stats.phase('set_scale'):
+            pass
+        entry, = self._get_entries()
+        self.assertEqual('TEST', entry['symbol'])
+        self.assertEqual('set_scale', entry['phase'])
+        self.assertEqual(stats.phases['set_scale'][0], entry['duration'])
+
+    def test_exception(self):
+        """The traceback must be included in the object."""
+        try:
+            raise ValueError('bad bar')
+        except ValueError:
+            self.logger.exception('failed to load %s', 'TEST')
+        entry, = self._get_entries()
+        self.assertEqual('ERROR', entry['level'])
+        self.assertEqual('failed to load TEST', entry['message'])
+        self.assertTrue(entry['exception'].startswith('Traceback'))
+        self.assertIn('ValueError: bad bar', entry['exception'])
+
+
+if __name__ == '__main__':
+    unittest.main()
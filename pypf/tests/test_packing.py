@@ -0,0 +1,82 @@
+"""Tests that packed records unpack to the records they were packed from."""
+from collections import OrderedDict
+from decimal import Decimal
+
+import pickle
+import unittest
+
+from pypf.packing import pack_records
+from pypf.packing import unpack_records
+
+
+def _get_bars():
+    bars = OrderedDict()
+    for day, close in [('2024-01-02', '10.00'), ('2024-01-03', '10.50'),
+                       ('2024-01-04', '9.99')]:
+        bars[day] = {'Date': day, 'Open': Decimal('10.01'),
+                     'High': Decimal(close) + 1, 'Low': Decimal('9.00'),
+                     'Close': Decimal(close), 'Volume': 1200}
+    return bars
+
+
+class PackingTestCase(unittest.TestCase):
+    """Round trip records through pack_records and pickle."""
+
+    def _round_trip(self, records):
+        packed = pickle.loads(pickle.dumps(pack_records(records)))
+        unpacked = unpack_records(packed, OrderedDict)
+        self.assertIsInstance(unpacked, OrderedDict)
+        self.assertEqual(list(records.items()), list(unpacked.items()))
+        for key in records:
+            for field, value in records[key].items():
+                self.assertIs(type(value), type(unpacked[key][field]))
+        return packed
+
+    def test_bars(self):
+        """Decimal, str and int columns must be packed as columns."""
+        packed = self._round_trip(_get_bars())
+        keys, fields, columns = packed
+        self.assertEqual(['Date', 'Open', 'High', 'Low', 'Close', 'Volume'],
+                         fields)
+        self.assertEqual(['str', 'decimal', 'decimal', 'decimal', 'decimal',
+                          'int'], [column[0] for column in columns])
+
+    def test_empty(self):
+        """No records must pack to None and unpack to an empty mapping."""
+        self.assertIsNone(pack_records(OrderedDict()))
+        self._round_trip(OrderedDict())
+        self.assertEqual(OrderedDict(), unpack_records(None, OrderedDict))
+
+    def test_mixed_column(self):
+        """A column of Decimals and strs must keep each value's type."""
+        records = _get_bars()
+        records['2024-01-03']['Close'] = 'n/a'
+        packed = self._round_trip(records)
+        self.assertEqual('list', packed[2][4][0])
+
+    def test_awkward_strings(self):
+        """Empty strings and strings with commas must survive."""
+        records = OrderedDict()
+        records['a'] = {'name': '', 'note': 'x'}
+        records['b'] = {'name': '', 'note': 'one, two'}
+        packed = self._round_trip(records)
+        self.assertEqual(['str', 'list'],
+                         [column[0] for column in packed[2]])
+
+    def test_different_fields(self):
+        """Records whose fields differ must be returned unchanged."""
+        records = _get_bars()
+        records['2024-01-04'] = {'Date': '2024-01-04'}
+        self.assertIs(records, pack_records(records))
+        self._round_trip(records)
+
+    def test_large_integers(self):
+        """Integers too large for an array must still round trip."""
+        records = OrderedDict([('a', {'volume': 2 ** 70}),
+                               ('b', {'volume': 1})])
+        packed = self._round_trip(records)
+        self.assertEqual('list', packed[2][0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
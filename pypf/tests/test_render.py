@@ -0,0 +1,155 @@
+"""Tests of the json, svg and html chart renderers."""
+from html.parser import HTMLParser
+from io import StringIO
+from xml.etree import ElementTree
+
+import json
+import random
+import unittest
+
+from pypf.chart import PFChart
+from pypf.render import get_renderer
+from pypf.render import HtmlRenderer
+from pypf.render import JsonRenderer
+from pypf.render import SvgRenderer
+from pypf.render import TextRenderer
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+class _TagParser(HTMLParser):
+    # Check that the html tags nest, skipping the void elements
+
+    VOID = {'meta', 'br', 'img', 'hr', 'link', 'input'}
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+        self.tags = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.append(tag)
+        if tag not in self.VOID:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack.pop() != tag:
+            raise AssertionError('unbalanced </' + tag + '>')
+
+
+class RendererTestCase(DataTestCase):
+    """Render charts of generated data."""
+
+    def setUp(self):
+        """Write the data and create a chart of it."""
+        super().setUp()
+        self.instrument = self._get_instrument(
+            'TEST', generate_bars(random.Random(5), 300))
+        self.chart = self._get_chart()
+
+    def _get_chart(self, **parameters):
+        chart = PFChart(self.instrument, box_size=.02, reversal=1,
+                        trend_lines=True, **parameters)
+        chart.create_chart()
+        return chart
+
+    def _render(self, renderer, chart=None):
+        output = StringIO()
+        renderer.render(chart or self.chart, output)
+        return output.getvalue()
+
+    def _count_glyphs(self, columns):
+        return sum(column.high - column.low + 1 for number, column in columns)
+
+    def test_json(self):
+        """The columns must be box ranges of the chart's columns."""
+        chart = self.chart
+        document = json.loads(self._render(JsonRenderer()))
+        self.assertEqual('TEST', document['symbol'])
+        self.assertEqual(float(chart.box_size), document['box_size'])
+        self.assertEqual(len(chart.scale), len(document['scale']))
+        columns = document['columns']
+        self.assertEqual(list(range(chart.first_column, chart.first_column
+                                    + len(chart.columns))),
+                         columns['column_index'])
+        self.assertEqual([column.direction for column in chart.columns],
+                         columns['direction'])
+        self.assertEqual([column.low for column in chart.columns],
+                         columns['low'])
+        self.assertEqual([column.high for column in chart.columns],
+                         columns['high'])
+        self.assertEqual([sorted(column.markers.items())
+                          for column in chart.columns],
+                         [[tuple(marker) for marker in markers]
+                          for markers in columns['markers']])
+        self.assertEqual(len(chart.trend_line_starts),
+                         len(document['trend_lines']))
+        self.assertNotIn('meta_data', document)
+
+    def test_json_meta_data(self):
+        """The meta data must be one array per field."""
+        chart = self._get_chart(truncate=10)
+        self.assertGreater(chart.column_count, 10)
+        document = json.loads(self._render(JsonRenderer(meta_data=True),
+                                           chart))
+        meta_data = document['meta_data']
+        self.assertEqual(JsonRenderer.META_DATA_FIELDS, list(meta_data))
+        self.assertEqual(list(chart.chart_meta_data), meta_data['date'])
+        for field in JsonRenderer.META_DATA_FIELDS:
+            self.assertEqual(len(chart.chart_meta_data),
+                             len(meta_data[field]), field)
+        self.assertEqual(len(chart.columns),
+                         len(document['columns']['column_index']))
+
+        document = json.loads(self._render(
+            JsonRenderer(meta_data=True, visible_only=True), chart))
+        self.assertEqual([number for number, column in chart.visible_columns],
+                         document['columns']['column_index'])
+        self.assertEqual(10, len(document['columns']['low']))
+        self.assertEqual(len(chart.chart_meta_data),
+                         len(document['meta_data']['date']))
+
+    def test_svg(self):
+        """The svg must parse and have one glyph per visible box."""
+        chart = self._get_chart(truncate=20)
+        root = ElementTree.fromstring(self._render(SvgRenderer(), chart))
+        self.assertEqual(SVG + 'svg', root.tag)
+        glyphs = [element for element in root
+                  if element.get('class') in ('x', 'o', 'u', 'd', 'marker')]
+        self.assertEqual(self._count_glyphs(chart.visible_columns),
+                         len(glyphs))
+
+    def test_html(self):
+        """The page must nest its tags and embed the svg chart."""
+        page = self._render(HtmlRenderer())
+        self.assertTrue(page.startswith('<!DOCTYPE html>'))
+        parser = _TagParser()
+        parser.feed(page)
+        parser.close()
+        self.assertEqual([], parser.stack)
+        self.assertEqual(1, parser.tags.count('svg'))
+
+        svg = page[page.index('<svg'):page.index('</svg>') + len('</svg>')]
+        root = ElementTree.fromstring(svg)
+        glyphs = [element for element in root
+                  if element.get('class') in ('x', 'o', 'u', 'd', 'marker')]
+        self.assertEqual(self._count_glyphs(self.chart.visible_columns),
+                         len(glyphs))
+
+    def test_get_renderer(self):
+        """Known formats must give their renderer, others an error."""
+        self.assertIsInstance(get_renderer('text'), TextRenderer)
+        self.assertIsInstance(get_renderer('json'), JsonRenderer)
+        self.assertIsInstance(get_renderer('svg'), SvgRenderer)
+        self.assertIsInstance(get_renderer('html'), HtmlRenderer)
+        self.assertRaisesRegex(ValueError, 'valid formats', get_renderer,
+                               'pdf')
+
+
+if __name__ == '__main__':
+    unittest.main()
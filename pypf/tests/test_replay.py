@@ -0,0 +1,100 @@
+"""Tests that a ChartReplay matches charts drawn as of each of its dates."""
+from collections import OrderedDict
+
+import datetime
+import random
+import unittest
+
+from pypf.chart import PFChart
+from pypf.replay import ChartReplay
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+class ChartReplayTestCase(DataTestCase):
+    """Compare replayed rows with PFChart built with end_date."""
+
+    def _get_expected(self, instrument, parameters, date):
+        chart = PFChart(instrument, end_date=date, **parameters)
+        chart.create_chart(render=False)
+        meta_data = chart.chart_meta_data[next(reversed(
+            chart.chart_meta_data))]
+        return OrderedDict((field, meta_data[field])
+                           for field in ChartReplay.FIELDS)
+
+    def test_rows(self):
+        """Every row must be the last bar of the chart as of its date."""
+        cases = [('d', 300), ('w', 700), ('m', 900)] * 3
+        for seed, (interval, count) in enumerate(cases):
+            rnd = random.Random(seed)
+            instrument = self._get_instrument('TEST',
+                                              generate_bars(rnd, count))
+            scale_mode = rnd.choice(['percent', 'point'])
+            if scale_mode == 'percent':
+                box_size = rnd.choice([.01, .02, .03])
+            else:
+                box_size = rnd.choice([.25, .5, 1])
+            parameters = {'box_size': box_size,
+                          'duration': .5 if interval != 'm' else 1,
+                          'interval': interval,
+                          'method': rnd.choice(['hl', 'c']),
+                          'reversal': rnd.choice([1, 2, 3]),
+                          'scale_mode': scale_mode}
+            with self.subTest(seed=seed, **parameters):
+                replay = ChartReplay(instrument, **parameters).run()
+                rows = list(replay.rows())
+                self.assertEqual(len(instrument.get_series(interval)) - 1,
+                                 len(rows))
+                for row in rows:
+                    self.assertEqual(self._get_expected(instrument,
+                                                        parameters,
+                                                        row['date']),
+                                     row, row['date'])
+
+    def test_sub_dollar(self):
+        """Rows must match charts whose boxes round to the same value."""
+        for seed, (lowest, highest) in enumerate([(.01, .05), (.3, .8)]):
+            rnd = random.Random(seed)
+            lines = generate_bars(rnd, 400)
+            closes = [float(line.split(',')[4]) for line in lines]
+            factor = (highest - lowest) / (max(closes) - min(closes))
+
+            def scaled(price):
+                price = lowest + (float(price) - min(closes)) * factor
+                return '%.2f' % max(price, .01)
+
+            instrument = self._get_instrument('TEST', [
+                ','.join([fields[0]] + [scaled(price)
+                                        for price in fields[1:5]]
+                         + [fields[5]])
+                for fields in (line.split(',') for line in lines)])
+            parameters = {'box_size': .01, 'duration': .5,
+                          'reversal': rnd.choice([1, 3])}
+            with self.subTest(lowest=lowest, highest=highest, **parameters):
+                replay = ChartReplay(instrument, **parameters).run()
+                for row in replay.rows():
+                    self.assertEqual(self._get_expected(instrument,
+                                                        parameters,
+                                                        row['date']),
+                                     row, row['date'])
+
+    def test_as_of(self):
+        """A date between bars must give the row of the bar before it."""
+        instrument = self._get_instrument(
+            'TEST', generate_bars(random.Random(3), 60))
+        replay = ChartReplay(instrument, duration=.1).run()
+        dates = list(instrument.get_series('d'))
+        self.assertIsNone(replay.as_of(dates[0]))
+        self.assertIsNone(replay.as_of('1999-12-31'))
+        for date in dates[1:]:
+            following = (datetime.date(*map(int, date.split('-')))
+                         + datetime.timedelta(days=1)).isoformat()
+            expected = self._get_expected(instrument, {'duration': .1},
+                                          date)
+            self.assertEqual(expected, replay.as_of(date))
+            if following not in dates:
+                self.assertEqual(expected, replay.as_of(following))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""Tests of the percent and point scales that place prices in boxes.
+
+Percent scales sharing a grid must match scales built alone, and point
+scales must place prices, including negative ones, in fixed boxes.
+"""
+from decimal import Decimal
+
+import gc
+import pickle
+import random
+import unittest
+
+from pypf import scale as scale_module
+from pypf.chart import PFChart
+from pypf.scale import PercentScale
+from pypf.scale import PointScale
+from pypf.scale import get_scale_class
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+TWOPLACES = Decimal('0.01')
+
+# Ranges in an order that makes later scales start below, above and
+# inside the part of the grid already built
+RANGES = [('12.50', '19.99'), ('0.50', '3.10'), ('250.00', '1310.55'),
+          ('99.99', '100.01'), ('0.01', '0.01'), ('18.00', '300.00')]
+
+
+def _get_values(box_size, lowest, highest):
+    # The values of a scale computed on their own, as PFChart once did
+    current = Decimal(.01)
+    raw = [current]
+    while current <= highest:
+        current = current + (current * box_size)
+        raw.append(current)
+    first = 0
+    while first + 1 < len(raw) and raw[first + 1] <= lowest:
+        first += 1
+    return [value.quantize(TWOPLACES) for value in raw[first:]]
+
+
+class PercentScaleTestCase(unittest.TestCase):
+    """Compare scales on a shared grid with scales computed alone."""
+
+    def setUp(self):
+        """Start each test without any grids."""
+        self.grids = scale_module._percent_grids.copy()
+        scale_module._percent_grids.clear()
+
+    def tearDown(self):
+        """Restore the grids of the rest of the process."""
+        scale_module._percent_grids.clear()
+        scale_module._percent_grids.update(self.grids)
+
+    def test_shared_grid(self):
+        """Every scale must have its own values whatever came before."""
+        for box_size in [Decimal('0.01'), Decimal('0.03')]:
+            scales = []
+            for lowest, highest in RANGES:
+                lowest = Decimal(lowest)
+                highest = Decimal(highest)
+                scale = PercentScale(box_size, lowest, highest)
+                scales.append((scale, lowest, highest))
+            for scale, lowest, highest in scales:
+                with self.subTest(box_size=box_size, lowest=lowest,
+                                  highest=highest):
+                    values = _get_values(box_size, lowest, highest)
+                    self.assertEqual(values, scale.values())
+                    self.assertEqual(len(values), len(scale))
+                    self.assertEqual(values[-1], scale[len(scale) - 1])
+                    self.assertRaises(KeyError, scale.__getitem__,
+                                      len(scale))
+
+    def test_pickle(self):
+        """An unpickled scale must find a grid in the new process."""
+        scale = PercentScale(Decimal('0.02'), Decimal('5.00'),
+                             Decimal('75.00'))
+        data = pickle.dumps(scale)
+        scale_module._percent_grids.clear()
+        unpickled = pickle.loads(data)
+        self.assertEqual(scale.values(), unpickled.values())
+        self.assertEqual(scale.index(Decimal('20.00'), 'x'),
+                         unpickled.index(Decimal('20.00'), 'x'))
+
+    def test_unused_grid(self):
+        """A grid must be dropped with the last scale using it."""
+        scale = PercentScale(Decimal('0.0123'), Decimal('5.00'),
+                             Decimal('75.00'))
+        other = PercentScale(Decimal('0.0123'), Decimal('1.00'),
+                             Decimal('9.00'))
+        self.assertEqual([Decimal('0.0123')],
+                         list(scale_module._percent_grids))
+        del scale
+        gc.collect()
+        self.assertEqual(1, len(scale_module._percent_grids))
+        del other
+        gc.collect()
+        self.assertEqual(0, len(scale_module._percent_grids))
+
+
+class PointScaleTestCase(DataTestCase):
+    """Check point scales against hand figures and a point chart."""
+
+    def test_values(self):
+        """Boxes must be multiples of the box size around the prices."""
+        scale = PointScale(Decimal('0.5'), Decimal('10.10'),
+                           Decimal('12.00'))
+        # From the box at or below 10.10 to the first box above 12.00
+        self.assertEqual([Decimal(value) for value in
+                          ['10.00', '10.50', '11.00', '11.50', '12.00',
+                           '12.50']], scale.values())
+        self.assertEqual(6, len(scale))
+        self.assertEqual(Decimal('12.50'), scale[5])
+        self.assertRaises(KeyError, scale.__getitem__, 6)
+        self.assertRaises(KeyError, scale.__getitem__, -1)
+        self.assertRaises(ValueError, PointScale, 0, 1, 2)
+        self.assertIs(PointScale, get_scale_class('point'))
+        self.assertRaises(ValueError, get_scale_class, 'log')
+
+    def test_index(self):
+        """A price between boxes must go down in x and up in o columns."""
+        scale = PointScale(Decimal('0.5'), Decimal('10.10'),
+                           Decimal('12.00'))
+        self.assertEqual(1, scale.index(Decimal('10.75'), 'x'))
+        self.assertEqual(2, scale.index(Decimal('10.75'), 'o'))
+        # A price on a box is in that box either way
+        self.assertEqual(2, scale.index(Decimal('11.00'), 'x'))
+        self.assertEqual(2, scale.index(Decimal('11.00'), 'o'))
+        self.assertEqual(0, scale.index(Decimal('10.10'), 'x'))
+        self.assertEqual(1, scale.index(Decimal('10.10'), 'o'))
+
+    def test_negative(self):
+        """Negative prices must be placed like positive ones."""
+        scale = PointScale(Decimal('1'), Decimal('-3.50'), Decimal('2.00'))
+        self.assertEqual(Decimal('-4.00'), scale[0])
+        self.assertEqual(1, scale.index(Decimal('-2.50'), 'x'))
+        self.assertEqual(2, scale.index(Decimal('-2.50'), 'o'))
+        self.assertEqual(4, scale.index(Decimal('0'), 'x'))
+        self.assertEqual(4, scale.index(Decimal('0'), 'o'))
+        self.assertEqual(Decimal('3.00'), scale[len(scale) - 1])
+
+    def test_extend(self):
+        """extend must return the number of boxes added below."""
+        scale = PointScale(Decimal('0.5'), Decimal('10.00'),
+                           Decimal('12.00'))
+        index = scale.index(Decimal('11.00'), 'x')
+        self.assertEqual(0, scale.extend(Decimal('10.00'),
+                                         Decimal('14.20')))
+        self.assertEqual(Decimal('14.50'), scale[len(scale) - 1])
+        shift = scale.extend(Decimal('9.20'), Decimal('13.00'))
+        # 10.00 was the first box and 9.00 is now
+        self.assertEqual(2, shift)
+        self.assertEqual(Decimal('9.00'), scale[0])
+        self.assertEqual(Decimal('11.00'), scale[index + shift])
+        self.assertEqual(Decimal('14.50'), scale[len(scale) - 1])
+        self.assertEqual(0, scale.extend(Decimal('9.50'), Decimal('9.60')))
+        # 9.50 up to 13.00, the first box above 12.90
+        self.assertEqual((1, 8), scale.get_range(Decimal('9.50'),
+                                                 Decimal('12.90')))
+
+    def test_chart(self):
+        """A point chart must place every move in fixed boxes."""
+        instrument = self._get_instrument(
+            'TEST', generate_bars(random.Random(1), 400))
+        box_size = Decimal('0.50')
+        chart = PFChart(instrument, box_size, duration=2, reversal=2,
+                        scale_mode='point')
+        chart.create_chart()
+
+        self.assertIn('0.50 points', chart.chart)
+        values = chart.scale.values()
+        self.assertEqual([box_size] * (len(values) - 1),
+                         [high - low for low, high in zip(values,
+                                                          values[1:])])
+        moves = 0
+        for row in chart.chart_meta_data.values():
+            value = row['scale_value']
+            if row['action'] in ['x', 'reverse o->x']:
+                self.assertTrue(value <= row['high'] < value + box_size)
+                moves += 1
+            elif row['action'] in ['o', 'reverse x->o']:
+                self.assertTrue(value - box_size < row['low'] <= value)
+                moves += 1
+        self.assertGreater(moves, 0)
+        self.assertEqual(chart.column_count, len(chart.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Tests that screen rows match the meta data of the created charts."""
+import os
+import random
+import unittest
+
+from pypf import screener
+from pypf.chart import PFChart
+from pypf.screener import Screener
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+class ScreenerTestCase(DataTestCase):
+    """Compare Screener.get_row with the last bar of the meta data."""
+
+    def _get_expected(self, chart):
+        chart.create_chart(render=False)
+        meta_data = chart.chart_meta_data
+        dates = list(meta_data)
+        current = meta_data[dates[-1]]
+        if len(dates) == 1:
+            new_signal = current['signal'] != 'none'
+        else:
+            new_signal = meta_data[dates[-2]]['signal'] != current['signal']
+        row = [('symbol', 'TEST'), ('new_signal', new_signal)]
+        row.extend((field, current[field]) for field in Screener.FIELDS
+                   if field not in ['symbol', 'new_signal'])
+        return sorted(row)
+
+    def test_rows(self):
+        """The row must describe the chart's last bar."""
+        for seed in range(20):
+            rnd = random.Random(seed)
+            count = rnd.choice([2, 3, 40, 400])
+            instrument = self._get_instrument('TEST',
+                                              generate_bars(rnd, count))
+            # A few days may all be in one week
+            parameters = {'box_size': rnd.choice([.01, .02, .05]),
+                          'reversal': rnd.choice([1, 3]),
+                          'method': rnd.choice(['hl', 'c']),
+                          'interval': 'd' if count < 40 else
+                          rnd.choice(['d', 'w'])}
+            with self.subTest(seed=seed, **parameters):
+                row = Screener.get_row('TEST',
+                                       PFChart(instrument, **parameters))
+                self.assertEqual(Screener.FIELDS, list(row))
+                self.assertEqual(self._get_expected(PFChart(instrument,
+                                                            **parameters)),
+                                 sorted(row.items()))
+
+    def test_one_bar(self):
+        """A single bar has no state to screen."""
+        instrument = self._get_instrument(
+            'TEST', generate_bars(random.Random(0), 1))
+        self.assertRaises(ValueError, Screener.get_row, 'TEST',
+                          PFChart(instrument))
+
+    def test_benchmark_archive(self):
+        """A relative strength screen must read both symbols' archives."""
+        rnd = random.Random(1)
+        lines = generate_bars(rnd, 300)
+        self._write_bars('AAA', lines)
+        # The benchmark's own prices on the same dates
+        self._write_bars('BBB', [line[:10] + other[10:] for line, other
+                                 in zip(lines, generate_bars(rnd, 300))])
+
+        def get_instrument_class(provider):
+            def create(symbol, force_download, force_cache, period, debug):
+                return self._get_instrument(symbol)
+            return create
+
+        instrument_options = {'provider': 'csv', 'force_download': False,
+                              'force_cache': True, 'period': 10,
+                              'debug': False, 'benchmark': 'BBB',
+                              'archive': True}
+        original = screener.get_instrument_class
+        screener.get_instrument_class = get_instrument_class
+        try:
+            symbol, row, error = screener._screen_symbol(
+                ('AAA', instrument_options, {}))
+        finally:
+            screener.get_instrument_class = original
+            screener._benchmarks.clear()
+        self.assertIsNone(error)
+        self.assertEqual('AAA/BBB', row['symbol'])
+        for symbol in ['AAA', 'BBB']:
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.directory, symbol + '.pfa')))
+
+    def test_filters(self):
+        """The filters must match rows by signal, status and move."""
+        rows = [{'signal': signal, 'new_signal': new_signal,
+                 'status': status, 'move': move}
+                for signal in ['buy', 'sell', 'none']
+                for new_signal in [True, False]
+                for status in ['bull confirmed', 'bear confirmed']
+                for move in [1, 3]]
+
+        def match(row_filter):
+            return [row for row in rows if row_filter(row)]
+
+        self.assertEqual(12, len(match(screener.new_signal)))
+        self.assertEqual([row for row in rows
+                          if row['signal'] == 'buy' and row['new_signal']],
+                         match(screener.new_buy_signal))
+        self.assertEqual([row for row in rows
+                          if row['signal'] == 'sell' and row['new_signal']],
+                         match(screener.new_sell_signal))
+        self.assertEqual(rows[8:16], match(screener.signal_is('sell')))
+        self.assertEqual([row for row in rows
+                          if row['status'] == 'bear confirmed'],
+                         match(screener.status_is('bear confirmed')))
+        self.assertEqual(rows[1::2], match(screener.min_move(2)))
+        self.assertEqual(rows, match(screener.min_move(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests of BarSeries views and of charts built as of a date."""
+from collections import OrderedDict
+
+import datetime
+import unittest
+
+from pypf.chart import PFChart
+from pypf.series import BarSeries
+from pypf.tests import DataTestCase
+
+
+def _get_data(dates):
+    return OrderedDict((date, {'Date': date, 'Close': position})
+                       for position, date in enumerate(dates))
+
+
+DATES = ['2024-01-%02d' % day for day in range(2, 12)]
+
+
+class BarSeriesTestCase(unittest.TestCase):
+    """Compare views with the bars of the OrderedDict they index."""
+
+    def _assert_bars(self, expected, series):
+        self.assertEqual(expected, list(series))
+        self.assertEqual(len(expected), len(series))
+        self.assertEqual(expected[::-1], list(reversed(series)))
+        self.assertEqual(expected, [bar['Date'] for bar in series.values()])
+        self.assertEqual(expected, [date for date, bar in series.items()])
+        for date in expected:
+            self.assertIn(date, series)
+            self.assertEqual(date, series[date]['Date'])
+        self.assertEqual(expected[0] if expected else None,
+                         series.first_date)
+        self.assertEqual(expected[-1] if expected else None,
+                         series.last_date)
+
+    def test_views(self):
+        """window and last_n must select bars by date and count."""
+        series = BarSeries(_get_data(DATES))
+        self._assert_bars(DATES, series)
+        self._assert_bars(DATES[-3:], series.last_n(3))
+        self._assert_bars(DATES, series.last_n(30))
+        self._assert_bars([], series.last_n(0))
+        window = series.window('2024-01-04', '2024-01-08')
+        self._assert_bars(DATES[2:7], window)
+        self._assert_bars(DATES[4:7], window.last_n(3))
+        self.assertNotIn('2024-01-09', window)
+        self.assertRaises(KeyError, window.__getitem__, '2024-01-03')
+        self._assert_bars([], series.window(end_date='2023-12-31'))
+
+    def test_with_last(self):
+        """A bar added by with_last must end the view and its views."""
+        series = BarSeries(_get_data(DATES)).window(end_date='2024-01-06')
+        bar = {'Date': '2024-01-09', 'Close': -1}
+        extended = series.with_last(bar)
+        expected = DATES[:5] + ['2024-01-09']
+        self._assert_bars(expected, extended)
+        self.assertIs(bar, extended['2024-01-09'])
+        self._assert_bars(expected[-3:], extended.last_n(3))
+        self._assert_bars(['2024-01-09'], extended.last_n(1))
+        self._assert_bars([], extended.last_n(0))
+        self._assert_bars(expected[3:], extended.window('2024-01-05'))
+        self._assert_bars(DATES[:3], extended.window(end_date='2024-01-04'))
+        self._assert_bars(['2024-01-09'],
+                          BarSeries(_get_data([])).with_last(bar))
+        self.assertRaises(ValueError, extended.with_last, bar)
+
+
+class EndDateTestCase(DataTestCase):
+    """Build charts of a csv file as of dates in its history."""
+
+    def setUp(self):
+        """Write a year of daily bars."""
+        super().setUp()
+        day = datetime.date(2023, 1, 2)
+        price = 50.0
+        lines = []
+        for number in range(260):
+            price *= 1.03 if number % 20 < 12 else .97
+            lines.append('%s,%.2f,%.2f,%.2f,%.2f,100\n' % (
+                day.isoformat(), price, price * 1.01, price * .99, price))
+            day += datetime.timedelta(days=1 if day.weekday() < 4 else 3)
+        self._write_bars('TEST', lines)
+
+    def _create(self, interval, end_date):
+        chart = PFChart(self._get_instrument('TEST'), interval=interval,
+                        end_date=end_date)
+        chart.create_chart()
+        return chart
+
+    def test_week_in_progress(self):
+        """The last weekly bar must be the week up to end_date."""
+        # A Wednesday, so its week is in progress
+        chart = self._create('w', '2023-06-07')
+        meta_data = chart.chart_meta_data
+        last = meta_data[next(reversed(meta_data))]
+        self.assertEqual('2023-06-07', last['date'])
+        days = self._get_instrument('TEST')
+        days.populate_data()
+        week = [days.daily_historical_data[date]
+                for date in ['2023-06-05', '2023-06-06', '2023-06-07']]
+        self.assertEqual(max(bar['High'] for bar in week), last['high'])
+        self.assertEqual(min(bar['Low'] for bar in week), last['low'])
+        self.assertEqual(week[0]['Open'], last['open'])
+
+    def test_before_first_bar(self):
+        """An end_date before the data must raise a ValueError."""
+        for interval in ['d', 'w', 'm']:
+            with self.subTest(interval=interval):
+                self.assertRaisesRegex(ValueError, 'on or before 2022',
+                                       self._create, interval, '2022-12-30')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tests of the chart and instrument caches of a ChartServer."""
+import os
+import random
+import threading
+import unittest
+
+from pypf.chart import PFChart
+from pypf.instrument import CsvSecurity
+from pypf.server import ChartServer
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+class CsvChartServer(ChartServer):
+    """A server of csv files that can hold up the loading of a symbol."""
+
+    def __init__(self, directory, **kwargs):
+        """Serve the csv files in directory."""
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.slow_symbol = None
+        self.loading = threading.Event()
+        self.release = threading.Event()
+
+    def _create_instrument(self, symbol):
+        if symbol == self.slow_symbol:
+            self.loading.set()
+            self.release.wait(10)
+        return CsvSecurity(symbol,
+                           os.path.join(self.directory, symbol + '.csv'),
+                           self.directory)
+
+
+class ChartServerTestCase(DataTestCase):
+    """Build, update and drop cached charts."""
+
+    def setUp(self):
+        """Write the bars of two symbols."""
+        super().setUp()
+        rnd = random.Random(0)
+        self.lines = generate_bars(rnd, 400)
+        for symbol in ['AAA', 'BBB']:
+            self._write_bars(symbol, self.lines[:-5])
+
+    def test_max_charts(self):
+        """The least recently used chart must be dropped."""
+        server = CsvChartServer(self.directory, max_charts=2)
+        first = server.get_chart('AAA', reversal=1)
+        server.get_chart('AAA', reversal=2)
+        self.assertIs(first, server.get_chart('AAA', reversal=1))
+        server.get_chart('AAA', reversal=3)
+        self.assertEqual(2, len(server._charts))
+        self.assertEqual([1, 3], [dict(key[1:])['reversal']
+                                  for key in server._charts])
+        self.assertIsNot(server.get_chart('AAA', reversal=2),
+                         server.get_chart('AAA', reversal=1))
+
+    def test_dropped_snapshots(self):
+        """A dropped chart's snapshot must be removed with it."""
+        server = CsvChartServer(self.directory, max_charts=2)
+        snapshots = os.path.join(self.directory, 'snapshots')
+        for reversal in [1, 2, 3]:
+            server.get_chart('AAA', reversal=reversal)
+        self.assertEqual(2, len(os.listdir(snapshots)))
+        server.get_chart('BBB')
+        server.get_chart('BBB', reversal=2)
+        self.assertEqual(2, len(os.listdir(snapshots)))
+        self.assertTrue(all(name.startswith('BBB_')
+                            for name in os.listdir(snapshots)))
+
+    def test_max_instruments(self):
+        """An instrument must be dropped with the last of its charts."""
+        server = CsvChartServer(self.directory, max_charts=2)
+        server.get_chart('AAA', reversal=1)
+        server.get_chart('AAA', reversal=2)
+        instrument = server._instruments['AAA'][0]
+        server.get_chart('BBB', reversal=1)
+        self.assertEqual(['AAA', 'BBB'], sorted(server._instruments))
+        self.assertIs(instrument, server._instruments['AAA'][0])
+        server.get_chart('BBB', reversal=2)
+        self.assertEqual(['BBB'], list(server._instruments))
+        server.get_chart('AAA', reversal=1)
+        self.assertEqual(['AAA', 'BBB'], sorted(server._instruments))
+        self.assertIsNot(instrument, server._instruments['AAA'][0])
+
+    def test_update(self):
+        """A chart must be updated in place when its data changes."""
+        server = CsvChartServer(self.directory, refresh_interval=0)
+        chart = server.get_chart('AAA', duration=.5)
+        before = server.render('AAA', 'json', duration=.5)
+        # The update resumes from the snapshot of the first build
+        self.assertEqual(1, len(os.listdir(os.path.join(self.directory,
+                                                        'snapshots'))))
+        path = self._write_bars('AAA', self.lines)
+        # The modification time may not have changed yet
+        os.utime(path, (1, 1))
+
+        self.assertIs(chart, server.get_chart('AAA', duration=.5))
+        expected = PFChart(CsvSecurity('AAA', path, self.directory),
+                           duration=.5, indent=3, truncate=50)
+        expected.create_chart()
+        self.assertEqual(expected.chart, chart.chart)
+        self.assertEqual(list(expected.chart_meta_data.items()),
+                         list(chart.chart_meta_data.items()))
+        self.assertNotEqual(before,
+                            server.render('AAA', 'json', duration=.5))
+
+    def test_locks(self):
+        """Loading one symbol must not hold up the charts of another."""
+        server = CsvChartServer(self.directory)
+        server.slow_symbol = 'BBB'
+        thread = threading.Thread(target=server.get_chart, args=('BBB',))
+        thread.start()
+        try:
+            self.assertTrue(server.loading.wait(10))
+            self.assertIsNotNone(server.render('AAA'))
+            self.assertTrue(thread.is_alive())
+        finally:
+            server.release.set()
+            thread.join()
+        self.assertIsNotNone(server.get_chart('BBB'))
+
+    def test_unknown_parameter(self):
+        """A parameter the pf command does not take must be rejected."""
+        server = CsvChartServer(self.directory)
+        self.assertRaises(ValueError, server.get_chart, 'AAA', boxes=2)
+
+    def test_failed_request(self):
+        """A failed build must not hold a place in the caches."""
+        server = CsvChartServer(self.directory, max_charts=2)
+        chart = server.get_chart('AAA')
+        for interval in ['x', 'y']:
+            self.assertRaises(ValueError, server.get_chart, 'AAA',
+                              interval=interval)
+        self.assertIs(chart, server.get_chart('AAA'))
+        self.assertEqual(1, len(server._charts))
+
+        self.assertRaises(FileNotFoundError, server.get_chart, 'NOPE')
+        self.assertEqual(['AAA'], list(server._instruments))
+        self.assertEqual(1, len(server._charts))
+
+
+if __name__ == '__main__':
+    unittest.main()
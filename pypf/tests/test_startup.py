@@ -0,0 +1,65 @@
+"""Tests that keep the import cost of the package within budget."""
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Cumulative import time, in microseconds, of pf.py and the modules it
+# imports at startup to chart cached data.
+STARTUP_BUDGET_US = 150000
+
+# Modules that must only be imported when data is downloaded
+NETWORK_MODULES = ['requests', 'urllib3', 'chardet', 'charset_normalizer',
+                   'idna', 'certifi']
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def _run_python(*args):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = PACKAGE_DIRECTORY
+    environment.pop('PYTHONPROFILEIMPORTTIME', None)
+    return subprocess.run([sys.executable] + list(args),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, env=environment,
+                          check=True)
+
+
+class StartupTestCase(unittest.TestCase):
+    """Check what importing pf.py and the package at startup costs."""
+
+    def test_network_modules_are_not_imported(self):
+        """Starting pf.py must not import the network stack."""
+        result = _run_python('-c',
+                             'import sys, pf; '
+                             'print(" ".join(sorted(sys.modules)))')
+        modules = result.stdout.split()
+        for module in NETWORK_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_import_time_budget(self):
+        """Starting pf.py must stay within STARTUP_BUDGET_US."""
+        # Take the best of a few runs so a busy machine does not fail
+        # the test; the first run also writes the bytecode cache.
+        best = None
+        for attempt in range(3):
+            result = _run_python('-X', 'importtime', '-c', 'import pf')
+            total = 0
+            for line in result.stderr.splitlines():
+                if not line.startswith('import time:'):
+                    continue
+                fields = line.split('|')
+                name = fields[2]
+                # pf.py's own entry includes everything it imports
+                if name.strip() == 'pf' and not name.startswith('  '):
+                    total += int(fields[1])
+            if best is None or total < best:
+                best = total
+        self.assertGreater(best, 0)
+        self.assertLess(best, STARTUP_BUDGET_US)
+
+
+if __name__ == '__main__':
+    unittest.main()
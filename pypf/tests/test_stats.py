@@ -0,0 +1,99 @@
+"""Tests of the phase timings and counts collected by Stats."""
+import logging
+import random
+import unittest
+
+from pypf.chart import PFChart
+from pypf.stats import Stats
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+class StatsTestCase(DataTestCase):
+    """Record phases and counts, or nothing when disabled."""
+
+    def test_enabled(self):
+        """Phases must add up and counts be set or added to."""
+        stats = Stats(enabled=True)
+        for i in range(2):
+            with stats.phase('load'):
+                pass
+        with stats.phase('build'):
+            pass
+        stats.count('bars', 10)
+        stats.count('bars', 20)
+        stats.add('boxes', 3)
+        stats.add('boxes', 4)
+        self.assertEqual(['load', 'build'], list(stats.phases))
+        for wall, cpu in stats.phases.values():
+            self.assertGreaterEqual(wall, 0)
+            self.assertGreaterEqual(cpu, 0)
+        self.assertEqual({'bars': 20, 'boxes': 7}, dict(stats.counts))
+
+        stats.add_time('load', 1, .5)
+        wall, cpu = stats.phases['load']
+        self.assertGreaterEqual(wall, 1)
+        self.assertGreaterEqual(cpu, .5)
+        report = stats.report('TEST').split('\n')
+        self.assertEqual('TEST', report[0])
+        self.assertEqual(['phase', 'load', 'build', 'total', 'bars',
+                          'boxes'], [line.split()[0] for line in report[1:]])
+
+        stats.reset()
+        self.assertEqual({}, stats.phases)
+        self.assertEqual({}, stats.counts)
+
+    def test_disabled(self):
+        """Disabled stats must share one phase and record nothing."""
+        stats = Stats()
+        phase = stats.phase('load')
+        with phase:
+            pass
+        self.assertIs(phase, stats.phase('build'))
+        stats.count('bars', 10)
+        stats.add('boxes', 3)
+        self.assertEqual({}, stats.phases)
+        self.assertEqual({}, stats.counts)
+
+    def test_exception(self):
+        """A phase must be timed and the error raised when it fails."""
+        stats = Stats(enabled=True)
+        with self.assertRaises(KeyError):
+            with stats.phase('load'):
+                raise KeyError('bars')
+        self.assertEqual(['load'], list(stats.phases))
+
+    def test_logger(self):
+        """Each phase must be logged with its context and duration."""
+        logger = logging.getLogger('pypf.tests.stats')
+        stats = Stats(enabled=True, logger=logger)
+        stats.context['symbol'] = 'TEST'
+        with self.assertLogs(logger, logging.INFO) as logs:
+            with stats.phase('load'):
+                pass
+        record = logs.records[0]
+        self.assertEqual('TEST', record.symbol)
+        self.assertEqual('load', record.phase)
+        self.assertEqual(stats.phases['load'][0], record.duration)
+
+    def test_chart(self):
+        """A profiled chart must time each phase of create_chart."""
+        self._write_bars('TEST', generate_bars(random.Random(0), 100))
+        chart = PFChart(self._get_instrument('TEST'), profile=True)
+        chart.create_chart()
+        self.assertEqual(['initialize', 'set_historical_data',
+                          'set_price_fields', 'set_scale',
+                          'set_chart_data', 'get_chart'],
+                         list(chart.stats.phases))
+        self.assertEqual(chart.column_count, chart.stats.counts['columns'])
+        self.assertEqual(len(chart.chart),
+                         chart.stats.counts['chart_characters'])
+
+        chart = PFChart(self._get_instrument('TEST'))
+        chart.create_chart()
+        self.assertEqual({}, chart.stats.phases)
+        self.assertEqual({}, chart.stats.counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
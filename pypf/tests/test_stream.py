@@ -0,0 +1,126 @@
+"""Tests that streamed charts match the charts built from the same bars."""
+import asyncio
+import random
+import unittest
+
+from pypf import stream
+from pypf.chart import PFChart
+from pypf.stream import StreamingCharts
+from pypf.tests import DataTestCase
+from pypf.tests import generate_bars
+
+
+def _get_columns(scale, columns):
+    # Columns as box values and symbols, which do not depend on where
+    # the scale starts
+    return [[(scale[index], column.symbol(index))
+             for index in range(column.low, column.high + 1)]
+            for column in columns]
+
+
+class StreamingChartsTestCase(DataTestCase):
+    """Feed replays of cached data to StreamingCharts."""
+
+    def _get_populated(self, symbol, rnd):
+        instrument = self._get_instrument(symbol, generate_bars(rnd, 300))
+        instrument.populate_data()
+        return instrument
+
+    def _consume(self, charts, instruments):
+        async def feed():
+            # Interleave the replays as a live feed would
+            replays = [stream.replay(instrument)
+                       for instrument in instruments]
+            while replays:
+                for replay in list(replays):
+                    try:
+                        yield await replay.__anext__()
+                    except StopAsyncIteration:
+                        replays.remove(replay)
+
+        asyncio.run(charts.consume(feed()))
+
+    def test_batch(self):
+        """The streamed columns and signal must be the batch chart's."""
+        for seed in range(6):
+            rnd = random.Random(seed)
+            scale_mode = ['percent', 'point'][seed % 2]
+            if scale_mode == 'percent':
+                box_size = rnd.choice([.01, .02, .03])
+            else:
+                box_size = rnd.choice([.25, .5, 1])
+            reversal = rnd.choice([1, 2, 3])
+            instruments = [self._get_populated(symbol, rnd)
+                           for symbol in ['AAA', 'BBB']]
+            with self.subTest(seed=seed, scale_mode=scale_mode,
+                              box_size=box_size, reversal=reversal):
+                charts = StreamingCharts(box_size, reversal,
+                                         scale_mode=scale_mode)
+                self._consume(charts, instruments)
+                self.assertEqual(['AAA', 'BBB'], charts.symbols)
+                for instrument in instruments:
+                    chart = PFChart(instrument, box_size, duration=10,
+                                    reversal=reversal,
+                                    scale_mode=scale_mode)
+                    chart.create_chart()
+                    engine = charts.get_builder(instrument.symbol).engine
+                    # The chart drops a first column too short to
+                    # reverse from
+                    columns = engine.columns[len(engine.columns)
+                                             - len(chart.columns):]
+                    self.assertLessEqual(len(engine.columns)
+                                         - len(chart.columns), 1)
+                    self.assertEqual(_get_columns(chart.scale,
+                                                  chart.columns),
+                                     _get_columns(engine.scale, columns))
+                    last = next(reversed(chart.chart_meta_data))
+                    self.assertEqual(chart.chart_meta_data[last]['signal'],
+                                     engine.signal)
+
+    def test_events(self):
+        """Subscribers must be told of each box, reversal and signal."""
+        instruments = [self._get_populated(symbol, random.Random(7))
+                       for symbol in ['AAA', 'BBB']]
+        charts = StreamingCharts(.02, 3)
+        events = []
+        awaited = []
+
+        async def on_event(event):
+            awaited.append(event)
+
+        charts.subscribe(events.append)
+        charts.subscribe(on_event, symbols=['bbb'])
+        self._consume(charts, instruments)
+
+        self.assertEqual({'box', 'reversal', 'signal'},
+                         {event.kind for event in events})
+        self.assertEqual([event for event in events
+                          if event.symbol == 'BBB'], awaited)
+        for instrument in instruments:
+            symbol_events = [event for event in events
+                             if event.symbol == instrument.symbol]
+            engine = charts.get_builder(instrument.symbol).engine
+            reversals = [event for event in symbol_events
+                         if event.kind == 'reversal']
+            self.assertEqual(engine.column_index - 1, len(reversals))
+            self.assertEqual(list(range(2, engine.column_index + 1)),
+                             [event.column_index for event in reversals])
+            signals = [event for event in symbol_events
+                       if event.kind == 'signal']
+            self.assertEqual(engine.signal, signals[-1].signal)
+            # The boxes of each column add up to its length
+            for column_index, column in enumerate(engine.columns, 1):
+                boxes = sum(event.boxes for event in symbol_events
+                            if event.kind != 'signal'
+                            and event.column_index == column_index)
+                first = 1 if column_index == 1 else 0
+                self.assertEqual(len(column), boxes + first)
+
+        charts.unsubscribe(events.append)
+        count = len(events)
+        charts.update('AAA', '2100-01-04', 1000)
+        self.assertEqual(count, len(events))
+
+
+if __name__ == '__main__':
+    unittest.main()
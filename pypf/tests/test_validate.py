@@ -0,0 +1,140 @@
+"""Tests of the checks BarValidator makes on downloaded bars."""
+from decimal import Decimal
+
+import csv
+import os
+import unittest
+
+from pypf.validate import BarValidator
+from pypf.tests import DataTestCase
+from pypf.validate import QualityReport
+
+
+GOOD = [['2024-01-02', '10.00', '10.50', '9.50', '10.25', '1000'],
+        ['2024-01-03', '10.25', '10.75', '10.00', '10.50', '1200'],
+        ['2024-01-04', '10.50', '11.00', '10.25', '10.75', '900.0']]
+
+
+class BarValidatorTestCase(DataTestCase):
+    """Check each rule of BarValidator.validate."""
+
+    def _validate(self, rows, previous=None, **options):
+        report = QualityReport('TEST')
+        kept = list(BarValidator(**options).validate(rows, report, previous))
+        return kept, report
+
+    def _assert_quarantined(self, row, reason, previous=None):
+        kept, report = self._validate(GOOD[:2] + [row], previous)
+        self.assertEqual(GOOD[:2], kept)
+        self.assertEqual({reason: 1}, dict(report.issues))
+        self.assertEqual([(reason, row)], report.quarantine)
+        self.assertEqual(3, report.bars)
+
+    def test_clean(self):
+        """Good bars must all be kept with nothing reported."""
+        kept, report = self._validate(GOOD)
+        self.assertEqual(GOOD, kept)
+        self.assertTrue(report.clean)
+        self.assertEqual('TEST: 3 bars, clean', report.summary())
+
+    def test_missing_field(self):
+        """A bar without every field must be quarantined."""
+        self._assert_quarantined(['2024-01-04', '10.50', '11.00'],
+                                 'missing value')
+
+    def test_not_a_number(self):
+        """A price or volume that is not a number must be quarantined."""
+        self._assert_quarantined(['2024-01-04', 'null', '11.00', '10.25',
+                                  '10.75', '900'], 'missing value')
+        self._assert_quarantined(['2024-01-04', '10.50', '11.00', '10.25',
+                                  '10.75', ''], 'missing value')
+        self._assert_quarantined(['2024-01-04', '10.50', 'NaN', '10.25',
+                                  '10.75', '900'], 'missing value')
+        self._assert_quarantined(['2024-01-04', '10.50', '11.00', '10.25',
+                                  '10.75', 'inf'], 'missing value')
+
+    def test_bad_date(self):
+        """A date that can not be parsed must be quarantined."""
+        self._assert_quarantined(['04-Jan-24', '10.50', '11.00', '10.25',
+                                  '10.75', '900'], 'missing value')
+
+    def test_duplicate_date(self):
+        """A second bar for a date must be quarantined."""
+        self._assert_quarantined(['2024-01-03'] + GOOD[2][1:],
+                                 'duplicate date')
+
+    def test_out_of_order(self):
+        """A bar dated before the previous bar must be quarantined."""
+        self._assert_quarantined(['2024-01-01'] + GOOD[2][1:],
+                                 'out of order')
+
+    def test_non_positive_price(self):
+        """A price of zero or less must be quarantined."""
+        self._assert_quarantined(['2024-01-04', '10.50', '11.00', '0',
+                                  '10.75', '900'], 'non-positive price')
+        self._assert_quarantined(['2024-01-04', '-1', '11.00', '10.25',
+                                  '10.75', '900'], 'non-positive price')
+
+    def test_high_below_low(self):
+        """A high below the low must be quarantined."""
+        self._assert_quarantined(['2024-01-04', '10.50', '10.00', '10.25',
+                                  '10.75', '900'], 'high below low')
+
+    def test_outlier(self):
+        """A large jump in the close must be reported but kept."""
+        row = ['2024-01-04', '10.50', '20.00', '10.25', '19.00', '900']
+        kept, report = self._validate(GOOD[:2] + [row])
+        self.assertEqual(GOOD[:2] + [row], kept)
+        self.assertEqual({'outlier': 1}, dict(report.issues))
+        self.assertEqual(['2024-01-04'], report.outliers)
+        self.assertEqual([], report.quarantine)
+
+        kept, report = self._validate(GOOD[:2] + [row], max_jump=1)
+        self.assertTrue(report.clean)
+
+    def test_gap(self):
+        """A long gap between bars must be reported but kept."""
+        row = ['2024-01-15'] + GOOD[2][1:]
+        kept, report = self._validate(GOOD[:2] + [row])
+        self.assertEqual(GOOD[:2] + [row], kept)
+        self.assertEqual({'gap': 1}, dict(report.issues))
+        self.assertEqual([('2024-01-03', '2024-01-15')], report.gaps)
+
+        kept, report = self._validate(GOOD[:2] + [row], max_gap_days=14)
+        self.assertTrue(report.clean)
+
+    def test_previous(self):
+        """Appended bars must be checked against the last cached bar."""
+        kept, report = self._validate(GOOD[2:],
+                                      ('2024-01-04', Decimal('10.50')))
+        self.assertEqual([], kept)
+        self.assertEqual({'duplicate date': 1}, dict(report.issues))
+
+        kept, report = self._validate(GOOD[2:],
+                                      ('2024-01-03', Decimal('5.00')))
+        self.assertEqual(GOOD[2:], kept)
+        self.assertEqual(['2024-01-04'], report.outliers)
+
+    def test_quarantine_continues(self):
+        """Bars after a quarantined bar must follow the last good bar."""
+        bad = ['2024-01-03', '10.25', '10.75', '10.00', '0', '1200']
+        kept, report = self._validate([GOOD[0], bad, GOOD[1], GOOD[2]])
+        self.assertEqual(GOOD, kept)
+        self.assertEqual('TEST: 4 bars, 1 quarantined, '
+                         'non-positive price 1', report.summary())
+
+    def test_write_quarantine(self):
+        """Quarantined rows must be written with their reasons."""
+        bad = ['2024-01-03', '10.25', '10.00', '10.75', '10.50', '1200']
+        kept, report = self._validate([GOOD[0], bad])
+        path = os.path.join(self.directory, 'TEST_quarantine.csv')
+        report.write_quarantine(path)
+        with open(path, newline='') as csvfile:
+            rows = list(csv.reader(csvfile))
+        self.assertEqual([['Reason', 'Date', 'Open', 'High', 'Low', 'Close',
+                           'Volume'],
+                          ['high below low'] + bad], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Classes to check downloaded bars before they are cached.
+
+BarValidator sits between a download and the csv file it is written to.
+Rows pass through it one at a time; bars that can not be charted are
+quarantined rather than written, and every problem is counted in a
+QualityReport so a batch of symbols never stops for one bad bar.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+from decimal import InvalidOperation
+
+import csv
+import datetime
+
+
+class QualityReport(object):
+    """The problems found in one symbol's bars."""
+
+    def __init__(self, symbol):
+        """Initialize an empty report."""
+        self.symbol = symbol
+        self.bars = 0
+        self.issues = OrderedDict()
+        self.quarantine = []
+        self.gaps = []
+        self.outliers = []
+
+    @property
+    def clean(self):
+        """Return True if no problems were found."""
+        return len(self.issues) == 0
+
+    def add_issue(self, issue):
+        """Count an issue."""
+        self.issues[issue] = self.issues.get(issue, 0) + 1
+
+    def summary(self):
+        """Return the report as a one line string."""
+        if self.clean:
+            return '%s: %d bars, clean' % (self.symbol, self.bars)
+        issues = ', '.join('%s %d' % (issue, count)
+                           for issue, count in self.issues.items())
+        return '%s: %d bars, %d quarantined, %s' % (
+            self.symbol, self.bars, len(self.quarantine), issues)
+
+    def as_dict(self):
+        """Return the report as a dict."""
+        return OrderedDict([('symbol', self.symbol),
+                            ('bars', self.bars),
+                            ('issues', dict(self.issues)),
+                            ('quarantined', len(self.quarantine)),
+                            ('gaps', self.gaps),
+                            ('outliers', self.outliers)])
+
+    def write_quarantine(self, path):
+        """Write the quarantined rows and the reason for each to path."""
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Reason', 'Date', 'Open', 'High', 'Low',
+                             'Close', 'Volume'])
+            for reason, fields in self.quarantine:
+                writer.writerow([reason] + list(fields))
+
+
+class BarValidator(object):
+    """Check bars of Date,Open,High,Low,Close,Volume fields in date order.
+
+    A bar is quarantined if a field is missing or not a number, its date
+    is not after the previous bar's, a price is not positive or its
+    high is below its low. A close that moves more than max_jump (a
+    fraction) from the previous close is reported as an outlier but
+    kept, since real prices do that too; so is a gap of more than
+    max_gap_days calendar days between bars.
+    """
+
+    ISSUES = ['missing value', 'duplicate date', 'out of order',
+              'non-positive price', 'high below low', 'outlier', 'gap']
+
+    def __init__(self, max_jump=0.5, max_gap_days=5):
+        """Initialize the validator."""
+        self.max_jump = Decimal(str(max_jump))
+        self.max_gap_days = max_gap_days
+
+    def validate(self, rows, report, previous=None):
+        """Yield the good rows, recording every problem in report.
+
+        rows is an iterable of field lists. previous is the (date,
+        close) of the last cached bar when rows are appended to existing
+        data.
+        """
+        last_date = None
+        last_close = None
+        last_day = None
+        if previous is not None:
+            last_date, last_close = previous
+            last_day = self._get_day(last_date)
+
+        for fields in rows:
+            report.bars += 1
+            reason = None
+            try:
+                date = fields[0]
+                day = self._get_day(date)
+                prices = [Decimal(field) for field in fields[1:5]]
+                int(float(fields[5]))
+                if not all(price.is_finite() for price in prices):
+                    raise ValueError(date)
+            except (IndexError, ValueError, OverflowError,
+                    InvalidOperation):
+                reason = 'missing value'
+            else:
+                if last_date is not None and date == last_date:
+                    reason = 'duplicate date'
+                elif last_date is not None and date < last_date:
+                    reason = 'out of order'
+                elif min(prices) <= 0:
+                    reason = 'non-positive price'
+                elif prices[1] < prices[2]:
+                    reason = 'high below low'
+
+            if reason is not None:
+                report.add_issue(reason)
+                report.quarantine.append((reason, fields))
+                continue
+
+            close = prices[3]
+            if last_close is not None:
+                if abs(close / last_close - 1) > self.max_jump:
+                    report.add_issue('outlier')
+                    report.outliers.append(date)
+            if last_day is not None:
+                if (day - last_day).days > self.max_gap_days:
+                    report.add_issue('gap')
+                    report.gaps.append((last_date, date))
+            last_date = date
+            last_close = close
+            last_day = day
+            yield fields
+
+    def _get_day(self, date):
+        return datetime.datetime.strptime(date[:10], '%Y-%m-%d').date()
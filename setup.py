@@ -16,7 +16,7 @@ setup(name='pypf',
       classifiers=[
                   'Development Status :: 4 - Beta',
                   'License :: OSI Approved :: MIT License',
-                  'Programming Language :: Python :: 3.6',
+                  'Programming Language :: Python :: 3.7',
                   'Topic :: Office/Business :: Financial :: Investment',
       ],
       keywords='point figure stock chart',
@@ -25,6 +25,7 @@ setup(name='pypf',
       author_email='pviglucci@gmail.com',
       license='MIT License',
       packages=['pypf'],
+      python_requires='>=3.7',
       install_requires=['requests', ],
       scripts=['pf.py'],
       include_package_data=True,